@@ -5,488 +5,229 @@ Genera VIDEO VERI animati usando Veo 2 da Vertex AI
 IMPORTANTE: Questa versione usa Veo 2 per generare video animati reali!
 """
 
-import os
-import json
+from __future__ import annotations
+
 import time
+import threading
+from contextlib import nullcontext
 from pathlib import Path
 from typing import List, Dict, Optional
-import tempfile
 
 import streamlit as st
-from PIL import Image
-import numpy as np
-
-# Google AI
-import google.generativeai as genai
 
-# Vertex AI per Veo 2
-try:
-    from google.cloud import aiplatform
-    from google.cloud.aiplatform import gapic
-    VERTEX_AVAILABLE = True
-except ImportError:
-    VERTEX_AVAILABLE = False
-    st.warning("⚠️ google-cloud-aiplatform non installato. Aggiungi a requirements.txt")
+from photo_video.config import (
+    GCP_PROJECT_ID, GEMINI_API_KEY, JOBS_DB_PATH, JOB_POLL_SECONDS, MAX_PHOTOS, MEDIA_PUBLIC_URL,
+    METRICS_PORT, MIN_PHOTOS, OUTPUT_FOLDER, PREVIEW_PAGE_SIZE, STORY_CHUNK_SIZE, STYLE_PRESETS,
+    TEMP_FOLDER, UPLOAD_FOLDER, WARM_UP_CLIENTS,
+)
+from photo_video.telemetry import PipelineEvents, set_default_events, start_metrics_server
+from photo_video.backends import (
+    CLIENTS, VEO_LATENCY, resilience_metrics, setup_gemini_api, setup_vertex_ai,
+)
+from photo_video.storage import STORAGE, run_folder, run_scope, save_uploaded_file
+from photo_video.photos import ImageStore, get_image_store, select_photos
+from photo_video.story import selection_savings, story_chapters
+from photo_video.jobs import JobRunner, JobStore
+from photo_video.media_server import MediaServer, media_server_port
 
 # ============================================================================
-# CONFIGURAZIONE
+# EVENTI NELLA PAGINA: StreamlitEvents, sink di default della pipeline
 # ============================================================================
 
-# API Keys
-try:
-    GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
-    GCP_PROJECT_ID = st.secrets.get("GCP_PROJECT_ID", "")
-    GCP_LOCATION = st.secrets.get("GCP_LOCATION", "us-central1")
-except:
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-    GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID', '')
-    GCP_LOCATION = os.getenv('GCP_LOCATION', 'us-central1')
-
-# Folders
-UPLOAD_FOLDER = Path(tempfile.gettempdir()) / "photo_video_uploads"
-OUTPUT_FOLDER = Path(tempfile.gettempdir()) / "photo_video_outputs"
-TEMP_FOLDER = Path(tempfile.gettempdir()) / "photo_video_temp"
-
-for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_FOLDER]:
-    folder.mkdir(exist_ok=True, parents=True)
-
-# Video settings
-MIN_PHOTOS = 3
-MAX_PHOTOS = 8  # Veo 2 può usare più foto per storia più ricca
-CLIP_DURATION = 5  # Veo 2 genera 5 secondi
-VIDEO_FPS = 24
-
-STYLE_PRESETS = {
-    "Cinematic Adventure": "Epic cinematic adventure with dramatic camera movements and heroic atmosphere",
-    "Dreamy Memories": "Soft dreamy memories with gentle movements and nostalgic warm atmosphere",
-    "Urban Journey": "Modern urban exploration with dynamic street energy and city vibes",
-    "Nature Documentary": "Natural documentary style with serene landscapes and organic flow",
-    "Artistic Story": "Creative artistic narrative with bold experimental visual storytelling"
-}
-
-# ============================================================================
-# SETUP APIs
-# ============================================================================
-
-def setup_gemini_api():
-    """Setup Gemini per storyboarding."""
-    if not GEMINI_API_KEY:
-        st.error("❌ GEMINI_API_KEY mancante!")
-        return False
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        return True
-    except Exception as e:
-        st.error(f"❌ Gemini error: {e}")
-        return False
-
-def setup_vertex_ai():
-    """Setup Vertex AI per Veo 2."""
-    if not GCP_PROJECT_ID:
-        st.error("❌ GCP_PROJECT_ID mancante! Serve per Veo 2")
-        st.info("Aggiungi a secrets.toml: GCP_PROJECT_ID = 'your-project-id'")
-        return False
-
-    if not VERTEX_AVAILABLE:
-        st.error("❌ google-cloud-aiplatform non installato")
-        return False
-
-    try:
-        aiplatform.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
-        st.success(f"✅ Vertex AI setup: {GCP_PROJECT_ID} @ {GCP_LOCATION}")
-        return True
-    except Exception as e:
-        st.error(f"❌ Vertex AI error: {e}")
-        return False
-
-def save_uploaded_file(uploaded_file, save_path: Path) -> bool:
-    """Salva file uploadato."""
-    try:
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return True
-    except Exception as e:
-        st.error(f"❌ Error: {e}")
-        return False
+class StreamlitEvents(PipelineEvents):
+    """Eventi disegnati nella pagina Streamlit (un'istanza per run della pipeline)."""
+
+    def __init__(self):
+        self._progress = None
+        self._story_header = None
+        self._scenes_box = None
+        self._preview = None
+
+    def message(self, level: str, text: str) -> None:
+        getattr(st, level)(text)
+
+    def busy(self, text: str):
+        return st.spinner(text)
+
+    def stage(self, key: str, title: str) -> None:
+        st.header(title)
+        if key == "story":
+            # Titolo e tema sopra le scene, anche se arrivano dopo (streaming)
+            self._story_header = st.container()
+
+    def progress(self, fraction: float) -> None:
+        if self._progress is None:
+            self._progress = st.progress(0)
+        self._progress.progress(fraction)
+
+    def story_ready(self, story: Dict) -> None:
+        with self._story_header or nullcontext():
+            st.subheader(f"🎬 {story.get('title', 'Untitled')}")
+            st.write(f"**Tema:** {story.get('story_summary', '')}")
+            st.write(f"**Arco narrativo:** {story.get('narrative_arc', 'journey')}")
+
+    def scene_planned(self, index: int, scene: Dict) -> None:
+        if self._scenes_box is None:
+            with self._story_header or nullcontext():
+                self._scenes_box = st.expander("📋 Scene Dettagliate", expanded=True)
+        self._scenes_box.markdown(scene_markdown(index, scene))
+
+    def preview_clip(self, clip: Path) -> None:
+        if self._preview is None:
+            self._preview = st.expander("▶️ Anteprima: scene pronte", expanded=True)
+        show_video(clip, self._preview)
+
+def scene_markdown(i: int, scene: Dict) -> str:
+    return f"""
+**Scena {i+1}: {scene.get('scene_title', 'Untitled')}**
 
-# ============================================================================
-# STEP 1: STORIA con Gemini (descrizione narrativa lunga)
-# ============================================================================
+📝 **Descrizione:** {scene.get('description', 'N/A')}
 
-def create_story_from_photos(photo_paths: List[Path], style: str) -> Dict:
-    """
-    Usa Gemini per creare una STORIA NARRATIVA dalle foto.
+🎥 **Camera:** {scene.get('camera_movement', 'N/A')}
 
-    Non solo storyboard tecnico, ma vera storia con:
-    - Descrizione dettagliata di ogni scena
-    - Connessioni narrative tra le foto
-    - Prompts ricchi per Veo 2
-    """
-    try:
-        st.info("📖 Gemini sta creando la tua storia...")
-
-        model = genai.GenerativeModel('gemini-2.5-pro')
-
-        prompt = f"""Sei uno storyteller cinematografico. Analizza queste {len(photo_paths)} foto e crea una STORIA NARRATIVA coinvolgente.
-
-Stile: {style}
-Descrizione stile: {STYLE_PRESETS.get(style, style)}
-
-Per ogni foto, crea:
-1. **Descrizione scena dettagliata** (3-4 frasi): Cosa succede, atmosfera, emozioni
-2. **Video prompt ricco** per AI video generation: Descrivi movimenti camera, azione, dettagli visivi
-3. **Connessione narrativa** con scena precedente/successiva
-
-Crea una storia che LEGA tutte le foto in un video continuo e fluido.
-
-Return ONLY valid JSON:
-{{
-    "title": "Titolo creativo del video",
-    "story_summary": "Riassunto storia completa in 2-3 frasi",
-    "narrative_arc": "Tipo di arco narrativo (e.g., 'journey', 'transformation', 'discovery')",
-    "scenes": [
-        {{
-            "photo_index": 0,
-            "scene_title": "Titolo scena",
-            "description": "Descrizione dettagliata cosa succede in questa scena (3-4 frasi)",
-            "veo_prompt": "Prompt DETTAGLIATO per Veo 2 video generation - include: azione, movimento camera, atmosfera, dettagli visivi, stile cinematografico. Min 20 parole.",
-            "camera_movement": "Tipo movimento (dolly, pan, tilt, zoom, orbit)",
-            "duration": {CLIP_DURATION},
-            "transition_to_next": "Come questa scena si collega alla prossima"
-        }}
-    ],
-    "final_message": "Messaggio/emozione finale del video"
-}}
-
-IMPORTANTE:
-- Veo prompts devono essere MOLTO DETTAGLIATI (20+ parole)
-- Includi sempre: movimento camera, azione, atmosfera
-- Usa linguaggio cinematografico
-"""
+🔗 **Transizione:** {scene.get('transition_to_next', 'N/A')}
+                """
 
-        # Carica foto per Gemini
-        images = []
-        for photo_path in photo_paths:
-            img = Image.open(photo_path)
-            img.thumbnail((1024, 1024))
-            images.append(img)
-
-        # Chiamata Gemini
-        with st.spinner("🤖 Gemini sta analizzando le foto e creando la storia..."):
-            response = model.generate_content([prompt] + images)
-
-        response_text = response.text
-
-        # Parse JSON
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
-
-        story = json.loads(response_text.strip())
-
-        st.success(f"✅ Storia creata: '{story.get('title', 'Untitled')}'")
-
-        return story
-
-    except json.JSONDecodeError as e:
-        st.error(f"❌ JSON parse error: {e}")
-        st.code(response_text[:500])
-        return create_fallback_story(photo_paths, style)
-    except Exception as e:
-        st.error(f"❌ Story generation error: {e}")
-        return create_fallback_story(photo_paths, style)
-
-def create_fallback_story(photo_paths: List[Path], style: str) -> Dict:
-    """Fallback story se Gemini fallisce."""
-    scenes = []
-
-    for i, photo_path in enumerate(photo_paths):
-        scenes.append({
-            "photo_index": i,
-            "scene_title": f"Scene {i+1}",
-            "description": f"A {style.lower()} scene captured in this moment",
-            "veo_prompt": f"Cinematic {style.lower()} scene with smooth camera movement, professional cinematography, high quality, dramatic lighting",
-            "camera_movement": "dolly forward",
-            "duration": CLIP_DURATION,
-            "transition_to_next": "Flows naturally into next scene"
-        })
-
-    return {
-        "title": f"My {style} Story",
-        "story_summary": f"A {style.lower()} journey through captured moments",
-        "narrative_arc": "journey",
-        "scenes": scenes,
-        "final_message": "A memorable journey"
-    }
+set_default_events(StreamlitEvents)
 
 # ============================================================================
-# STEP 2: VIDEO GENERATION con Veo 2
+# STREAMLIT UI
 # ============================================================================
 
-def generate_video_with_veo2(photo_path: Path, scene: Dict, style: str) -> Optional[Path]:
-    """
-    Genera VIDEO ANIMATO usando Veo 2 da Vertex AI.
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Runner unico per processo (condiviso da tutte le sessioni)."""
+    runner = JobRunner(JobStore(JOBS_DB_PATH))
+    runner.resume_pending()
+    return runner
 
-    Veo 2 genera video veri con movimento, non foto statiche!
-
-    Args:
-        photo_path: Foto di riferimento
-        scene: Dati scena con veo_prompt
-        style: Stile video
-
-    Returns:
-        Path al video generato (MP4)
+@st.cache_resource
+def start_media_server() -> Optional[MediaServer]:
     """
+    Media server (uno per processo, condiviso dalle sessioni) se configurato
+    con MEDIA_SERVER_PORT o MEDIA_PUBLIC_URL; None se spento o se la porta
+    non si apre (→ st.video dal path).
+    """
+    roots = {"out": OUTPUT_FOLDER, "tmp": TEMP_FOLDER}
     try:
-        st.info(f"🎥 Veo 2 sta generando video per: {scene['scene_title']}")
-
-        # Prepara prompt per Veo 2
-        veo_prompt = scene.get('veo_prompt', scene.get('description', ''))
-
-        # Arricchisci prompt con stile
-        full_prompt = f"{veo_prompt}. Style: {STYLE_PRESETS.get(style, style)}. Cinematic quality, smooth motion, {scene.get('camera_movement', 'slow movement')}"
-
-        st.write(f"📝 Prompt Veo: {full_prompt[:100]}...")
-
-        # Carica immagine di riferimento
-        with open(photo_path, "rb") as f:
-            image_bytes = f.read()
-
-        # CHIAMA VEO 2 API via Vertex AI
-        # Documentazione: https://cloud.google.com/vertex-ai/docs/generative-ai/video/generate-videos
-
-        client = aiplatform.gapic.PredictionServiceClient(
-            client_options={"api_endpoint": f"{GCP_LOCATION}-aiplatform.googleapis.com"}
-        )
-
-        # Endpoint Veo 2
-        endpoint = f"projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/publishers/google/models/veo-2"
-
-        # Prepara richiesta
-        import base64
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-
-        instances = [{
-            "prompt": full_prompt,
-            "reference_image": {
-                "bytesBase64Encoded": image_b64
-            },
-            "parameters": {
-                "duration": f"{CLIP_DURATION}s",
-                "aspectRatio": "16:9",
-                "fps": VIDEO_FPS
-            }
-        }]
-
-        # Esegui predizione
-        with st.spinner(f"⏳ Veo 2 sta generando video... (~30-60s)"):
-            response = client.predict(
-                endpoint=endpoint,
-                instances=instances
-            )
-
-        # Estrai video generato
-        if response.predictions:
-            prediction = response.predictions[0]
-
-            # Veo ritorna video in base64
-            video_b64 = prediction.get('videoBase64', '')
-            if video_b64:
-                video_bytes = base64.b64decode(video_b64)
-
-                # Salva video
-                output_path = TEMP_FOLDER / f"veo_clip_{int(time.time())}_{scene['photo_index']}.mp4"
-                with open(output_path, "wb") as f:
-                    f.write(video_bytes)
-
-                st.success(f"✅ Video generato: {output_path.name} ({len(video_bytes) / 1024 / 1024:.1f} MB)")
-                return output_path
-            else:
-                st.error("❌ Veo non ha ritornato video")
-                return None
-        else:
-            st.error("❌ Nessuna prediction da Veo")
-            return None
-
-    except Exception as e:
-        st.error(f"❌ Veo 2 generation failed: {e}")
-        st.info("💡 Possibili cause: Quota API, Veo non abilitato, credenziali errate")
-
-        # Fallback: crea clip semplice con FFmpeg
-        return create_simple_clip_ffmpeg(photo_path, scene)
-
-def create_simple_clip_ffmpeg(photo_path: Path, scene: Dict) -> Optional[Path]:
-    """Fallback: clip semplice con FFmpeg se Veo fallisce."""
-    try:
-        import subprocess
-
-        st.warning("⚠️ Usando FFmpeg fallback (foto statica)")
-
-        output_path = TEMP_FOLDER / f"clip_{int(time.time())}_{scene['photo_index']}.mp4"
-
-        # FFmpeg: foto → video con zoom
-        cmd = [
-            'ffmpeg', '-y',
-            '-loop', '1',
-            '-i', str(photo_path),
-            '-vf', f'scale=1280:720,zoompan=z=\'min(zoom+0.0015,1.5)\':d={CLIP_DURATION * VIDEO_FPS}:s=1280x720',
-            '-t', str(scene['duration']),
-            '-c:v', 'libx264',
-            '-pix_fmt', 'yuv420p',
-            '-r', str(VIDEO_FPS),
-            str(output_path)
-        ]
-
-        subprocess.run(cmd, capture_output=True, check=True, timeout=60)
-
-        if output_path.exists():
-            return output_path
-        return None
-
-    except Exception as e:
-        st.error(f"❌ FFmpeg fallback failed: {e}")
-        return None
-
-# ============================================================================
-# STEP 3: MERGE VIDEO
-# ============================================================================
-
-def merge_videos_ffmpeg(video_paths: List[Path], story: Dict) -> Optional[Path]:
-    """Merge tutti i clip in video continuo."""
-    try:
-        import subprocess
-
-        st.info("🎬 Merging video clips in video continuo...")
-
-        # Filtra clip validi
-        valid_clips = [p for p in video_paths if p and p.exists()]
-
-        if not valid_clips:
-            st.error("❌ Nessun clip da mergare")
+        port = media_server_port()
+        if port is None:
             return None
-
-        # Crea concat list
-        concat_file = TEMP_FOLDER / "concat.txt"
-        with open(concat_file, "w") as f:
-            for clip in valid_clips:
-                f.write(f"file '{clip.absolute()}'\n")
-
-        # Output
-        title_safe = story.get('title', 'video').replace(' ', '_')[:30]
-        output_path = OUTPUT_FOLDER / f"{title_safe}_{int(time.time())}.mp4"
-
-        # Merge con crossfade
-        cmd = [
-            'ffmpeg', '-y',
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', str(concat_file),
-            '-c', 'copy',
-            str(output_path)
-        ]
-
-        with st.spinner("⏳ Merging... (~30s)"):
-            subprocess.run(cmd, capture_output=True, check=True, timeout=120)
-
-        if output_path.exists():
-            file_size = output_path.stat().st_size / 1024 / 1024
-            st.success(f"✅ Video finale: {output_path.name} ({file_size:.1f} MB)")
-            return output_path
-
+        return MediaServer(roots, port, public_url=MEDIA_PUBLIC_URL).start()
+    except (OSError, ValueError) as e:
+        st.warning(f"⚠️ Media server non avviato ({e}): video serviti da Streamlit")
         return None
 
-    except Exception as e:
-        st.error(f"❌ Merge failed: {e}")
-        return None
-
-# ============================================================================
-# MAIN PIPELINE
-# ============================================================================
-
-def process_photos_to_video(photo_paths: List[Path], style: str) -> Optional[Path]:
-    """Pipeline completa."""
-    try:
-        progress = st.progress(0)
-
-        # Step 1: Storia
-        st.header("📖 Step 1: Creazione Storia")
-        progress.progress(0.1)
-
-        story = create_story_from_photos(photo_paths, style)
-
-        if not story or 'scenes' not in story:
-            st.error("❌ Storia fallita")
-            return None
-
-        # Mostra storia
-        st.subheader(f"🎬 {story['title']}")
+def show_video(path: Path, target=None) -> None:
+    """Player per riferimento (URL del media server); senza server, st.video dal path."""
+    media = start_media_server()
+    url = media.url_for(path) if media else None
+    (target or st).video(url or str(path))
+
+def select_uploads(image_store: ImageStore, upload_hashes: List[str]) -> Dict:
+    """select_photos sulle preview degli upload, ricalcolata solo quando gli upload cambiano."""
+    key = tuple(upload_hashes)
+    cached = st.session_state.get("upload_selection")
+    if cached and cached[0] == key:
+        return cached[1]
+
+    selection = select_photos(len(upload_hashes), lambda i: image_store.get(upload_hashes[i], "preview"), MAX_PHOTOS)
+    st.session_state["upload_selection"] = (key, selection)
+    return selection
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Endpoint Prometheus su METRICS_PORT (una volta per processo)."""
+    return start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+@st.cache_resource
+def start_storage_sweeper() -> threading.Thread:
+    """Pulizia periodica di upload/temp/output (una volta per processo)."""
+    return STORAGE.start_sweeper()
+
+@st.cache_resource
+def start_client_warm_up() -> threading.Thread:
+    thread = threading.Thread(target=CLIENTS.warm_up, name="client-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def render_job_status(runner: JobRunner, job_id: str) -> None:
+    """Stato di un job: scene pronte, progresso e video finale (polling)."""
+    job = runner.store.get_job(job_id)
+    if job is None:
+        st.error("❌ Job non trovato")
+        return
+
+    st.header("🎬 Il Tuo Video")
+
+    story = job['story']
+    if story:
+        st.subheader(f"🎬 {story.get('title', 'Untitled')}")
         st.write(f"**Tema:** {story.get('story_summary', '')}")
-        st.write(f"**Arco narrativo:** {story.get('narrative_arc', 'journey')}")
 
-        with st.expander("📋 Scene Dettagliate", expanded=True):
-            for i, scene in enumerate(story['scenes']):
-                st.markdown(f"""
-**Scena {i+1}: {scene.get('scene_title', 'Untitled')}**
-
-📝 **Descrizione:** {scene.get('description', 'N/A')}
-
-🎥 **Camera:** {scene.get('camera_movement', 'N/A')}
-
-🔗 **Transizione:** {scene.get('transition_to_next', 'N/A')}
-                """)
-
-        progress.progress(0.3)
-
-        # Step 2: Video generation
-        st.header("🎥 Step 2: Generazione Video con Veo 2")
-
-        generated_videos = []
-
-        for i, scene in enumerate(story['scenes']):
-            photo_idx = scene.get('photo_index', i)
-
-            if photo_idx >= len(photo_paths):
-                photo_idx = i % len(photo_paths)
-
-            photo_path = photo_paths[photo_idx]
-
-            st.write(f"🎬 Generando scena {i+1}/{len(story['scenes'])}: {scene['scene_title']}")
-
-            video_path = generate_video_with_veo2(photo_path, scene, style)
-
-            if video_path:
-                generated_videos.append(video_path)
-                st.success(f"✅ Scena {i+1} completata")
-            else:
-                st.warning(f"⚠️ Scena {i+1} fallita - continuo")
-
-            progress.progress(0.3 + (0.5 * (i+1) / len(story['scenes'])))
-
-        if not generated_videos:
-            st.error("❌ Nessun video generato")
-            return None
-
-        progress.progress(0.8)
-
-        # Step 3: Merge
-        st.header("🎬 Step 3: Creazione Video Finale")
-
-        final_video = merge_videos_ffmpeg(generated_videos, story)
-
-        progress.progress(1.0)
-
-        return final_video
-
-    except Exception as e:
-        st.error(f"❌ Pipeline error: {e}")
-        import traceback
-        st.code(traceback.format_exc())
-        return None
+    scenes = job['scenes']
+    finished = [s for s in scenes if s['status'] in ('done', 'failed')]
+    if scenes:
+        # Storyboard in streaming: storia non ancora salvata, una scena per foto attesa
+        total = len(story['scenes']) if story else max(len(scenes), len(job['photo_paths']))
+        st.progress(min(1.0, len(finished) / total), text=f"Scene: {len(finished)}/{total}")
+
+        # Scene già pronte: riproducibili subito. Il polling ridisegna la pagina ogni
+        # JOB_POLL_SECONDS: senza media server ogni st.video ricopia il file nella
+        # sessione, quindi durante la generazione si mostra solo l'ultima scena pronta
+        polling = job['status'] in ('queued', 'running')
+        by_reference = start_media_server() is not None
+        ready = [s for s in scenes if s['status'] == 'done' and s['clip_path'] and Path(s['clip_path']).exists()]
+        with st.expander("▶️ Scene pronte", expanded=job['status'] != 'done'):
+            for scene in scenes:
+                if scene in ready and (by_reference or not polling or scene is ready[-1]):
+                    show_video(Path(scene['clip_path']))
+                elif scene in ready:
+                    st.caption(f"✅ Scena {scene['idx']+1} pronta")
+                elif scene['status'] == 'failed':
+                    st.warning(f"⚠️ Scena {scene['idx']+1} fallita")
+
+    if job['status'] in ('queued', 'running'):
+        st.info("⏳ Generazione in corso (puoi chiudere la pagina e tornare con lo stesso link)")
+        if st.button("🛑 Annulla generazione"):
+            runner.cancel(job_id)
+            st.rerun()
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+    if job['status'] == 'cancelled':
+        st.warning("🛑 Generazione annullata")
+        return
+
+    final_video = Path(job['output_path']) if job['output_path'] else None
+
+    # Result
+    if job['status'] == 'done' and final_video and not final_video.exists():
+        st.warning("🧹 Video non più disponibile: rimosso dalla pulizia del disco (TTL/quota)")
+        return
+
+    if job['status'] == 'done' and final_video and final_video.exists():
+        st.success("🎉 VIDEO PRONTO!")
+
+        # Player e download per riferimento: il file non passa mai in memoria
+        media = start_media_server()
+        download_url = media.url_for(final_video, download=True) if media else None
+        show_video(final_video)
+
+        if download_url:
+            st.link_button("📥 Scarica MP4", download_url, use_container_width=True)
+        else:
+            # Senza media server: file letto solo al click, non a ogni rerun
+            st.download_button(
+                label="📥 Scarica MP4",
+                data=final_video.read_bytes,
+                file_name=final_video.name,
+                mime="video/mp4",
+                use_container_width=True
+            )
 
-# ============================================================================
-# STREAMLIT UI
-# ============================================================================
+    else:
+        st.error(f"❌ Generazione fallita - controlla setup Veo 2 ({job['error'] or 'errore sconosciuto'})")
 
 def main():
     st.set_page_config(
@@ -525,11 +266,40 @@ def main():
         else:
             st.error("❌ GCP project mancante")
 
+        st.header("🛡️ Resilienza API")
+        for name, metrics in resilience_metrics().items():
+            icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[metrics['breaker_state']]
+            st.caption(
+                f"{icon} **{name}**: {metrics['breaker_state']} · {metrics['calls']} chiamate · "
+                f"{metrics['retries']} retry · {metrics['throttled']} throttled · "
+                f"{metrics['breaker_trips']} trip"
+            )
+
+        if STORAGE.usage:
+            st.caption("💾 Disco: " + " · ".join(
+                f"{name} {usage['bytes'] / 1024 ** 3:.1f}/{usage['quota'] / 1024 ** 3:.0f} GB"
+                for name, usage in STORAGE.usage.items()
+            ))
+
+        latency = VEO_LATENCY.stats()
+        if latency['samples']:
+            st.caption(
+                f"⏱️ Latenza Veo: p50 {latency['p50']:.0f}s · p90 {latency['p90']:.0f}s "
+                f"({latency['samples']} campioni)"
+            )
+
     # Setup
     if not setup_gemini_api():
         st.stop()
 
-    if not setup_vertex_ai():
+    vertex_ready = setup_vertex_ai()
+
+    # Warm-up client in background (una volta per processo)
+    if WARM_UP_CLIENTS:
+        start_client_warm_up()
+    start_metrics_endpoint()
+    start_storage_sweeper()
+    if not vertex_ready:
         st.warning("⚠️ Vertex AI non configurato - userò fallback FFmpeg")
 
     # Upload
@@ -539,24 +309,63 @@ def main():
         f"Carica {MIN_PHOTOS}-{MAX_PHOTOS} foto (più foto = storia più ricca!)",
         type=['jpg', 'jpeg', 'png'],
         accept_multiple_files=True,
-        help="Veo 2 può usare fino a 8 foto per creare storie complesse"
+        help=f"Oltre {STORY_CHUNK_SIZE} foto la storia è scritta a capitoli in parallelo e poi unita"
     )
 
+    if uploaded_files and len(uploaded_files) > MAX_PHOTOS:
+        if not st.checkbox(f"Scegli le {MAX_PHOTOS} foto migliori (nitidezza ed esposizione)", value=True):
+            st.warning(f"⚠️ Max {MAX_PHOTOS} foto: uso le prime {MAX_PHOTOS}")
+            uploaded_files = uploaded_files[:MAX_PHOTOS]
+
+    # Album piccoli: decodifica una volta sola per upload (preview, Gemini e Veo condividono
+    # lo store); album grandi: solo registrazione, si decodificano le preview visibili
+    image_store = get_image_store()
+    decode_all = len(uploaded_files or []) <= STORY_CHUNK_SIZE
+    upload_hashes = [image_store.add_bytes(file.getvalue(), decode=decode_all, upload_id=file.file_id)
+                     for file in uploaded_files or []]
+    image_store.retain(upload_hashes)
+
+    # Quasi duplicati (raffiche) ed eventuali migliori MAX_PHOTOS, prima di storia e render
+    selection = select_uploads(image_store, upload_hashes) if uploaded_files else None
+    kept = selection['keep'] if selection else []
+
     if uploaded_files:
-        if len(uploaded_files) < MIN_PHOTOS:
+        skipped = len(selection['duplicate_of']) + len(selection['over_limit'])
+        if skipped:
+            savings = selection_savings(selection)
+            st.info(
+                f"🧹 {len(selection['duplicate_of'])} foto quasi duplicate, {len(selection['over_limit'])} oltre il "
+                f"limite: uso {len(kept)} foto su {len(uploaded_files)}"
+                + (f". Risparmio: {savings['veo_calls']} generazioni Veo (~{savings['seconds']:.0f}s), "
+                   f"{savings['gemini_calls']} chiamate Gemini, {savings['gemini_images']} immagini"
+                   if savings['veo_calls'] else "")
+            )
+
+        if len(kept) < MIN_PHOTOS:
             st.warning(f"⚠️ Almeno {MIN_PHOTOS} foto")
-        elif len(uploaded_files) > MAX_PHOTOS:
-            st.warning(f"⚠️ Max {MAX_PHOTOS} foto")
-            uploaded_files = uploaded_files[:MAX_PHOTOS]
+        elif len(kept) > STORY_CHUNK_SIZE:
+            st.success(f"✅ {len(kept)} foto - storia a {len(story_chapters(len(kept)))} capitoli")
         else:
-            st.success(f"✅ {len(uploaded_files)} foto - ottimo per storia ricca!")
+            st.success(f"✅ {len(kept)} foto - ottimo per storia ricca!")
 
-    # Preview
+    # Preview (a pagine con album grandi)
     if uploaded_files:
-        cols = st.columns(min(len(uploaded_files), 4))
-        for idx, (col, file) in enumerate(zip(cols, uploaded_files)):
-            with col:
-                st.image(Image.open(file), caption=f"#{idx+1}", use_container_width=True)
+        shown = list(enumerate(upload_hashes))
+        if len(shown) > PREVIEW_PAGE_SIZE:
+            pages = -(-len(shown) // PREVIEW_PAGE_SIZE)
+            page = st.number_input(f"Pagina anteprime (di {pages})", min_value=1, max_value=pages, value=1)
+            shown = shown[(page - 1) * PREVIEW_PAGE_SIZE:page * PREVIEW_PAGE_SIZE]
+
+        cols = st.columns(min(len(shown), 4 if decode_all else 6))
+        for n, (idx, content_hash) in enumerate(shown):
+            if idx in selection['duplicate_of']:
+                caption = f"#{idx+1} ≈ #{selection['duplicate_of'][idx] + 1} (scartata)"
+            elif idx in selection['over_limit']:
+                caption = f"#{idx+1} (oltre il limite)"
+            else:
+                caption = f"#{idx+1}"
+            with cols[n % len(cols)]:
+                st.image(image_store.get(content_hash, "preview"), caption=caption, use_container_width=True)
 
     # Style
     st.header("🎨 Style")
@@ -565,56 +374,40 @@ def main():
     # Generate
     st.header("🚀 Generate")
 
-    if st.button("✨ Crea Video con Veo 2! ✨", type="primary", use_container_width=True):
+    runner = get_job_runner()
+    runner.resume_pending()
 
-        if not uploaded_files or len(uploaded_files) < MIN_PHOTOS:
-            st.error(f"❌ Carica almeno {MIN_PHOTOS} foto!")
-            st.stop()
-
-        # Save photos
-        photo_paths = []
-        session_id = int(time.time())
-
-        for idx, file in enumerate(uploaded_files):
-            save_path = UPLOAD_FOLDER / f"{session_id}_{idx}.jpg"
-            if save_uploaded_file(file, save_path):
-                photo_paths.append(save_path)
+    if st.button("✨ Crea Video con Veo 2! ✨", type="primary", use_container_width=True):
 
-        if not photo_paths:
-            st.error("❌ Errore salvataggio")
+        if len(kept) < MIN_PHOTOS:
+            st.error(f"❌ Carica almeno {MIN_PHOTOS} foto (diverse tra loro)!")
             st.stop()
 
-        # Process
-        st.balloons()
-
-        with st.spinner("🎬 Generando video con Veo 2... (5-10 minuti)"):
-            final_video = process_photos_to_video(photo_paths, style)
-
-        # Result
-        if final_video and final_video.exists():
-            st.success("🎉 VIDEO PRONTO!")
-
-            st.header("🎬 Il Tuo Video")
+        # Save photos: cartella del run (id univoco, anche per click nello stesso secondo)
+        with run_scope() as run_id:
+            photo_paths = []
 
-            # Player
-            with open(final_video, "rb") as f:
-                video_bytes = f.read()
+            for n, idx in enumerate(kept):
+                save_path = run_folder(UPLOAD_FOLDER) / f"photo_{n}.jpg"
+                if save_uploaded_file(uploaded_files[idx], save_path):
+                    image_store.register_path(save_path, upload_hashes[idx])
+                    photo_paths.append(save_path)
 
-            st.video(video_bytes)
+            if not photo_paths:
+                st.error("❌ Errore salvataggio")
+                st.stop()
 
-            # Download
-            st.download_button(
-                label="📥 Scarica MP4",
-                data=video_bytes,
-                file_name=final_video.name,
-                mime="video/mp4",
-                use_container_width=True
-            )
+            # Job in background: sopravvive a rerun, disconnessioni e restart;
+            # stesso id del run, così upload, clip e output del job stanno insieme
+            job_id = runner.submit(photo_paths, style, use_veo=vertex_ready, job_id=run_id, image_store=image_store)
+        st.session_state['job_id'] = job_id
+        st.query_params['job'] = job_id
 
-            st.balloons()
+        st.balloons()
 
-        else:
-            st.error("❌ Generazione fallita - controlla setup Veo 2")
+    job_id = st.session_state.get('job_id') or st.query_params.get('job')
+    if job_id:
+        render_job_status(runner, job_id)
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,280 @@
+"""
+Photo-to-Video AI - rendering batch senza Streamlit.
+
+Elabora molti album con la stessa pipeline della web app (storia Gemini,
+scene Veo/fallback, merge), più album in parallelo sotto limiti globali di
+concorrenza e quota, e scrive un manifest JSONL dei risultati con i tempi
+di ogni step.
+
+Input:
+    - una cartella: ogni sottocartella con foto è un album (la cartella
+      stessa, se contiene direttamente le foto)
+    - un manifest JSONL, una riga per album:
+      {"id": "mare", "album": "foto/mare", "style": "Dreamy Memories"}
+      {"id": "gita", "photos": ["a.jpg", "b.jpg", "c.jpg"]}
+      (path relativi alla cartella del manifest)
+
+Uso:
+    python batch_render.py albums/ --style "Cinematic Adventure" --albums 2 --results results.jsonl
+    python batch_render.py albums.jsonl --no-veo --output-dir renders/
+    python batch_render.py albums/ --metrics-file metrics.prom --trace-dir traces/
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import photo_video.photos
+import photo_video.pipeline
+from photo_video.config import MAX_CONCURRENT_SCENES, MAX_PHOTOS, MIN_PHOTOS, STYLE_PRESETS, VEO_MAX_IN_FLIGHT
+from photo_video.telemetry import PipelineEvents, events_scope, start_metrics_server, write_metrics_file
+from photo_video.backends import VEO_GUARD, setup_gemini_api, setup_vertex_ai
+from photo_video.storage import STORAGE
+from photo_video.photos import select_photo_paths
+from photo_video.story import selection_savings
+from photo_video.pipeline import process_photos_to_video
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+class BatchEvents(PipelineEvents):
+    """Eventi pipeline di un album: log su stderr + tempi per step."""
+
+    def __init__(self, album_id: str, verbose: bool = False):
+        self.album_id = album_id
+        self.verbose = verbose
+        self.started = time.perf_counter()
+        self.stage_started: Dict[str, float] = {}
+        self.first_scene_s: Optional[float] = None
+        self.story_ready_s: Optional[float] = None
+        self.scenes_done = 0
+        self.scenes_failed = 0
+        self.title: Optional[str] = None
+        self.stage_seconds: Dict[str, float] = {}
+
+    def message(self, level: str, text: str) -> None:
+        if self.verbose or level in ("warning", "error"):
+            print(f"[{self.album_id}] {text}", file=sys.stderr, flush=True)
+
+    def stage(self, key: str, title: str) -> None:
+        self.stage_started[key] = time.perf_counter() - self.started
+
+    def story_ready(self, story: Dict) -> None:
+        # Con lo storyboard in streaming la storia completa arriva a scene già avviate
+        self.title = story.get('title')
+        self.story_ready_s = time.perf_counter() - self.started
+
+    def scene_done(self, index: int, scene: Dict, clip: Optional[Path]) -> None:
+        if clip:
+            self.scenes_done += 1
+            if self.first_scene_s is None:
+                self.first_scene_s = time.perf_counter() - self.started
+        else:
+            self.scenes_failed += 1
+
+    def run_finished(self, stage_seconds: Dict[str, float]) -> None:
+        self.stage_seconds = {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}
+
+    def timings(self) -> Dict[str, float]:
+        """Durata di ogni step (s), dall'inizio al successivo o alla fine."""
+        total = time.perf_counter() - self.started
+        marks = sorted(self.stage_started.items(), key=lambda item: item[1])
+        timings = {}
+        for n, (key, at) in enumerate(marks):
+            end = marks[n + 1][1] if n + 1 < len(marks) else total
+            timings[f"{key}_s"] = round(end - at, 3)
+        timings["total_s"] = round(total, 3)
+        for key in ("story_ready_s", "first_scene_s"):
+            if getattr(self, key) is not None:
+                timings[key] = round(getattr(self, key), 3)
+        return timings
+
+
+def _photos_in(folder: Path) -> List[Path]:
+    return sorted(p for p in folder.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def discover_albums(root: Path, style: str) -> List[Dict]:
+    """Album da una cartella: sottocartelle con foto (o la cartella stessa)."""
+    albums = []
+    if _photos_in(root):
+        albums.append({"id": root.name, "photos": _photos_in(root), "style": style})
+
+    for folder in sorted(p for p in root.rglob('*') if p.is_dir()):
+        photos = _photos_in(folder)
+        if photos:
+            albums.append({"id": str(folder.relative_to(root)), "photos": photos, "style": style})
+
+    return albums
+
+
+def load_manifest(path: Path, style: str) -> List[Dict]:
+    """Album da un manifest JSONL (una riga per album)."""
+    albums = []
+    base = path.parent
+
+    for n, line in enumerate(path.read_text(encoding='utf-8').splitlines(), start=1):
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+
+        if 'photos' in entry:
+            photos = [base / p for p in entry['photos']]
+        else:
+            photos = _photos_in(base / entry['album'])
+
+        albums.append({
+            "id": str(entry.get('id') or entry.get('album') or f"album-{n}"),
+            "photos": photos,
+            "style": entry.get('style', style),
+        })
+
+    return albums
+
+
+def render_album(album: Dict, use_veo: bool, output_dir: Optional[Path], verbose: bool) -> Dict:
+    """Esegue la pipeline per un album; ritorna la riga del manifest risultati."""
+    photos = [p for p in album['photos'] if p.exists()]
+    result = {
+        "id": album['id'],
+        "style": album['style'],
+        "photos": len(photos),
+        "status": "skipped",
+        "output": None,
+        "error": None,
+    }
+
+    # Quasi duplicati e migliori MAX_PHOTOS prima della storia (select_photos)
+    selection = select_photo_paths(photos, MAX_PHOTOS)
+    if len(selection['keep']) < len(photos):
+        result["selected_from"] = len(photos)
+        result["skipped"] = {"duplicates": len(selection['duplicate_of']), "over_limit": len(selection['over_limit'])}
+        result["savings"] = selection_savings(selection)
+        photos = [photos[i] for i in selection['keep']]
+        result["photos"] = len(photos)
+
+    if len(photos) < MIN_PHOTOS:
+        result["error"] = f"servono almeno {MIN_PHOTOS} foto"
+        return result
+
+    events = BatchEvents(album['id'], verbose=verbose)
+    try:
+        final_video = process_photos_to_video(photos, album['style'], use_veo=use_veo, events=events)
+    except Exception as e:
+        final_video = None
+        result["error"] = str(e)
+
+    if final_video and output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        target = output_dir / f"{album['id'].replace('/', '_')}.mp4"
+        shutil.copyfile(final_video, target)
+        final_video = target
+
+    result.update({
+        "status": "done" if final_video else "failed",
+        "output": str(final_video) if final_video else None,
+        "title": events.title,
+        "scenes_done": events.scenes_done,
+        "scenes_failed": events.scenes_failed,
+        "timings": events.timings(),
+        "stage_seconds": events.stage_seconds,
+    })
+    if not final_video and not result["error"]:
+        result["error"] = "nessun video generato"
+
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rendering batch di album foto → video (senza Streamlit)")
+    parser.add_argument("input", type=Path, help="Cartella di album o manifest JSONL")
+    parser.add_argument("--style", default="Cinematic Adventure", choices=sorted(STYLE_PRESETS),
+                        help="Stile di default (il manifest può sovrascriverlo per album)")
+    parser.add_argument("--albums", type=int, default=2, help="Album elaborati in parallelo")
+    parser.add_argument("--max-veo-calls", type=int, default=VEO_MAX_IN_FLIGHT or MAX_CONCURRENT_SCENES,
+                        help="Chiamate Veo contemporanee in tutto il processo")
+    parser.add_argument("--no-veo", action="store_true", help="Solo clip fallback Ken Burns")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Non scartare le foto quasi duplicate (oltre MAX_PHOTOS restano le migliori)")
+    parser.add_argument("--results", type=Path, default=Path("results.jsonl"), help="Manifest risultati (JSONL)")
+    parser.add_argument("--output-dir", type=Path, help="Copia qui i video finali (<id>.mp4)")
+    parser.add_argument("--metrics-file", type=Path, help="Metriche Prometheus (textfile), aggiornate a ogni album")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Endpoint /metrics locale durante il batch")
+    parser.add_argument("--trace-dir", type=Path, help="Trace JSON per album (chrome://tracing, Perfetto)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log di tutti gli eventi della pipeline")
+    args = parser.parse_args(argv)
+
+    if args.keep_duplicates:
+        photo_video.photos.DEDUP_ENABLED = False
+    if args.metrics_file:
+        photo_video.pipeline.METRICS_FILE = str(args.metrics_file)
+    if args.trace_dir:
+        photo_video.pipeline.TRACE_DIR = str(args.trace_dir)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.input.is_dir():
+        albums = discover_albums(args.input, args.style)
+    else:
+        albums = load_manifest(args.input, args.style)
+
+    if not albums:
+        print(f"Nessun album in {args.input}", file=sys.stderr)
+        return 1
+
+    setup_events = BatchEvents("setup", verbose=args.verbose)
+    with events_scope(setup_events):
+        if not setup_gemini_api():
+            return 1
+        use_veo = not args.no_veo and setup_vertex_ai()
+
+    # Upload/temp/output per album in cartelle di run, ripulite oltre quota/TTL durante il batch
+    STORAGE.start_sweeper()
+
+    # La quota (token bucket) è già globale al processo; in più un tetto di chiamate in volo
+    VEO_GUARD.set_max_in_flight(args.max_veo_calls)
+
+    print(f"{len(albums)} album, {args.albums} in parallelo, Veo {'on' if use_veo else 'off'} "
+          f"(max {args.max_veo_calls} chiamate in volo)", file=sys.stderr)
+
+    started = time.perf_counter()
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    with open(args.results, 'w', encoding='utf-8') as results, \
+            ThreadPoolExecutor(max_workers=max(1, args.albums), thread_name_prefix="album") as pool:
+        futures = {
+            pool.submit(render_album, album, use_veo, args.output_dir, args.verbose): album
+            for album in albums
+        }
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": futures[future]['id'], "status": "failed", "error": str(e)}
+
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results.flush()
+            counts[result['status']] += 1
+
+            print(f"[{result['id']}] {result['status']}"
+                  f"{' - ' + result['error'] if result.get('error') else ''}"
+                  f"{' (%.1fs)' % result['timings']['total_s'] if result.get('timings') else ''}",
+                  file=sys.stderr, flush=True)
+
+    elapsed = time.perf_counter() - started
+    if args.metrics_file:
+        write_metrics_file(args.metrics_file)
+    print(f"Completati {counts['done']}/{len(albums)} album in {elapsed:.1f}s "
+          f"({counts['failed']} falliti, {counts['skipped']} saltati) → {args.results}", file=sys.stderr)
+
+    return 0 if counts['failed'] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark fallback renderer: Ken Burns NumPy vs il vecchio comando zoompan.
+
+Richiede ffmpeg nel PATH. Senza --photo usa un'immagine sintetica 4000x3000.
+
+Uso:
+    python benchmarks/bench_fallback_render.py [--photo foto.jpg] [--runs 3]
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from photo_video.config import CLIP_DURATION, VIDEO_FPS  # noqa: E402
+from photo_video.render import render_ken_burns_clip  # noqa: E402
+
+MOVEMENTS = ["dolly forward", "zoom out", "pan left", "tilt up", "orbit"]
+
+
+def zoompan_command(photo_path: Path, output_path: Path, duration: float) -> list:
+    """Il comando zoompan originale di create_simple_clip_ffmpeg (baseline)."""
+    return [
+        'ffmpeg', '-y',
+        '-loop', '1',
+        '-i', str(photo_path),
+        '-vf', f'scale=1280:720,zoompan=z=\'min(zoom+0.0015,1.5)\':d={CLIP_DURATION * VIDEO_FPS}:s=1280x720',
+        '-t', str(duration),
+        '-c:v', 'libx264',
+        '-pix_fmt', 'yuv420p',
+        '-r', str(VIDEO_FPS),
+        str(output_path)
+    ]
+
+
+def synthetic_photo(folder: Path) -> Path:
+    yy, xx = np.mgrid[0:3000, 0:4000]
+    rgb = np.stack([xx % 256, yy % 256, (xx + yy) % 256], axis=-1).astype(np.uint8)
+    path = folder / "synthetic.jpg"
+    Image.fromarray(rgb).save(path, quality=92)
+    return path
+
+
+def best_of(runs: int, fn) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photo", type=Path)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=CLIP_DURATION)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        photo = args.photo or synthetic_photo(tmp)
+        out = tmp / "out.mp4"
+
+        baseline = best_of(args.runs, lambda: subprocess.run(
+            zoompan_command(photo, out, args.duration), capture_output=True, check=True, timeout=600
+        ))
+        print(f"{'zoompan (baseline)':<28} {baseline:7.2f}s")
+
+        for movement in MOVEMENTS:
+            elapsed = best_of(args.runs, lambda: render_ken_burns_clip(
+                photo, out, movement, duration=args.duration
+            ))
+            print(f"{'ken burns / ' + movement:<28} {elapsed:7.2f}s  ({baseline / elapsed:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
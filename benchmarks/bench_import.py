@@ -0,0 +1,189 @@
+"""
+Benchmark cold start: costo di `import app` e tempo alla prima pagina Streamlit.
+
+Ogni misura gira in un interprete nuovo (niente moduli già in cache):
+
+- import: `python -X importtime -c "import app"`, con i moduli top-level più
+  costosi e i backend pesanti effettivamente eseguiti all'import
+- import batch: lo stesso per `import batch_render` (pipeline senza UI), che
+  non deve caricare nemmeno streamlit
+- prima pagina: AppTest di Streamlit esegue lo script come `streamlit run`
+  fino al primo render completo (senza API key: pagina con errori di setup)
+
+Salva una baseline JSON confrontabile con --compare, come bench_pipeline.
+
+Uso:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 5 --top 15 --strict
+    python benchmarks/bench_import.py --compare benchmarks/baselines/import-20250101-120000.json
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+# Backend che non devono essere eseguiti da `import app`
+HEAVY_MODULES = ["google.generativeai", "google.cloud.aiplatform", "google.cloud.aiplatform_v1", "grpc",
+                 "numpy", "PIL.Image"]
+# ...e in più, fuori dalla UI (CLI batch, test)
+BATCH_MODULE = "batch_render"
+BATCH_HEAVY_MODULES = HEAVY_MODULES + ["streamlit"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+# Moduli eseguiti davvero (i proxy LazyModule non finiscono in sys.modules finché non usati)
+LOADED_PROBE = """
+import sys, json
+import {module}
+print(json.dumps([m for m in {modules!r} if m in sys.modules]))
+"""
+
+FIRST_PAGE_PROBE = """
+import time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120).run()
+print(time.perf_counter() - started, len(at.exception))
+"""
+
+
+def measure_import(top: int, module: str = "app") -> dict:
+    """Un `import <module>` con -X importtime; ms totali e moduli top-level più costosi."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} fallito:\n{proc.stderr[-2000:]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+
+    total = next(cumulative for name, _, _, cumulative in entries if name == module)
+    # Livello 1 = importati direttamente da <module> (o da moduli stdlib già caricati)
+    top_level = sorted((e for e in entries if e[1] == 1), key=lambda e: -e[3])[:top]
+    return {
+        "total_ms": total / 1000,
+        "top": [{"module": name, "cumulative_ms": round(cumulative / 1000, 1)}
+                for name, _, _, cumulative in top_level],
+    }
+
+
+def loaded_heavy_modules(module: str = "app", heavy: list = HEAVY_MODULES) -> list:
+    proc = subprocess.run([sys.executable, "-c", LOADED_PROBE.format(module=module, modules=heavy)],
+                          capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"probe moduli fallito:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_first_page() -> dict:
+    """Interprete nuovo → primo render completo della pagina (s)."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", FIRST_PAGE_PROBE.format(app=str(ROOT / "app.py"))],
+                          capture_output=True, text=True, cwd=ROOT)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"AppTest fallito:\n{proc.stderr[-2000:]}")
+    script_s, exceptions = proc.stdout.strip().splitlines()[-1].split()
+    return {"wall_s": wall, "script_s": float(script_s), "exceptions": int(exceptions)}
+
+
+def compare(result: dict, baseline_path: Path, tolerance: float) -> bool:
+    """False se import o prima pagina (mediane) peggiorano oltre `tolerance`."""
+    baseline = json.loads(baseline_path.read_text())["result"]
+    ok = True
+    print(f"\nConfronto con {baseline_path.name} (tolleranza {tolerance:.0%})")
+    for key in ("import_ms", "batch_import_ms", "first_page_s"):
+        if key not in baseline:
+            continue
+        now, base = result[key]["p50"], baseline[key]["p50"]
+        regressed = bool(base) and now > base * (1 + tolerance)
+        ok = ok and not regressed
+        print(f"  {key}: {base} → {now}{'  ⚠️ REGRESSIONE' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Interpreti nuovi per misura")
+    parser.add_argument("--top", type=int, default=10, help="Moduli top-level da mostrare")
+    parser.add_argument("--no-first-page", action="store_true", help="Solo import (senza AppTest)")
+    parser.add_argument("--strict", action="store_true",
+                        help="Exit 1 se un backend pesante (o streamlit nel batch) è eseguito all'import")
+    parser.add_argument("--output", type=Path, help="Baseline JSON (default: benchmarks/baselines/import-<data>.json)")
+    parser.add_argument("--compare", type=Path, help="Baseline con cui confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    imports = [measure_import(args.top) for _ in range(args.runs)]
+    import_ms = [m["total_ms"] for m in imports]
+    print(f"import app: p50 {statistics.median(import_ms):.0f} ms "
+          f"(min {min(import_ms):.0f}, max {max(import_ms):.0f}, {args.runs} run)")
+    for entry in imports[-1]["top"]:
+        print(f"  {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+
+    heavy = loaded_heavy_modules()
+    print(f"backend eseguiti all'import: {', '.join(heavy) if heavy else 'nessuno'}")
+
+    batch_ms = [measure_import(args.top, BATCH_MODULE)["total_ms"] for _ in range(args.runs)]
+    batch_heavy = loaded_heavy_modules(BATCH_MODULE, BATCH_HEAVY_MODULES)
+    print(f"import {BATCH_MODULE}: p50 {statistics.median(batch_ms):.0f} ms, "
+          f"caricati all'import: {', '.join(batch_heavy) if batch_heavy else 'nessuno'}")
+
+    result = {
+        "import_ms": {"p50": round(statistics.median(import_ms), 1), "runs": [round(v, 1) for v in import_ms]},
+        "top_modules": imports[-1]["top"],
+        "heavy_loaded_at_import": heavy,
+        "batch_import_ms": {"p50": round(statistics.median(batch_ms), 1), "runs": [round(v, 1) for v in batch_ms]},
+        "batch_heavy_loaded_at_import": batch_heavy,
+        "first_page_s": {"p50": None, "runs": []},
+    }
+
+    if not args.no_first_page:
+        pages = [measure_first_page() for _ in range(args.runs)]
+        walls = [page["wall_s"] for page in pages]
+        result["first_page_s"] = {
+            "p50": round(statistics.median(walls), 3),
+            "runs": [round(v, 3) for v in walls],
+            "script_p50": round(statistics.median(page["script_s"] for page in pages), 3),
+        }
+        print(f"prima pagina: p50 {statistics.median(walls):.2f}s dall'avvio dell'interprete "
+              f"(script {result['first_page_s']['script_p50']:.2f}s, eccezioni {pages[-1]['exceptions']})")
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        revision = ""
+
+    output = args.output or BASELINE_DIR / f"import-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": revision,
+        "python": sys.version.split()[0],
+        "result": result,
+    }, indent=2))
+    print(f"\nBaseline salvata: {output}")
+
+    ok = True
+    if args.compare:
+        ok = compare(result, args.compare, args.tolerance)
+    if args.strict and (heavy or batch_heavy):
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
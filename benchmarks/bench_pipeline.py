@@ -0,0 +1,502 @@
+"""
+Benchmark end-to-end di process_photos_to_video con backend finti (nessuna quota API).
+
+Gemini e Veo sono sostituiti da fake locali con latenza log-normale
+(mediana + sigma), tasso di errore e dimensione dei payload configurabili:
+Gemini ritorna una storia JSON canned (anche in streaming), Veo un MP4
+piccolo. Con --fake-ffmpeg (automatico senza ffmpeg nel PATH) anche render
+fallback, probe e merge diventano stand-in con latenza fissa.
+
+Ogni configurazione (foto per album × concorrenza) gira in un sottoprocesso
+separato, così il picco di RSS è per configurazione. Riporta latenza album
+e scena p50/p95/p99, scene al minuto, picco RSS e byte spostati, e salva
+tutto come baseline JSON confrontabile con --compare.
+
+Uso:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 3 8 --concurrency 1 4 --runs 5 --veo-latency 2
+    python benchmarks/bench_pipeline.py --compare benchmarks/baselines/pipeline-20250101-120000.json
+"""
+
+import argparse
+import base64
+import io
+import json
+import math
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+MOVEMENTS = ["dolly forward", "pan left", "tilt up", "zoom out", "orbit"]
+
+
+# ---------------------------------------------------------------------------
+# Fake backend
+# ---------------------------------------------------------------------------
+
+def sample_latency(rng: random.Random, median: float, sigma: float) -> float:
+    """Latenza log-normale: `median` secondi, coda controllata da `sigma`."""
+    return median * math.exp(rng.gauss(0.0, sigma)) if median > 0 else 0.0
+
+
+class Traffic:
+    """Byte scambiati con i backend finti (stima di cosa viaggerebbe in rete)."""
+
+    def __init__(self):
+        self.counters = {"gemini_sent": 0, "gemini_received": 0, "veo_sent": 0, "veo_received": 0}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, n: int) -> None:
+        with self._lock:
+            self.counters[key] += n
+
+
+def canned_story(n_photos: int, pad_bytes: int) -> dict:
+    """Storia valida per `n_photos` foto; `pad_bytes` allunga ogni descrizione."""
+    padding = ("lorem ipsum " * (pad_bytes // 12 + 1))[:pad_bytes]
+    return {
+        "title": "Benchmark Story",
+        "story_summary": "Storia sintetica per il benchmark della pipeline.",
+        "narrative_arc": "journey",
+        "scenes": [
+            {
+                "photo_index": i,
+                "scene_title": f"Scene {i + 1}",
+                "description": f"Scena sintetica {i + 1}. {padding}",
+                "veo_prompt": f"Cinematic slow camera move across scene {i + 1}, golden light, soft haze, "
+                              f"gentle motion, shallow depth of field, film grain, smooth stabilised shot",
+                "camera_movement": MOVEMENTS[i % len(MOVEMENTS)],
+                "duration": 5,
+                "transition_to_next": "dissolve",
+            }
+            for i in range(n_photos)
+        ],
+        "final_message": "Fine",
+    }
+
+
+class FakeGeminiModel:
+    """Stand-in di GenerativeModel.generate_content (sincrono e streaming)."""
+
+    def __init__(self, latency: float, sigma: float, failure_rate: float, pad_bytes: int,
+                 traffic: Traffic, seed: int = 0, chunk_chars: int = 256):
+        self.latency = latency
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.pad_bytes = pad_bytes
+        self.traffic = traffic
+        self.chunk_chars = chunk_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _count_request(self, parts) -> int:
+        images = [p for p in parts if not isinstance(p, str)]
+        for part in parts:
+            if isinstance(part, str):
+                self.traffic.add("gemini_sent", len(part.encode("utf-8")))
+            else:
+                # Stima: le immagini viaggiano come JPEG
+                buf = io.BytesIO()
+                part.save(buf, "JPEG", quality=85)
+                self.traffic.add("gemini_sent", buf.tell())
+        return len(images)
+
+    def generate_content(self, parts, stream: bool = False):
+        n_photos = self._count_request(parts)
+        with self._lock:
+            latency = sample_latency(self._rng, self.latency, self.sigma)
+            fails = self._rng.random() < self.failure_rate
+        text = "```json\n" + json.dumps(canned_story(n_photos, self.pad_bytes), ensure_ascii=False) + "\n```"
+
+        if not stream:
+            time.sleep(latency)
+            if fails:
+                raise ConnectionError("fake gemini: 503 unavailable")
+            self.traffic.add("gemini_received", len(text.encode("utf-8")))
+            return SimpleNamespace(text=text)
+
+        def chunks():
+            # Primo token dopo metà della latenza, il resto distribuito sui chunk
+            pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+            time.sleep(latency / 2)
+            for n, piece in enumerate(pieces):
+                if fails and n == len(pieces) // 2:
+                    raise ConnectionError("fake gemini: stream interrotto")
+                time.sleep(latency / 2 / len(pieces))
+                self.traffic.add("gemini_received", len(piece.encode("utf-8")))
+                yield SimpleNamespace(text=piece)
+
+        if fails and self._rng.random() < 0.5:
+            time.sleep(latency / 2)
+            raise ConnectionError("fake gemini: 503 unavailable")
+        return chunks()
+
+
+class FakeVeoClient:
+    """Stand-in di PredictionServiceClient.predict: ritorna sempre lo stesso MP4."""
+
+    def __init__(self, latency: float, sigma: float, failure_rate: float, clip_bytes: bytes,
+                 traffic: Traffic, seed: int = 0):
+        self.latency = latency
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.clip_b64 = base64.b64encode(clip_bytes).decode("ascii")
+        self.traffic = traffic
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def predict(self, endpoint: str, instances: list):
+        self.traffic.add("veo_sent", len(json.dumps(instances).encode("utf-8")))
+        with self._lock:
+            latency = sample_latency(self._rng, self.latency, self.sigma)
+            fails = self._rng.random() < self.failure_rate
+        time.sleep(latency)
+        if fails:
+            raise ConnectionError("fake veo: 503 unavailable")
+        self.traffic.add("veo_received", len(self.clip_b64))
+        return SimpleNamespace(predictions=[{"videoBase64": self.clip_b64}])
+
+
+def make_canned_clip(path: Path, size_kb: int, real_ffmpeg: bool) -> bytes:
+    """MP4 canned al profilo canonico (ffmpeg) o solo struttura (ftyp/moov/mdat); padding con box `free`."""
+    from photo_video.config import CLIP_DURATION, FALLBACK_OUTPUT_SIZE, VIDEO_FPS
+    from photo_video.render import CANONICAL_PROFILE
+
+    if real_ffmpeg:
+        w, h = FALLBACK_OUTPUT_SIZE
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"color=c=gray:s={w}x{h}:r={VIDEO_FPS}:d={CLIP_DURATION}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+            "-video_track_timescale", CANONICAL_PROFILE["time_base"].split("/")[1],
+            str(path),
+        ], check=True, capture_output=True)
+        data = path.read_bytes()
+    else:
+        from fake_veo_server import canned_mp4
+        data = canned_mp4(CLIP_DURATION)
+
+    missing = size_kb * 1024 - len(data)
+    if missing > 8:
+        data += struct.pack(">I", missing) + b"free" + b"\x00" * (missing - 8)
+    path.write_bytes(data)
+    return data
+
+
+class FakeFFmpeg:
+    """Render fallback, probe, normalizzazione e merge senza codifica reale."""
+
+    def __init__(self, clip_path: Path, render_latency: float):
+        self.clip_path = clip_path
+        self.render_latency = render_latency
+
+    def install(self) -> None:
+        import photo_video.pipeline
+        import photo_video.render
+        from photo_video.config import CLIP_DURATION, FALLBACK_OUTPUT_SIZE, OUTPUT_FOLDER, VIDEO_FPS
+        from photo_video.storage import run_folder
+
+        def render(photo_path, output_path, camera_movement, duration=CLIP_DURATION,
+                   fps=VIDEO_FPS, out_size=FALLBACK_OUTPUT_SIZE, timeout=None, threads=0):
+            time.sleep(self.render_latency)
+            shutil.copyfile(self.clip_path, output_path)
+            return output_path
+
+        def merge(video_paths, story, crossfade=None):
+            output_path = run_folder(OUTPUT_FOLDER) / f"bench_{time.time_ns()}.mp4"
+            with open(output_path, "wb") as out:
+                for clip in video_paths:
+                    if clip:
+                        out.write(Path(clip).read_bytes())
+            return output_path
+
+        photo_video.render.render_ken_burns_clip = render
+        photo_video.render.normalize_clip = lambda path, profile, threads=0: path
+        photo_video.pipeline.merge_videos_ffmpeg = merge
+        photo_video.pipeline.PROGRESSIVE_OUTPUT = False
+
+
+# ---------------------------------------------------------------------------
+# Worker: una configurazione in un processo dedicato
+# ---------------------------------------------------------------------------
+
+def make_album(folder: Path, n_photos: int, seed: int, size: tuple) -> list:
+    """Foto sintetiche (rumore + gradiente: JPEG di dimensione realistica)."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    w, h = size
+    gradient = np.linspace(0, 160, w, dtype=np.float32)[None, :, None]
+    photos = []
+    for i in range(n_photos):
+        noise = rng.integers(0, 96, size=(h, w, 3), dtype=np.uint8)
+        pixels = np.clip(noise + gradient, 0, 255).astype(np.uint8)
+        path = folder / f"photo_{seed}_{i}.jpg"
+        Image.fromarray(pixels).save(path, "JPEG", quality=88)
+        photos.append(path)
+    return photos
+
+
+def percentiles(values: list) -> dict:
+    import numpy as np
+
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss è in KB su Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def run_worker(cfg: dict) -> dict:
+    import photo_video.backends
+    import photo_video.pipeline
+    import photo_video.render
+    import photo_video.storage
+    import photo_video.story
+    import photo_video.veo
+    from photo_video.config import (
+        CLIP_CACHE_MAX_BYTES, CLIP_DURATION, STORY_CACHE_MAX_ENTRIES, STORY_CACHE_TTL_SECONDS,
+    )
+    from photo_video.telemetry import PipelineEvents
+    from photo_video.backends import CLIENTS, GEMINI_GUARD, VEO_GUARD, TokenBucket, resilience_metrics
+    from photo_video.storage import ClipCache, StoryCache
+    from photo_video.render import CANONICAL_PROFILE
+    from photo_video.pipeline import process_photos_to_video
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    try:
+        # Cache isolate e vuote: ogni album deve passare davvero dai backend (e nelle metriche)
+        clip_cache = ClipCache(workdir / "clips", CLIP_CACHE_MAX_BYTES)
+        story_cache = StoryCache(workdir / "stories", STORY_CACHE_TTL_SECONDS, STORY_CACHE_MAX_ENTRIES)
+        photo_video.storage.CLIP_CACHE = photo_video.veo.CLIP_CACHE = photo_video.pipeline.CLIP_CACHE = clip_cache
+        photo_video.storage.STORY_CACHE = photo_video.story.STORY_CACHE = story_cache
+        photo_video.pipeline.MAX_CONCURRENT_SCENES = cfg["concurrency"]
+        photo_video.pipeline.HEDGING_ENABLED = cfg["hedging"]
+        photo_video.pipeline.STORY_STREAMING = cfg["streaming"]
+        photo_video.backends.RETRY_BASE_DELAY = cfg["retry_base_delay"]
+        if not cfg["real_quota"]:
+            VEO_GUARD.limiter = TokenBucket(1e6)
+            GEMINI_GUARD.limiter = TokenBucket(1e6)
+
+        traffic = Traffic()
+        real_ffmpeg = not cfg["fake_ffmpeg"]
+        clip_bytes = make_canned_clip(workdir / "canned.mp4", cfg["clip_kb"], real_ffmpeg)
+        if cfg["fake_ffmpeg"]:
+            FakeFFmpeg(workdir / "canned.mp4", cfg["render_latency"]).install()
+        if shutil.which("ffprobe") is None:
+            photo_video.render.probe_clip = lambda path: dict(CANONICAL_PROFILE, duration=float(CLIP_DURATION))
+
+        gemini = FakeGeminiModel(cfg["gemini_latency"], cfg["gemini_sigma"], cfg["gemini_failure_rate"],
+                                 cfg["story_pad_bytes"], traffic, seed=cfg["seed"])
+        veo = FakeVeoClient(cfg["veo_latency"], cfg["veo_sigma"], cfg["veo_failure_rate"],
+                            clip_bytes, traffic, seed=cfg["seed"])
+        CLIENTS.gemini_model = lambda name: gemini
+        CLIENTS.prediction_client = lambda: veo
+
+        class TimingEvents(PipelineEvents):
+            def __init__(self):
+                self.started = time.perf_counter()
+                self.scene_latencies = []
+                self.failed = 0
+
+            def scene_done(self, index, scene, clip):
+                if clip:
+                    self.scene_latencies.append(time.perf_counter() - self.started)
+                else:
+                    self.failed += 1
+
+        album_latencies, scene_latencies, first_scene = [], [], []
+        scenes_done = scenes_failed = albums_failed = 0
+        wall = 0.0
+
+        for run in range(cfg["runs"]):
+            photos = make_album(workdir / f"album_{run}", cfg["photos"], cfg["seed"] * 1000 + run,
+                                tuple(cfg["photo_size"]))
+            events = TimingEvents()
+            started = time.perf_counter()
+            video = process_photos_to_video(photos, "Cinematic Adventure", use_veo=True, events=events)
+            elapsed = time.perf_counter() - started
+
+            wall += elapsed
+            album_latencies.append(elapsed)
+            scene_latencies += events.scene_latencies
+            if events.scene_latencies:
+                first_scene.append(min(events.scene_latencies))
+            scenes_done += len(events.scene_latencies)
+            scenes_failed += events.failed
+            albums_failed += 0 if video else 1
+
+        metrics = resilience_metrics()
+        return {
+            "photos": cfg["photos"],
+            "concurrency": cfg["concurrency"],
+            "runs": cfg["runs"],
+            "album_latency_s": percentiles(album_latencies),
+            "scene_latency_s": percentiles(scene_latencies),
+            "first_scene_s": percentiles(first_scene),
+            "scenes_per_minute": round(scenes_done / wall * 60, 2) if wall else 0.0,
+            "scenes_done": scenes_done,
+            "scenes_failed": scenes_failed,
+            "albums_failed": albums_failed,
+            "peak_rss_mb": peak_rss_mb(),
+            "bytes_moved": dict(traffic.counters, total=sum(traffic.counters.values())),
+            "retries": {name: m["retries"] for name, m in metrics.items()},
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def run_config(cfg: dict) -> dict:
+    """Esegue una configurazione in un sottoprocesso; l'ultima riga di stdout è il JSON."""
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", json.dumps(cfg)],
+        capture_output=True, text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.strip()]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"worker fallito (photos={cfg['photos']}, concurrency={cfg['concurrency']}):\n"
+                           f"{proc.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def _key(result: dict) -> tuple:
+    return result["photos"], result["concurrency"]
+
+
+def compare(results: list, baseline_path: Path, tolerance: float) -> bool:
+    """Confronta con una baseline; False se p95 album o scene/min peggiorano oltre `tolerance`."""
+    baseline = {_key(r): r for r in json.loads(baseline_path.read_text())["results"]}
+    ok = True
+    print(f"\nConfronto con {baseline_path.name} (tolleranza {tolerance:.0%})")
+    for result in results:
+        base = baseline.get(_key(result))
+        if base is None:
+            continue
+        p95, base_p95 = result["album_latency_s"]["p95"], base["album_latency_s"]["p95"]
+        spm, base_spm = result["scenes_per_minute"], base["scenes_per_minute"]
+        regressed = (p95 and base_p95 and p95 > base_p95 * (1 + tolerance)) or \
+                    (base_spm and spm < base_spm * (1 - tolerance))
+        ok = ok and not regressed
+        print(f"  photos={result['photos']} conc={result['concurrency']}: "
+              f"p95 {base_p95}s → {p95}s, scene/min {base_spm} → {spm}"
+              f"{'  ⚠️ REGRESSIONE' if regressed else ''}")
+    return ok
+
+
+def main():
+    from photo_video.config import MIN_PHOTOS, STORY_CHUNK_SIZE
+    from photo_video.render import available_cpus
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=list(range(MIN_PHOTOS, STORY_CHUNK_SIZE + 1)),
+                        help="Foto per album (oltre STORY_CHUNK_SIZE: storia a capitoli)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="MAX_CONCURRENT_SCENES")
+    parser.add_argument("--runs", type=int, default=3, help="Album per configurazione")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Mediana latenza Gemini (s)")
+    parser.add_argument("--gemini-sigma", type=float, default=0.3)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--story-pad-bytes", type=int, default=400, help="Testo extra per scena nella storia")
+    parser.add_argument("--veo-latency", type=float, default=1.5, help="Mediana latenza Veo (s)")
+    parser.add_argument("--veo-sigma", type=float, default=0.4)
+    parser.add_argument("--veo-failure-rate", type=float, default=0.05)
+    parser.add_argument("--clip-kb", type=int, default=256, help="Dimensione MP4 ritornato da Veo")
+    parser.add_argument("--photo-size", type=int, nargs=2, default=[2048, 1536])
+    parser.add_argument("--render-latency", type=float, default=0.5, help="Render fallback finto (s)")
+    parser.add_argument("--fake-ffmpeg", action="store_true", help="Stand-in anche per ffmpeg (auto se assente)")
+    parser.add_argument("--real-quota", action="store_true", help="Applica le quote reali (token bucket)")
+    parser.add_argument("--no-hedging", action="store_true")
+    parser.add_argument("--no-streaming", action="store_true", help="Storyboard non in streaming")
+    parser.add_argument("--retry-base-delay", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Baseline JSON (default: benchmarks/baselines/pipeline-<data>.json)")
+    parser.add_argument("--compare", type=Path, help="Baseline con cui confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    fake_ffmpeg = args.fake_ffmpeg or shutil.which("ffmpeg") is None
+    base_cfg = {
+        "runs": args.runs,
+        "gemini_latency": args.gemini_latency,
+        "gemini_sigma": args.gemini_sigma,
+        "gemini_failure_rate": args.gemini_failure_rate,
+        "story_pad_bytes": args.story_pad_bytes,
+        "veo_latency": args.veo_latency,
+        "veo_sigma": args.veo_sigma,
+        "veo_failure_rate": args.veo_failure_rate,
+        "clip_kb": args.clip_kb,
+        "photo_size": args.photo_size,
+        "render_latency": args.render_latency,
+        "fake_ffmpeg": fake_ffmpeg,
+        "real_quota": args.real_quota,
+        "hedging": not args.no_hedging,
+        "streaming": not args.no_streaming,
+        "retry_base_delay": args.retry_base_delay,
+        "seed": args.seed,
+    }
+
+    print(f"{'foto':>4} {'conc':>4} {'album p50':>9} {'p95':>7} {'p99':>7} {'scena p95':>9} "
+          f"{'scene/min':>9} {'RSS MB':>7} {'MB spostati':>11} {'fallite':>7}")
+    results = []
+    for photos in args.sizes:
+        for concurrency in args.concurrency:
+            result = run_config(dict(base_cfg, photos=photos, concurrency=concurrency))
+            results.append(result)
+            album = result["album_latency_s"]
+            print(f"{photos:>4} {concurrency:>4} {album['p50']:>9} {album['p95']:>7} {album['p99']:>7} "
+                  f"{result['scene_latency_s']['p95']:>9} {result['scenes_per_minute']:>9} "
+                  f"{result['peak_rss_mb']['self']:>7} {result['bytes_moved']['total'] / 1e6:>11.2f} "
+                  f"{result['scenes_failed']:>7}", flush=True)
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except OSError:
+        revision = ""
+
+    output = args.output or BASELINE_DIR / f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": revision,
+        "python": sys.version.split()[0],
+        "cpus": available_cpus(),
+        "config": base_cfg,
+        "results": results,
+    }, indent=2))
+    print(f"\nBaseline salvata: {output}")
+
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
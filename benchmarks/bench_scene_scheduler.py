@@ -0,0 +1,75 @@
+"""
+Benchmark scene scheduler con client Veo stub (nessuna chiamata API).
+
+Confronta generazione sequenziale vs parallela con latenza Veo simulata.
+
+Uso:
+    python benchmarks/bench_scene_scheduler.py --scenes 8 --delay 0.5 --concurrency 4
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_video.config import MAX_CONCURRENT_SCENES  # noqa: E402
+from photo_video.pipeline import generate_scenes_concurrently  # noqa: E402
+
+
+def make_stub_veo(delay: float):
+    """Client Veo stub: dorme `delay` secondi e ritorna un path fittizio."""
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def generate(photo_path: Path, scene: dict, style: str) -> Path:
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        try:
+            time.sleep(delay)
+            return Path(f"stub_clip_{scene['photo_index']}.mp4")
+        finally:
+            with lock:
+                in_flight -= 1
+
+    generate.peak = lambda: peak
+    return generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.5, help="Latenza Veo simulata (s)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_SCENES)
+    args = parser.parse_args()
+
+    photos = [Path(f"photo_{i}.jpg") for i in range(args.scenes)]
+    scenes = [{"photo_index": i, "scene_title": f"Scene {i+1}"} for i in range(args.scenes)]
+
+    for concurrency in (1, args.concurrency):
+        stub = make_stub_veo(args.delay)
+        done_order = []
+
+        start = time.perf_counter()
+        clips = generate_scenes_concurrently(
+            photos, scenes, "Cinematic Adventure",
+            max_concurrency=concurrency,
+            generate_fn=stub,
+            on_scene_done=lambda i, scene, clip: done_order.append(i),
+        )
+        elapsed = time.perf_counter() - start
+
+        assert [c.name for c in clips] == [f"stub_clip_{i}.mp4" for i in range(args.scenes)]
+        assert stub.peak() <= concurrency
+
+        print(f"concurrency={concurrency:2d}  wall={elapsed:6.2f}s  "
+              f"peak_in_flight={stub.peak()}  completion_order={done_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Fake server locale delle operation Veo (predictLongRunning / fetchPredictOperation).
+
+Permette di provare VeoOperationPoller e la pipeline offline, senza quota:
+ogni operation diventa `done` dopo una latenza configurabile e ritorna un
+clip MP4 canned (o fallisce con probabilità `failure_rate`, con un errore
+transitorio: non una quota esaurita).
+
+Uso:
+    python benchmarks/fake_veo_server.py --port 8765 --latency 3
+    VEO_USE_OPERATIONS=1 VEO_API_BASE=http://127.0.0.1:8765/v1 streamlit run app.py
+
+    python benchmarks/fake_veo_server.py --selftest
+"""
+
+import argparse
+import base64
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+def canned_mp4(duration: float = 5.0, mdat_bytes: int = 1024) -> bytes:
+    """MP4 minimo ma completo per la validazione dei clip: ftyp + moov/mvhd (durata) + mdat."""
+    ftyp = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+    mvhd_body = (struct.pack(">IIIII", 0, 0, 0, 1000, int(duration * 1000))
+                 + struct.pack(">IH", 0x00010000, 0x0100) + b"\x00" * 10
+                 + struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+                 + b"\x00" * 24 + struct.pack(">I", 2))
+    mvhd = struct.pack(">I", 8 + len(mvhd_body)) + b"mvhd" + mvhd_body
+    moov = struct.pack(">I", 8 + len(mvhd)) + b"moov" + mvhd
+    mdat = struct.pack(">I", 8 + mdat_bytes) + b"mdat" + b"\x00" * mdat_bytes
+    return ftyp + moov + mdat
+
+
+# Nessuna codifica reale: basta a superare probe_mp4_fast (container + durata)
+DEFAULT_CLIP = canned_mp4()
+
+
+class FakeVeoOperationsServer(ThreadingHTTPServer):
+    """Server HTTP in un thread; `base_url` va passato come VEO_API_BASE."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 2.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, clip_bytes: bytes = DEFAULT_CLIP):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.clip_b64 = base64.b64encode(clip_bytes).decode("ascii")
+        self.operations = {}  # nome → (istante done, fallisce)
+        self.submitted = 0
+        self.polls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeVeoOperationsServer":
+        threading.Thread(target=self.serve_forever, name="fake-veo", daemon=True).start()
+        return self
+
+    def create_operation(self, model_path: str) -> str:
+        name = f"{model_path}/operations/{uuid.uuid4().hex}"
+        ready_at = time.monotonic() + max(0.0, random.gauss(self.latency, self.jitter))
+        with self._lock:
+            self.operations[name] = (ready_at, random.random() < self.failure_rate)
+            self.submitted += 1
+        return name
+
+    def operation_status(self, name: str) -> dict:
+        with self._lock:
+            self.polls += 1
+            entry = self.operations.get(name)
+        if entry is None:
+            return {"name": name, "done": True, "error": {"code": 5, "message": "operation not found"}}
+
+        ready_at, fails = entry
+        if time.monotonic() < ready_at:
+            return {"name": name, "done": False}
+        if fails:
+            return {"name": name, "done": True, "error": {"code": 13, "message": "INTERNAL: fake failure"}}
+        return {
+            "name": name,
+            "done": True,
+            "response": {"videos": [{"bytesBase64Encoded": self.clip_b64, "mimeType": "video/mp4"}]},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0]
+
+        if path.endswith(":predictLongRunning"):
+            payload = {"name": self.server.create_operation(path[len("/v1/"):-len(":predictLongRunning")])}
+        elif path.endswith(":fetchPredictOperation"):
+            payload = self.server.operation_status(body.get("operationName", ""))
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def selftest(n_ops: int = 6) -> None:
+    """Poller contro il fake server: completamento, errori e cancellazione."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import requests
+
+    from photo_video.backends import CircuitOpenError, ServiceGuard, VeoOperationError
+    from photo_video.veo import VeoOperationPoller, VeoOperationsClient, extract_veo_video_b64
+
+    server = FakeVeoOperationsServer(latency=0.5, jitter=0.1, failure_rate=0.2).start()
+    client = VeoOperationsClient(server.base_url, requests.Session(), "demo", "us-central1")
+    # Guard dedicato: la quota (e il breaker) di VEO_GUARD sono tarati sul Veo vero
+    guard = ServiceGuard("veo-selftest", requests_per_minute=6000, max_attempts=1)
+    poller = VeoOperationPoller(client, initial_interval=0.1, max_interval=0.4, timeout=10, guard=guard)
+
+    start = time.perf_counter()
+    futures = [poller.submit([{"prompt": f"scene {i}"}], {}) for i in range(n_ops)]
+    cancelled = poller.submit([{"prompt": "abandoned"}], {})
+    cancelled.cancel()
+
+    done = failed = 0
+    for future in futures:
+        try:
+            response = future.result(timeout=10)
+            assert extract_veo_video_b64(response) == server.clip_b64
+            done += 1
+        except (VeoOperationError, CircuitOpenError):
+            failed += 1
+
+    print(f"{n_ops} operation: {done} ok, {failed} fallite, 1 annullata={cancelled.cancelled()} "
+          f"in {time.perf_counter() - start:.2f}s ({poller.polls} poll)")
+    poller.shutdown()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=2.0, help="Secondi prima che un'operation sia done")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--clip", type=Path, help="MP4 da ritornare (default: header canned)")
+    parser.add_argument("--selftest", action="store_true")
+    args = parser.parse_args()
+
+    if args.selftest:
+        selftest()
+        return
+
+    clip = args.clip.read_bytes() if args.clip else DEFAULT_CLIP
+    server = FakeVeoOperationsServer(args.port, args.latency, args.jitter, args.failure_rate, clip)
+    print(f"Fake Veo operations server: {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
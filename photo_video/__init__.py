@@ -0,0 +1,6 @@
+"""
+Pipeline Photo-to-Video senza UI: storia Gemini, clip Veo/fallback, merge, job.
+
+app.py (Streamlit) e batch_render.py (CLI) la usano; qui streamlit non viene
+mai importato.
+"""
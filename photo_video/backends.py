@@ -0,0 +1,557 @@
+"""
+Backend esterni: import lazy degli SDK, client Gemini/Vertex condivisi,
+rate limit, retry e circuit breaker, latenze osservate di Veo.
+"""
+
+from __future__ import annotations
+
+import sys
+import importlib.util
+import random
+import asyncio
+import time
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Dict, Optional
+
+from .config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, GCP_LOCATION, GCP_PROJECT_ID, GEMINI_API_KEY,
+    GEMINI_REQUESTS_PER_MINUTE, HEDGE_MIN_SAMPLES, RETRY_BASE_DELAY, RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY, STORY_MODEL, VEO_MAX_IN_FLIGHT, VEO_REQUESTS_PER_MINUTE,
+)
+from .telemetry import METRICS, current_events
+
+# ============================================================================
+# BACKEND LAZY: import pesanti al primo uso, non all'avvio
+# ============================================================================
+
+def backend_available(module: str) -> bool:
+    """Il modulo è installato? find_spec non esegue il backend (né i suoi import)."""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+class LazyModule:
+    """
+    Proxy di un modulo importato al primo accesso a un attributo, sotto lock.
+
+    A differenza di importlib LazyLoader non mette in sys.modules un modulo
+    a metà: più thread che toccano il backend insieme (pool di scene, album
+    in parallelo) aspettano il primo import invece di vedere attributi
+    mancanti. Le annotazioni non vengono valutate (`from __future__ import
+    annotations`), quindi `np.ndarray` nelle firme non forza il caricamento.
+    """
+
+    def __init__(self, module: str):
+        self._name = module
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+def lazy_import(module: str):
+    """Modulo già caricato, o proxy che lo importa al primo uso (ImportError se non installato)."""
+    if module in sys.modules:
+        return sys.modules[module]
+    if not backend_available(module):
+        raise ImportError(f"{module} non installato")
+    return LazyModule(module)
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+# Google AI (~1s di import) e Vertex AI (~1-3s): rilevati qui, importati al primo client
+GEMINI_AVAILABLE = backend_available("google.generativeai")
+VERTEX_AVAILABLE = backend_available("google.cloud.aiplatform_v1")
+
+_GENAI = None
+_GENAI_LOCK = threading.Lock()
+
+def gemini_sdk():
+    """google.generativeai importato e configurato una volta per processo."""
+    global _GENAI
+    with _GENAI_LOCK:
+        if _GENAI is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            _GENAI = genai
+        return _GENAI
+
+# ============================================================================
+# SETUP APIs
+# ============================================================================
+
+def setup_gemini_api():
+    """Setup Gemini per storyboarding."""
+    if not GEMINI_API_KEY:
+        current_events().error("❌ GEMINI_API_KEY mancante!")
+        return False
+    if not GEMINI_AVAILABLE:
+        current_events().error("❌ google-generativeai non installato")
+        return False
+    # SDK importato e configurato al primo client (gemini_sdk), non a ogni rerun
+    return True
+
+def setup_vertex_ai():
+    """Setup Vertex AI per Veo 2."""
+    events = current_events()
+    if not GCP_PROJECT_ID:
+        events.error("❌ GCP_PROJECT_ID mancante! Serve per Veo 2")
+        events.info("Aggiungi a secrets.toml: GCP_PROJECT_ID = 'your-project-id'")
+        return False
+
+    if not VERTEX_AVAILABLE:
+        events.error("❌ google-cloud-aiplatform non installato")
+        return False
+
+    # Progetto e location vanno direttamente ai client (gapic / REST): niente
+    # aiplatform.init, che importerebbe l'SDK completo a ogni avvio
+    events.success(f"✅ Vertex AI setup: {GCP_PROJECT_ID} @ {GCP_LOCATION}")
+    return True
+
+# ============================================================================
+# CLIENT REGISTRY: client Vertex/Gemini condivisi dal processo
+# ============================================================================
+
+class ClientRegistry:
+    """
+    Client API creati lazy, una volta per processo, thread-safe.
+
+    Riusati tra scene e sessioni Streamlit (niente nuovi canali gRPC, TLS e
+    token per ogni chiamata). Se un canale risulta non sano il client viene
+    scartato e ricreato alla richiesta successiva.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._warmed = False
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = factory()
+            return self._clients[name]
+
+    def prediction_client(self):
+        """PredictionServiceClient Vertex AI (gRPC) per Veo."""
+        def create():
+            # Solo il client v1 (lo stesso di aiplatform.gapic), non l'SDK aiplatform completo
+            from google.cloud.aiplatform_v1 import PredictionServiceClient
+            return PredictionServiceClient(
+                client_options={"api_endpoint": f"{GCP_LOCATION}-aiplatform.googleapis.com"}
+            )
+        return self._get("prediction", create)
+
+    def gemini_model(self, model_name: str = STORY_MODEL):
+        return self._get(f"gemini:{model_name}", lambda: gemini_sdk().GenerativeModel(model_name))
+
+    def invalidate(self, name: str) -> None:
+        """
+        Scarta un client (verrà ricreato al prossimo uso).
+
+        Il trasporto non viene chiuso: altre scene possono avere chiamate in
+        volo sullo stesso client. Il canale si chiude da solo quando l'ultima
+        chiamata rilascia il riferimento.
+        """
+        with self._lock:
+            self._clients.pop(name, None)
+
+    def report_error(self, name: str, error: Exception) -> None:
+        """Ricrea il client se il canale non è sano (UNAVAILABLE), non per timeout o errori applicativi."""
+        if _is_unhealthy_channel_error(error):
+            self.invalidate(name)
+
+    def warm_up(self, timeout: float = 10) -> None:
+        """Crea i client e apre il canale gRPC in anticipo (idempotente)."""
+        if self._warmed:
+            return
+        self._warmed = True
+        try:
+            if GEMINI_API_KEY:
+                self.gemini_model(STORY_MODEL)
+            if VERTEX_AVAILABLE and GCP_PROJECT_ID:
+                import grpc
+                channel = self.prediction_client().transport.grpc_channel
+                grpc.channel_ready_future(channel).result(timeout=timeout)
+        except Exception:
+            self._warmed = False
+
+def _is_unhealthy_channel_error(error: Exception) -> bool:
+    """
+    Canale irraggiungibile (UNAVAILABLE) o già chiuso. Un DEADLINE_EXCEEDED
+    (es. generazione Veo lenta) non dice nulla sul canale.
+    """
+    try:
+        from google.api_core import exceptions as api_exceptions
+        if isinstance(error, api_exceptions.ServiceUnavailable):
+            return True
+    except ImportError:
+        pass
+    try:
+        import grpc
+        if isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.UNAVAILABLE:
+            return True
+    except ImportError:
+        pass
+    return isinstance(error, ValueError) and "closed channel" in str(error)
+
+CLIENTS = ClientRegistry()
+
+# ============================================================================
+# RESILIENZA: rate limit, retry con backoff, circuit breaker
+# ============================================================================
+
+class CircuitOpenError(RuntimeError):
+    """Backend in modalità fallback: la chiamata non viene nemmeno tentata."""
+
+class VeoClipError(RuntimeError):
+    """Clip Veo corrotto o troncato (base64 o container non validi): errore ritentabile."""
+
+class VeoOperationError(RuntimeError):
+    """Operation Veo terminata con errore (o senza video); `code` = status gRPC dell'errore."""
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+class TokenBucket:
+    """Token bucket condiviso dal processo, tarato sulla quota del progetto."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 6)))
+        self.tokens = self.capacity
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocca finché c'è un token; ritorna i secondi di attesa."""
+        waited = 0.0
+        while delay := self._take(waited):
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    async def acquire_async(self) -> float:
+        """Come `acquire`, ma attende con asyncio.sleep (non occupa thread dell'event loop)."""
+        waited = 0.0
+        while delay := self._take(waited):
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+    def _take(self, waited: float) -> float:
+        """Consuma un token (0) o ritorna i secondi da attendere prima di riprovare."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            if waited:
+                self.throttled += 1
+            return 0.0
+
+class CircuitBreaker:
+    """
+    closed → open dopo N fallimenti consecutivi (errori transitori o quota,
+    a retry esauriti); gli errori fatali riguardano la singola richiesta
+    (prompt rifiutato, input invalido) e non contano.
+    open → half_open dopo `reset_seconds`, dove una sola chiamata di prova
+    decide se richiudere. Condiviso da tutte le sessioni del processo.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, kind: str) -> None:
+        with self._lock:
+            if kind == "fatal":
+                # Il backend ha risposto: la prova in half_open passa alla prossima chiamata
+                self._probe_in_flight = False
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+GRPC_RESOURCE_EXHAUSTED = 8
+
+def classify_error(error: Exception) -> str:
+    """
+    'retryable' (transitorio), 'quota' (429 / RESOURCE_EXHAUSTED, ritenta
+    con più attesa) o 'fatal' (credenziali, permessi, richiesta invalida...).
+
+    Solo tipi di eccezione e status code: un "429" nel testo (es. un id)
+    non è una quota esaurita.
+    """
+    try:
+        from google.api_core import exceptions as api_exceptions
+        if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+            return "quota"
+        if isinstance(error, (api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError,
+                              api_exceptions.DeadlineExceeded, api_exceptions.Aborted,
+                              api_exceptions.BadGateway, api_exceptions.GatewayTimeout)):
+            return "retryable"
+        if isinstance(error, api_exceptions.GoogleAPICallError):
+            return "fatal"
+    except ImportError:
+        pass
+
+    try:
+        import requests
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            if status == 429:
+                return "quota"
+            return "retryable" if status >= 500 else "fatal"
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return "retryable"
+    except ImportError:
+        pass
+
+    # HTTP 429 (SDK genai, urllib) o status gRPC RESOURCE_EXHAUSTED (operation Veo)
+    code = getattr(error, 'code', None)
+    if code == 429 or (isinstance(error, VeoOperationError) and code == GRPC_RESOURCE_EXHAUSTED):
+        return "quota"
+    if isinstance(error, (ConnectionError, TimeoutError, VeoOperationError, VeoClipError)):
+        return "retryable"
+    return "fatal"
+
+class ServiceGuard:
+    """Rate limiter + retry con backoff esponenziale (jitter) + circuit breaker per un backend."""
+
+    def __init__(self, name: str, requests_per_minute: float, max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 max_in_flight: int = 0):
+        self.name = name
+        self.limiter = TokenBucket(requests_per_minute)
+        self.set_max_in_flight(max_in_flight)
+        self.breaker = CircuitBreaker(name)
+        self.max_attempts = max(1, max_attempts)
+        self.calls = 0
+        self.retries = 0
+        self.errors = {"retryable": 0, "quota": 0, "fatal": 0}
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[[], object], rate_limited: bool = True):
+        """
+        Esegue `fn` con quota, retry e breaker.
+
+        Raises:
+            CircuitOpenError se il backend è in modalità fallback,
+            altrimenti l'ultimo errore dopo i retry
+        """
+        self._check_breaker()
+
+        for attempt in range(self.max_attempts):
+            if rate_limited:
+                self.limiter.acquire()
+            try:
+                result = self._attempt(fn)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, fn: Callable[[], object], rate_limited: bool = True,
+                         executor: Optional[ThreadPoolExecutor] = None):
+        """
+        `call` per un event loop: attese di quota e backoff con asyncio.sleep,
+        solo `fn` (bloccante) gira su `executor` (default: quello del loop).
+        """
+        self._check_breaker()
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_attempts):
+            if rate_limited:
+                await self.limiter.acquire_async()
+            try:
+                result = await loop.run_in_executor(executor, self._attempt, fn)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def _check_breaker(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}: circuito aperto, uso il fallback")
+
+    def _attempt(self, fn: Callable[[], object]):
+        with self._lock:
+            self.calls += 1
+        with self._slots or nullcontext():
+            return fn()
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Secondi prima del prossimo tentativo, o None se l'errore va rilanciato."""
+        kind = classify_error(error)
+        with self._lock:
+            self.errors[kind] += 1
+        if kind == "fatal" or attempt == self.max_attempts - 1:
+            self.breaker.record_failure(kind)
+            return None
+        with self._lock:
+            self.retries += 1
+        # Full jitter; la quota merita un'attesa più lunga
+        cap = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt) * (3 if kind == "quota" else 1))
+        return random.uniform(cap / 2, cap)
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        """Limite globale di chiamate contemporanee (0 = solo quota); es. batch con molti album."""
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+
+    def record_retry(self, error: Exception) -> None:
+        """Errore ritentato fuori da `call` (es. clip di un'operation da rigenerare)."""
+        with self._lock:
+            self.errors[classify_error(error)] += 1
+            self.retries += 1
+
+    def record_outcome(self, error: Optional[Exception]) -> None:
+        """Esito di un lavoro asincrono (es. operation Veo) per il breaker."""
+        if error is None:
+            self.breaker.record_success()
+            return
+        kind = classify_error(error)
+        with self._lock:
+            self.errors[kind] += 1
+        self.breaker.record_failure(kind)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "breaker_state": self.breaker.state,
+                "breaker_trips": self.breaker.trips,
+                "breaker_rejected": self.breaker.rejected,
+                "calls": self.calls,
+                "max_in_flight": self.max_in_flight,
+                "retries": self.retries,
+                "throttled": self.limiter.throttled,
+                "errors": dict(self.errors),
+            }
+
+VEO_GUARD = ServiceGuard("veo", VEO_REQUESTS_PER_MINUTE, max_in_flight=VEO_MAX_IN_FLIGHT)
+GEMINI_GUARD = ServiceGuard("gemini", GEMINI_REQUESTS_PER_MINUTE)
+
+def resilience_metrics() -> Dict:
+    return {guard.name: guard.metrics() for guard in (VEO_GUARD, GEMINI_GUARD)}
+
+# ============================================================================
+# LATENZE VEO: base delle deadline di hedging e delle stime di risparmio
+# ============================================================================
+
+class LatencyTracker:
+    """
+    Latenze recenti (finestra scorrevole) delle chiamate Veo riuscite,
+    registrate da generate_veo_clip: clip dalla cache esclusi.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentile p (0-100); None finché i campioni sono troppo pochi."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            return float(np.percentile(list(self._samples), p))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "p50": float(np.percentile(samples, 50)),
+            "p90": float(np.percentile(samples, 90)),
+            "max": max(samples),
+        }
+
+VEO_LATENCY = LatencyTracker()
+
+def backend_metrics() -> Iterable[tuple]:
+    """Metriche lette al momento dell'export: quota/retry/breaker e latenze Veo."""
+    for name, m in resilience_metrics().items():
+        yield "pipeline_service_calls_total", "counter", {"service": name}, m['calls']
+        yield "pipeline_service_retries_total", "counter", {"service": name}, m['retries']
+        yield "pipeline_service_throttled_total", "counter", {"service": name}, m['throttled']
+        for kind, count in m['errors'].items():
+            yield "pipeline_service_errors_total", "counter", {"service": name, "kind": kind}, count
+        yield "pipeline_breaker_open", "gauge", {"service": name}, int(m['breaker_state'] != "closed")
+        yield "pipeline_breaker_trips_total", "counter", {"service": name}, m['breaker_trips']
+
+    latency = VEO_LATENCY.stats()
+    if latency['samples']:
+        for quantile in ("p50", "p90"):
+            yield "pipeline_veo_latency_seconds", "gauge", {"quantile": f"0.{quantile[1:]}"}, latency[quantile]
+
+METRICS.add_collector(backend_metrics)
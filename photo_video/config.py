@@ -0,0 +1,173 @@
+"""
+Configurazione della pipeline: chiavi API, cartelle, limiti e preset di stile.
+
+Tutto da variabili d'ambiente; sotto `streamlit run` le chiavi arrivano da
+st.secrets. streamlit non viene importato qui: la CLI batch e i test non
+pagano il suo import (~0.3s).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+import tempfile
+
+# ============================================================================
+# CONFIGURAZIONE
+# ============================================================================
+
+# API Keys (st.secrets solo se la UI ha già importato streamlit)
+try:
+    st = sys.modules["streamlit"]
+    GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
+    GCP_PROJECT_ID = st.secrets.get("GCP_PROJECT_ID", "")
+    GCP_LOCATION = st.secrets.get("GCP_LOCATION", "us-central1")
+except:
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID', '')
+    GCP_LOCATION = os.getenv('GCP_LOCATION', 'us-central1')
+
+# Folders
+UPLOAD_FOLDER = Path(tempfile.gettempdir()) / "photo_video_uploads"
+OUTPUT_FOLDER = Path(tempfile.gettempdir()) / "photo_video_outputs"
+TEMP_FOLDER = Path(tempfile.gettempdir()) / "photo_video_temp"
+CACHE_FOLDER = Path(tempfile.gettempdir()) / "photo_video_cache"
+
+_READY_FOLDERS = set()
+
+def ensure_folder(folder: Path) -> Path:
+    """Crea la cartella al primo uso (non all'import: CLI e test non toccano /tmp)."""
+    if folder not in _READY_FOLDERS:
+        folder.mkdir(exist_ok=True, parents=True)
+        _READY_FOLDERS.add(folder)
+    return folder
+
+# Video settings
+MIN_PHOTOS = 3
+MAX_PHOTOS = int(os.getenv('MAX_PHOTOS', '200'))  # Oltre STORY_CHUNK_SIZE: storyboard a capitoli
+CLIP_DURATION = 5  # Veo 2 genera 5 secondi
+VIDEO_FPS = 24
+VEO_ASPECT_RATIO = "16:9"
+
+# Immagine di riferimento Veo: lato lungo, budget byte, crop o letterbox
+VEO_INPUT_LONG_SIDE = 1280
+VEO_REFERENCE_MAX_BYTES = int(os.getenv('VEO_REFERENCE_MAX_KB', '600')) * 1024
+VEO_REFERENCE_FIT = os.getenv('VEO_REFERENCE_FIT', 'crop')  # 'crop' | 'letterbox'
+
+# Rendition in memoria per sessione (preview UI, input Gemini)
+PREVIEW_IMAGE_SIZE = (512, 512)
+PREVIEW_PAGE_SIZE = 24  # Anteprime per pagina: con centinaia di foto si decodifica solo la pagina visibile
+GEMINI_IMAGE_SIZE = (1024, 1024)
+IMAGE_STORE_MAX_BYTES = int(os.getenv('IMAGE_STORE_MAX_MB', '128')) * 1024 * 1024
+
+# Foto quasi duplicate (raffiche): dHash a 64 bit, distanza di Hamming massima nel gruppo;
+# del gruppo resta la foto più nitida/meglio esposta
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '1') == '1'
+DEDUP_MAX_DISTANCE = int(os.getenv('DEDUP_MAX_DISTANCE', '8'))
+DEDUP_HASH_SIZE = 8
+DEDUP_QUALITY_SIZE = (256, 256)
+VEO_SCENE_SECONDS_ESTIMATE = float(os.getenv('VEO_SCENE_SECONDS_ESTIMATE', '60'))  # risparmio stimato finché mancano latenze
+
+# Fallback FFmpeg (Ken Burns): pool di encoder dimensionato sui core
+FALLBACK_OUTPUT_SIZE = (1280, 720)
+FALLBACK_X264_THREADS = int(os.getenv('FALLBACK_X264_THREADS', '2'))
+FALLBACK_JOB_TIMEOUT = float(os.getenv('FALLBACK_JOB_TIMEOUT', '60'))
+
+# Merge: crossfade reali tra le scene (ricodifica tutto in un solo passaggio)
+MERGE_CROSSFADE = os.getenv('MERGE_CROSSFADE', '0') == '1'
+CROSSFADE_SECONDS = 0.5
+
+# Job in background: stato persistente su SQLite, pool di worker limitato
+JOBS_DB_PATH = Path(os.getenv('JOBS_DB_PATH', str(Path(tempfile.gettempdir()) / "photo_video_jobs.sqlite3")))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = 60  # job 'running' senza heartbeat → processo morto, si riprende
+JOB_POLL_SECONDS = 3
+
+# Output progressivo: playlist HLS in OUTPUT_FOLDER aggiornata a ogni scena
+PROGRESSIVE_OUTPUT = os.getenv('PROGRESSIVE_OUTPUT', '1') == '1'
+
+# Risposte Veo: base64 decodificato a blocchi direttamente su file, poi container e durata
+# validati; un clip corrotto o troncato è ritentato come un errore transitorio
+VEO_DECODE_CHUNK_BYTES = int(os.getenv('VEO_DECODE_CHUNK_KB', '1024')) * 1024
+VEO_MIN_CLIP_SECONDS = float(os.getenv('VEO_MIN_CLIP_SECONDS', '1'))
+
+# Veo come long-running operation: submit + polling asyncio (nessun thread bloccato)
+VEO_USE_OPERATIONS = os.getenv('VEO_USE_OPERATIONS', '0') == '1'
+VEO_API_BASE = os.getenv('VEO_API_BASE', '')  # es. fake server locale; default: endpoint Vertex
+VEO_MAX_OPERATIONS = int(os.getenv('VEO_MAX_OPERATIONS', '8'))
+VEO_POLL_INITIAL_SECONDS = float(os.getenv('VEO_POLL_INITIAL_SECONDS', '5'))
+VEO_POLL_MAX_SECONDS = 30.0
+VEO_OPERATION_TIMEOUT = float(os.getenv('VEO_OPERATION_TIMEOUT', '600'))
+
+# Resilienza Veo/Gemini: quota del progetto, retry con backoff, circuit breaker
+VEO_REQUESTS_PER_MINUTE = float(os.getenv('VEO_REQUESTS_PER_MINUTE', '10'))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '30'))
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 30.0
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '120'))
+VEO_MAX_IN_FLIGHT = int(os.getenv('VEO_MAX_IN_FLIGHT', '0'))  # chiamate Veo contemporanee nel processo (0 = nessun limite)
+
+# Hedging: oltre il percentile di latenza Veo parte il fallback speculativo;
+# alla deadline del run si committa il fallback (worst case limitato)
+HEDGING_ENABLED = os.getenv('HEDGING_ENABLED', '1') == '1'
+HEDGE_LATENCY_PERCENTILE = float(os.getenv('HEDGE_LATENCY_PERCENTILE', '90'))
+HEDGE_DEFAULT_AFTER_SECONDS = float(os.getenv('HEDGE_DEFAULT_AFTER_SECONDS', '90'))  # finché mancano campioni
+HEDGE_MIN_SAMPLES = 5
+RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '600'))
+
+# Client API condivisi: warm-up all'avvio (gRPC + token) opzionale
+WARM_UP_CLIENTS = os.getenv('WARM_UP_CLIENTS', '0') == '1'
+
+# Concorrenza: max richieste Veo in volo contemporaneamente
+MAX_CONCURRENT_SCENES = int(os.getenv('MAX_CONCURRENT_SCENES', '3'))
+
+# Cache clip Veo (LRU su disco)
+CLIP_CACHE_MAX_BYTES = int(os.getenv('CLIP_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Cache storyboard Gemini
+STORY_CACHE_TTL_SECONDS = float(os.getenv('STORY_CACHE_TTL_HOURS', '24')) * 3600
+STORY_CACHE_MAX_ENTRIES = int(os.getenv('STORY_CACHE_MAX_ENTRIES', '500'))
+
+# Storyboard in streaming: le scene partono mentre Gemini scrive le successive
+STORY_STREAMING = os.getenv('STORY_STREAMING', '1') == '1'
+
+# Album grandi: capitoli da max STORY_CHUNK_SIZE foto (una richiesta Gemini ciascuno) in
+# parallelo, poi una richiesta di solo testo che li unisce in un unico arco narrativo
+STORY_CHUNK_SIZE = int(os.getenv('STORY_CHUNK_SIZE', '8'))
+STORY_CHUNK_CONCURRENCY = int(os.getenv('STORY_CHUNK_CONCURRENCY', '4'))
+
+# Metriche: endpoint Prometheus locale e/o file (textfile collector), trace JSON per run
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 = nessun endpoint HTTP
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+TRACE_DIR = os.getenv('TRACE_DIR', '')  # vuoto = nessun trace
+
+# Video serviti per riferimento (HTTP Range) invece che copiati in ogni sessione.
+# Spento di default (st.video dal path); vedi media_server_port()
+MEDIA_SERVER_PORT = os.getenv('MEDIA_SERVER_PORT', '')  # porta esplicita, 0 = effimera
+MEDIA_BIND_ADDRESS = os.getenv('MEDIA_BIND_ADDRESS', '127.0.0.1')
+MEDIA_PUBLIC_URL = os.getenv('MEDIA_PUBLIC_URL', '')  # URL visto dal browser (es. reverse proxy)
+MEDIA_DEFAULT_PORT = 8765  # con MEDIA_PUBLIC_URL e senza MEDIA_SERVER_PORT
+
+# Disco: una cartella per run in upload/temp/output, quota e TTL per cartella, sweeper periodico
+UPLOAD_QUOTA_BYTES = int(os.getenv('UPLOAD_QUOTA_MB', '1024')) * 1024 * 1024
+TEMP_QUOTA_BYTES = int(os.getenv('TEMP_QUOTA_MB', '4096')) * 1024 * 1024
+OUTPUT_QUOTA_BYTES = int(os.getenv('OUTPUT_QUOTA_MB', '4096')) * 1024 * 1024
+UPLOAD_TTL_SECONDS = float(os.getenv('UPLOAD_TTL_HOURS', '24')) * 3600
+TEMP_TTL_SECONDS = float(os.getenv('TEMP_TTL_HOURS', '6')) * 3600
+OUTPUT_TTL_SECONDS = float(os.getenv('OUTPUT_TTL_HOURS', '48')) * 3600
+STORAGE_SWEEP_SECONDS = float(os.getenv('STORAGE_SWEEP_SECONDS', '300'))
+
+STORY_MODEL = 'gemini-2.5-pro'
+VEO_MODEL = 'veo-2'
+
+STYLE_PRESETS = {
+    "Cinematic Adventure": "Epic cinematic adventure with dramatic camera movements and heroic atmosphere",
+    "Dreamy Memories": "Soft dreamy memories with gentle movements and nostalgic warm atmosphere",
+    "Urban Journey": "Modern urban exploration with dynamic street energy and city vibes",
+    "Nature Documentary": "Natural documentary style with serene landscapes and organic flow",
+    "Artistic Story": "Creative artistic narrative with bold experimental visual storytelling"
+}
@@ -0,0 +1,431 @@
+"""
+Job in background: coda SQLite e pool di worker, fuori dallo script Streamlit.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Dict, Optional
+
+from .config import (
+    JOB_HEARTBEAT_SECONDS, JOB_STALE_SECONDS, JOB_WORKERS, MERGE_CROSSFADE, PROGRESSIVE_OUTPUT,
+    STORY_STREAMING,
+)
+from .telemetry import (
+    METRICS, PipelineEvents, RunTrace, current_events, events_scope, span, trace_scope,
+)
+from .storage import STORAGE, run_scope
+from .photos import ImageStore, image_store_scope
+from .story import StoryStream, create_story_from_photos, resolve_scene_photo_index
+from .render import ProgressiveOutput, merge_videos_ffmpeg
+from .pipeline import generate_scenes, report_run_metrics
+
+# ============================================================================
+# JOB IN BACKGROUND (SQLite + pool di worker, fuori dallo script Streamlit)
+# ============================================================================
+
+class JobStore:
+    """
+    Stato persistente dei job photo→video su SQLite.
+
+    Una riga per job (stato, input, storia, output) e una per scena (stato,
+    clip), così un job interrotto riprende dalle scene già completate.
+    Una connessione per operazione: sicuro tra thread e processi (WAL).
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    style TEXT NOT NULL,
+                    photo_paths TEXT NOT NULL,
+                    use_veo INTEGER NOT NULL,
+                    story TEXT,
+                    output_path TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    heartbeat REAL
+                );
+                CREATE TABLE IF NOT EXISTS scenes (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    clip_path TEXT,
+                    updated REAL NOT NULL,
+                    scene TEXT,
+                    PRIMARY KEY (job_id, idx)
+                );
+            """)
+            # DB creati prima dello storyboard in streaming: scena salvata appena letta dallo stream
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(scenes)")}
+            if 'scene' not in columns:
+                conn.execute("ALTER TABLE scenes ADD COLUMN scene TEXT")
+
+    @contextmanager
+    def _connect(self):
+        """Connessione per una transazione: commit/rollback all'uscita, poi chiusa."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # il context manager di sqlite3 fa solo commit/rollback, non chiude
+                yield conn
+        finally:
+            conn.close()
+
+    def create_job(self, photo_paths: List[Path], style: str, use_veo: bool, job_id: Optional[str] = None) -> str:
+        """`job_id`: id del run che ha già salvato gli upload (cartelle condivise con il job)."""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, style, photo_paths, use_veo, created, updated) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, style, json.dumps([str(p) for p in photo_paths]), int(use_veo), now, now)
+            )
+        return job_id
+
+    def claim(self, job_id: str) -> bool:
+        """Passa il job a 'running' se è in coda o abbandonato (heartbeat scaduto)."""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', heartbeat = ?, updated = ? "
+                "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND "
+                "(heartbeat IS NULL OR heartbeat < ?)))",
+                (now, now, job_id, now - JOB_STALE_SECONDS)
+            )
+            return cur.rowcount == 1
+
+    def heartbeat(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+
+    def active_job_ids(self) -> List[str]:
+        """Job in coda o in corso: i loro file sono protetti dallo sweeper."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [row['id'] for row in rows]
+
+    def resumable_jobs(self) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND "
+                "(heartbeat IS NULL OR heartbeat < ?)) ORDER BY created",
+                (time.time() - JOB_STALE_SECONDS,)
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def set_story(self, job_id: str, story: Dict) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET story = ?, updated = ? WHERE id = ?",
+                         (json.dumps(story, ensure_ascii=False), now, job_id))
+            conn.executemany(
+                "INSERT OR IGNORE INTO scenes (job_id, idx, status, updated) VALUES (?, ?, 'pending', ?)",
+                [(job_id, i, now) for i in range(len(story.get('scenes', [])))]
+            )
+
+    def set_scene(self, job_id: str, idx: int, status: str, clip_path: Optional[Path] = None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            # Upsert: con lo storyboard in streaming la scena può precedere set_story
+            conn.execute(
+                "INSERT INTO scenes (job_id, idx, status, clip_path, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (job_id, idx) DO UPDATE SET "
+                "status = excluded.status, clip_path = excluded.clip_path, updated = excluded.updated",
+                (job_id, idx, status, str(clip_path) if clip_path else None, now)
+            )
+            conn.execute("UPDATE jobs SET heartbeat = ?, updated = ? WHERE id = ?", (now, now, job_id))
+
+    def add_stream_scene(self, job_id: str, idx: int, scene: Dict, fields: Dict[str, str]) -> None:
+        """
+        Scena appena letta dallo storyboard in streaming, più i campi già noti
+        (titolo, ...) come storia parziale: un job interrotto riparte da qui
+        invece di chiedere a Gemini una storia nuova.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO scenes (job_id, idx, status, scene, updated) VALUES (?, ?, 'pending', ?, ?) "
+                "ON CONFLICT (job_id, idx) DO UPDATE SET scene = excluded.scene, updated = excluded.updated",
+                (job_id, idx, json.dumps(scene, ensure_ascii=False), now)
+            )
+            conn.execute("UPDATE jobs SET story = ?, heartbeat = ?, updated = ? WHERE id = ?",
+                         (json.dumps(dict(fields, partial=True), ensure_ascii=False), now, now, job_id))
+
+    def cancel(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+
+    def finish(self, job_id: str, output_path: Optional[Path], error: Optional[str] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, output_path = ?, error = ?, updated = ? "
+                "WHERE id = ? AND status != 'cancelled'",
+                ('done' if output_path else 'failed', str(output_path) if output_path else None,
+                 error, time.time(), job_id)
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            scenes = conn.execute(
+                "SELECT idx, status, clip_path, scene FROM scenes WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+
+        job = dict(row)
+        job['photo_paths'] = [Path(p) for p in json.loads(job['photo_paths'])]
+        job['story'] = json.loads(job['story']) if job['story'] else None
+        job['scenes'] = [dict(scene) for scene in scenes]
+
+        # Storia parziale (streaming interrotto): le scene salvate, in ordine e senza buchi
+        if job['story'] and job['story'].get('partial'):
+            parsed = []
+            for scene in job['scenes']:
+                if scene['idx'] != len(parsed) or not scene['scene']:
+                    break
+                parsed.append(json.loads(scene['scene']))
+            job['story']['scenes'] = parsed
+        for scene in job['scenes']:
+            del scene['scene']
+        return job
+
+class JobOutput:
+    """
+    Video di un job: come la pipeline interattiva, ogni scena finita entra in
+    ProgressiveOutput (playlist HLS + MP4 finale in stream copy); merge
+    classico se l'output progressivo è disattivato o fallisce.
+    """
+
+    def __init__(self):
+        self.enabled = PROGRESSIVE_OUTPUT and not MERGE_CROSSFADE
+        self.progressive: Optional[ProgressiveOutput] = None
+
+    def add(self, index: int, clip: Optional[Path], title: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            if self.progressive is None:
+                self.progressive = ProgressiveOutput(title)
+            self.progressive.add(index, clip)
+        except Exception as e:
+            current_events().warning(f"⚠️ Output progressivo disattivato: {e}")
+            self.enabled, self.progressive = False, None
+
+    def finish(self, clips: List[Optional[Path]], story: Dict) -> Optional[Path]:
+        if not any(clips):
+            return None
+        if self.progressive is not None:
+            try:
+                final_video = self.progressive.finalize()
+                if final_video:
+                    return final_video
+            except Exception as e:
+                current_events().warning(f"⚠️ Remux progressivo fallito, merge classico: {e}")
+        return merge_videos_ffmpeg(clips, story)
+
+def run_job(store: JobStore, job_id: str, cancel_event: Optional[threading.Event] = None) -> Optional[Path]:
+    """Esegue (o riprende) un job: storia, scene mancanti, merge."""
+    job = store.get_job(job_id)
+    photo_paths, style = job['photo_paths'], job['style']
+
+    stop_heartbeat = threading.Event()
+
+    def beat():
+        while not stop_heartbeat.wait(JOB_HEARTBEAT_SECONDS):
+            store.heartbeat(job_id)
+
+    threading.Thread(target=beat, name=f"job-heartbeat-{job_id[:8]}", daemon=True).start()
+
+    try:
+        # Storia: riusata se il job è ripreso dopo un restart (completata se lo stream si era interrotto)
+        story = job['story']
+        if story and story.get('partial'):
+            story = complete_partial_story(photo_paths, style, story)
+            store.set_story(job_id, story)
+            job = store.get_job(job_id)
+        if not story and STORY_STREAMING:
+            return _run_job_streaming(store, job_id, job, cancel_event)
+        if not story:
+            story = create_story_from_photos(photo_paths, style)
+            if not story or not story.get('scenes'):
+                store.finish(job_id, None, "Storia fallita")
+                return None
+            store.set_story(job_id, story)
+            job = store.get_job(job_id)
+
+        scenes = story['scenes']
+        clips: List[Optional[Path]] = [None] * len(scenes)
+        for row in job['scenes']:
+            if row['status'] == 'done' and row['clip_path'] and Path(row['clip_path']).exists():
+                clips[row['idx']] = Path(row['clip_path'])
+
+        pending = [i for i in range(len(scenes)) if clips[i] is None]
+
+        # Scene già pronte (job ripreso) subito nell'output, le altre man mano
+        output = JobOutput()
+        for i, clip in enumerate(clips):
+            if clip:
+                output.add(i, clip, story.get('title', style))
+
+        def on_scene_done(k: int, scene: Dict, clip: Optional[Path]) -> None:
+            store.set_scene(job_id, pending[k], 'done' if clip else 'failed', clip)
+            output.add(pending[k], clip, story.get('title', style))
+
+        # photo_index risolto sull'indice originale della scena (il sottoinsieme cambia le posizioni)
+        results = generate_scenes(
+            photo_paths,
+            [dict(scenes[i], photo_index=resolve_scene_photo_index(len(photo_paths), scenes[i], i)) for i in pending],
+            style,
+            use_veo=bool(job['use_veo']),
+            on_scene_done=on_scene_done,
+            cancel_event=cancel_event
+        )
+        for i, clip in zip(pending, results):
+            clips[i] = clip
+
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        final_video = output.finish(clips, story)
+        store.finish(job_id, final_video, None if final_video else "Nessun video generato")
+        return final_video
+
+    except Exception as e:
+        store.finish(job_id, None, str(e))
+        return None
+    finally:
+        stop_heartbeat.set()
+
+def complete_partial_story(photo_paths: List[Path], style: str, partial: Dict) -> Dict:
+    """
+    Storia di un job interrotto durante lo streaming: le scene già salvate
+    restano (stessi indici, stesse chiavi di cache dei clip), Gemini scrive
+    solo le scene delle foto non ancora coperte.
+    """
+    story = {k: v for k, v in partial.items() if k != 'partial'}
+    scenes = list(story.get('scenes', []))
+    covered = {resolve_scene_photo_index(len(photo_paths), scene, k) for k, scene in enumerate(scenes)}
+    missing = [i for i in range(len(photo_paths)) if i not in covered]
+
+    if missing:
+        current_events().info(f"📖 Ripresa: {len(scenes)} scene salvate, storia per altre {len(missing)} foto")
+        rest = create_story_from_photos([photo_paths[i] for i in missing], style)
+        for key, value in rest.items():
+            if key != 'scenes':
+                story.setdefault(key, value)
+        scenes += [
+            dict(scene, photo_index=missing[resolve_scene_photo_index(len(missing), scene, k)])
+            for k, scene in enumerate(rest.get('scenes', []))
+        ]
+
+    story['scenes'] = scenes
+    return story
+
+def _run_job_streaming(store: JobStore, job_id: str, job: Dict,
+                       cancel_event: Optional[threading.Event]) -> Optional[Path]:
+    """run_job con storyboard in streaming: scene salvate man mano, storia alla fine."""
+    photo_paths, style = job['photo_paths'], job['style']
+
+    story_stream = StoryStream(photo_paths, style)
+
+    def saved(scenes: Iterable[Dict]) -> Iterable[Dict]:
+        # Ogni scena è nel JobStore prima di partire: un restart riprende da qui
+        for i, scene in enumerate(scenes):
+            store.add_stream_scene(job_id, i, scene, story_stream.fields)
+            yield scene
+
+    output = JobOutput()
+
+    def on_scene_done(i: int, scene: Dict, clip: Optional[Path]) -> None:
+        store.set_scene(job_id, i, 'done' if clip else 'failed', clip)
+        output.add(i, clip, story_stream.fields.get('title', style))
+
+    clips = generate_scenes(
+        photo_paths,
+        saved(story_stream.scenes()),
+        style,
+        use_veo=bool(job['use_veo']),
+        on_scene_done=on_scene_done,
+        cancel_event=cancel_event
+    )
+
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+
+    story = story_stream.story
+    store.set_story(job_id, story)
+
+    clips += [None] * (len(story['scenes']) - len(clips))
+    final_video = output.finish(clips, story)
+    store.finish(job_id, final_video, None if final_video else "Nessun video generato")
+    return final_video
+
+class JobRunner:
+    """Pool limitato di worker che esegue i job fuori dal thread dello script."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="video-job")
+        self._active: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        STORAGE.pin_sources.append(store.active_job_ids)
+
+    def submit(self, photo_paths: List[Path], style: str, use_veo: bool, job_id: Optional[str] = None,
+               image_store: Optional[ImageStore] = None) -> str:
+        """`image_store`: store della sessione che ha caricato le foto (già decodificate, nessun hash da rifare)."""
+        job_id = self.store.create_job(photo_paths, style, use_veo, job_id)
+        self._dispatch(job_id, image_store)
+        return job_id
+
+    def resume_pending(self) -> None:
+        """Rimette in esecuzione i job in coda o orfani (es. dopo un restart)."""
+        for job_id in self.store.resumable_jobs():
+            self._dispatch(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        """Annulla un job: le operation Veo in volo vengono abbandonate."""
+        self.store.cancel(job_id)
+        with self._lock:
+            cancel_event = self._active.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+
+    def _dispatch(self, job_id: str, image_store: Optional[ImageStore] = None) -> None:
+        with self._lock:
+            if job_id in self._active:
+                return
+            self._active[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id, image_store)
+
+    def _run(self, job_id: str, image_store: Optional[ImageStore]) -> None:
+        try:
+            # Nessuna pagina da aggiornare: lo stato del job sta in SQLite.
+            # Nessuna sessione nel thread: lo store delle foto va passato (job ripresi: store condiviso)
+            if self.store.claim(job_id):
+                events = PipelineEvents()
+                with events_scope(events), trace_scope(RunTrace(f"job-{job_id[:8]}")) as trace, run_scope(job_id):
+                    with image_store_scope(image_store), span("job"):
+                        final_video = run_job(self.store, job_id, self._active[job_id])
+                    METRICS.inc("pipeline_runs_total", status="done" if final_video else "failed")
+                    report_run_metrics(trace, events)
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
@@ -0,0 +1,211 @@
+"""
+Media server: video serviti per riferimento, con HTTP Range (seek) e sendfile.
+"""
+
+from __future__ import annotations
+
+import os
+import hashlib
+import hmac
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from .config import MEDIA_BIND_ADDRESS, MEDIA_DEFAULT_PORT, MEDIA_PUBLIC_URL, MEDIA_SERVER_PORT
+from .telemetry import METRICS
+
+# ============================================================================
+# MEDIA SERVER: video per riferimento, con Range (seek) e sendfile
+# ============================================================================
+
+def media_server_port(port: str = MEDIA_SERVER_PORT, public_url: str = MEDIA_PUBLIC_URL) -> Optional[int]:
+    """
+    Porta su cui avviare il media server; None = spento (st.video dal path).
+
+    Spento di default: su Streamlit Cloud il browser raggiunge solo la porta
+    dell'app. Acceso con una porta esplicita (0 = effimera, per un browser
+    sulla stessa macchina) o con MEDIA_PUBLIC_URL, su MEDIA_DEFAULT_PORT.
+    ValueError se la porta non è un numero.
+    """
+    port = port.strip().lower()
+    if port in ("off", "false", "no", "-1"):
+        return None
+    if not port:
+        return MEDIA_DEFAULT_PORT if public_url else None
+    return int(port)
+
+MEDIA_TYPES = {".mp4": "video/mp4", ".ts": "video/mp2t", ".m3u8": "application/vnd.apple.mpegurl"}
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """
+    Header Range → (start, end) inclusivi; None = file intero.
+
+    Solo range singoli (`bytes=a-b`, `bytes=a-`, `bytes=-n`); un multi-range
+    viene servito come file intero, come permette la RFC 9110.
+
+    Raises:
+        ValueError se il range non è soddisfacibile (→ 416)
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"range {header} fuori da {size} byte")
+    return start, end
+
+class MediaServer:
+    """
+    Video finali e clip serviti su una porta dedicata, per riferimento.
+
+    La pagina riceve solo un URL: il browser legge il file a pezzi (seek
+    con Range) direttamente dal disco via sendfile, e Streamlit non tiene
+    una copia per sessione nel media file manager. Gli URL sono firmati
+    (HMAC del path relativo a una delle `roots`): nient'altro è servito.
+    """
+
+    def __init__(self, roots: Dict[str, Path], port: int, bind: str = MEDIA_BIND_ADDRESS,
+                 public_url: str = "", secret: bytes = b""):
+        self.roots = roots
+        self.port = port  # 0 = porta effimera, assegnata da start()
+        self.bind = bind
+        self._public_url = public_url.rstrip('/')
+        self._secret = secret or os.urandom(32)
+        self._server = None
+
+    @property
+    def public_url(self) -> str:
+        return self._public_url or f"http://localhost:{self.port}"
+
+    def _sign(self, key: str, relative: str) -> str:
+        return hmac.new(self._secret, f"{key}/{relative}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def url_for(self, path: Path, download: bool = False) -> Optional[str]:
+        """URL firmato per `path` (None se fuori dalle cartelle servite)."""
+        from urllib.parse import quote
+
+        resolved = Path(path).resolve()
+        for key, root in self.roots.items():
+            try:
+                relative = resolved.relative_to(root.resolve()).as_posix()
+            except ValueError:
+                continue
+            url = f"{self.public_url}/media/{self._sign(key, relative)}/{key}/{quote(relative)}"
+            return f"{url}?download=1" if download else url
+        return None
+
+    def resolve(self, url_path: str) -> Optional[Path]:
+        """Path locale per un URL firmato; None se firma, cartella o file non validi."""
+        from urllib.parse import unquote
+
+        parts = unquote(url_path).split("/", 4)  # '', 'media', firma, cartella, path relativo
+        if len(parts) != 5 or parts[1] != "media":
+            return None
+        _, _, token, key, relative = parts
+        root = self.roots.get(key)
+        if root is None or not hmac.compare_digest(token, self._sign(key, relative)):
+            return None
+        path = (root / relative).resolve()
+        if not path.is_relative_to(root.resolve()) or not path.is_file():
+            return None
+        return path
+
+    def start(self) -> "MediaServer":
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer((self.bind, self.port), _media_handler(self))
+        self.port = self._server.server_address[1]
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="media-http", daemon=True).start()
+        return self
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+def _media_handler(media: MediaServer):
+    from http.server import BaseHTTPRequestHandler
+
+    class MediaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: il player fa molte richieste Range
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def _serve(self, send_body: bool) -> None:
+            url_path, _, query = self.path.partition("?")
+            path = media.resolve(url_path)
+            if path is None:
+                self._reply_empty(404)
+                return
+
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                self._reply_empty(404)
+                return
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self._reply_empty(304)
+                return
+
+            try:
+                byte_range = parse_byte_range(self.headers.get("Range"), stat.st_size)
+            except ValueError:
+                self._reply_empty(416, {"Content-Range": f"bytes */{stat.st_size}"})
+                return
+
+            start, end = byte_range or (0, stat.st_size - 1)
+            length = max(0, end - start + 1)
+
+            self.send_response(206 if byte_range else 200)
+            self.send_header("Content-Type", MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream"))
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "private, max-age=3600")
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+            if "download=1" in query:
+                self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+            self.end_headers()
+            METRICS.inc("pipeline_media_requests_total", status=str(206 if byte_range else 200))
+
+            if not send_body or not length:
+                return
+            try:
+                self.wfile.flush()
+                with open(path, "rb") as f:
+                    # Zero-copy dal page cache al socket, nessun buffer Python
+                    sent = self.connection.sendfile(f, start, length)
+                METRICS.inc("pipeline_media_bytes_total", sent)
+            except (BrokenPipeError, ConnectionResetError):
+                # Normale: il player annulla le richieste Range quando fa seek
+                self.close_connection = True
+
+        def _reply_empty(self, status: int, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            METRICS.inc("pipeline_media_requests_total", status=str(status))
+
+        def log_message(self, *args):
+            pass
+
+    return MediaHandler
+
+METRICS.describe("pipeline_media_bytes_total", "counter", "Byte di video serviti dal media server")
+METRICS.describe("pipeline_media_requests_total", "counter", "Richieste al media server per status HTTP")
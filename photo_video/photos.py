@@ -0,0 +1,402 @@
+"""
+Foto in ingresso: riferimento Veo, image store per sessione, quasi duplicati e selezione.
+"""
+
+from __future__ import annotations
+
+import io
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional
+
+from .config import (
+    DEDUP_ENABLED, DEDUP_HASH_SIZE, DEDUP_MAX_DISTANCE, DEDUP_QUALITY_SIZE, GEMINI_IMAGE_SIZE,
+    IMAGE_STORE_MAX_BYTES, PREVIEW_IMAGE_SIZE, VEO_ASPECT_RATIO, VEO_INPUT_LONG_SIDE,
+    VEO_REFERENCE_FIT, VEO_REFERENCE_MAX_BYTES,
+)
+from .telemetry import METRICS, _EVENTS_LOCAL, _script_run_ctx
+from .backends import Image, ImageOps, np
+from .storage import file_sha256
+
+# ============================================================================
+# PREPROCESSING IMMAGINE DI RIFERIMENTO VEO
+# ============================================================================
+
+_VEO_REFERENCE_MEMO: "OrderedDict[tuple, Dict]" = OrderedDict()
+_VEO_REFERENCE_MEMO_SIZE = 64
+_VEO_REFERENCE_LOCK = threading.Lock()
+
+def _aspect_size(aspect_ratio: str, long_side: int) -> tuple:
+    """Dimensioni target (w, h) per un aspect ratio tipo '16:9'."""
+    w, h = (int(x) for x in aspect_ratio.split(":"))
+    if w >= h:
+        return long_side, round(long_side * h / w)
+    return round(long_side * w / h), long_side
+
+def render_veo_reference(img: Image.Image, aspect_ratio: str = VEO_ASPECT_RATIO,
+                         fit: str = VEO_REFERENCE_FIT) -> Image.Image:
+    """
+    Orientamento EXIF + crop centrato (o letterbox) all'aspect ratio Veo,
+    ridimensionato alla risoluzione di input del modello (mai upscale).
+    """
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    target_w, target_h = _aspect_size(aspect_ratio, VEO_INPUT_LONG_SIDE)
+    target_ratio = target_w / target_h
+
+    if fit == "letterbox":
+        img.thumbnail((target_w, target_h), Image.LANCZOS, reducing_gap=2.0)
+        return ImageOps.pad(img, (target_w, target_h), color=(0, 0, 0))
+
+    # Crop centrato al ratio target
+    src_w, src_h = img.size
+    if src_w / src_h > target_ratio:
+        crop_w, crop_h = src_h * target_ratio, src_h
+    else:
+        crop_w, crop_h = src_w, src_w / target_ratio
+    left, top = (src_w - crop_w) / 2, (src_h - crop_h) / 2
+    box = (left, top, left + crop_w, top + crop_h)
+
+    if crop_w <= target_w:
+        return img.crop(tuple(round(v) for v in box))
+    return img.resize((target_w, target_h), Image.LANCZOS, box=box, reducing_gap=2.0)
+
+def encode_jpeg_within_budget(img: Image.Image, max_bytes: int) -> bytes:
+    """JPEG con la qualità più alta che sta nel budget (poi riduce la risoluzione)."""
+    while True:
+        for quality in (90, 85, 80, 72, 64, 55):
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality)
+            if buf.tell() <= max_bytes:
+                return buf.getvalue()
+
+        if min(img.size) <= 256:
+            return buf.getvalue()
+        img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+
+def prepare_veo_reference(photo_path: Path, aspect_ratio: str = VEO_ASPECT_RATIO) -> Dict:
+    """
+    Immagine di riferimento pronta per Veo, calcolata una volta per foto.
+
+    Il payload base64 è memoizzato per contenuto, quindi retry e scene che
+    riusano la stessa foto non ricodificano nulla.
+
+    Returns:
+        Dict con content_hash, b64, mime_type, original_bytes,
+        encoded_bytes, encode_ms
+    """
+    store = get_image_store()
+    content_hash = store.hash_for_path(photo_path)
+    memo_key = (content_hash, aspect_ratio, VEO_REFERENCE_FIT, VEO_REFERENCE_MAX_BYTES)
+
+    with _VEO_REFERENCE_LOCK:
+        if memo_key in _VEO_REFERENCE_MEMO:
+            _VEO_REFERENCE_MEMO.move_to_end(memo_key)
+            return _VEO_REFERENCE_MEMO[memo_key]
+
+    start = time.perf_counter()
+    encoded = encode_jpeg_within_budget(
+        store.rendition_for_path(photo_path, "veo", aspect_ratio), VEO_REFERENCE_MAX_BYTES
+    )
+
+    reference = {
+        "content_hash": content_hash,
+        "b64": base64.b64encode(encoded).decode("ascii"),
+        "mime_type": "image/jpeg",
+        "original_bytes": photo_path.stat().st_size,
+        "encoded_bytes": len(encoded),
+        "encode_ms": (time.perf_counter() - start) * 1000,
+    }
+
+    with _VEO_REFERENCE_LOCK:
+        _VEO_REFERENCE_MEMO[memo_key] = reference
+        while len(_VEO_REFERENCE_MEMO) > _VEO_REFERENCE_MEMO_SIZE:
+            _VEO_REFERENCE_MEMO.popitem(last=False)
+
+    return reference
+
+# ============================================================================
+# IMAGE STORE: ogni upload decodificato una volta per sessione
+# ============================================================================
+
+class ImageStore:
+    """
+    Rendition in memoria delle foto (preview, Gemini, Veo) per sessione.
+
+    Ogni upload viene decodificato una sola volta, con JPEG draft mode per
+    saltare direttamente a una scala ridotta; le rendition sono indicizzate
+    per hash del contenuto (upload duplicati condividono le entry) e tenute
+    in un LRU limitato a `max_bytes` di pixel decodificati.
+
+    Con album grandi gli upload si registrano senza decodifica: la preview
+    di una foto si decodifica da sola (draft alla scala della preview),
+    Gemini e Veo decodificano al primo uso.
+
+    I bytes degli upload (sorgente per ri-decodificare) contano nel budget
+    finché la foto non è salvata su disco (register_path) o finché l'upload
+    non viene rimosso dalla sessione (retain).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.decodes = 0
+        self._renditions: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._sources: Dict[str, object] = {}  # hash → bytes o Path per ri-decodifica
+        self._path_hashes: Dict[tuple, str] = {}
+        self._upload_hashes: Dict[str, str] = {}  # id upload Streamlit → hash (niente sha256 a ogni rerun)
+        self._lock = threading.Lock()
+
+    def add_bytes(self, data: bytes, decode: bool = True, upload_id: Optional[str] = None) -> str:
+        """Registra un upload (bytes) e, con `decode`, ne decodifica le rendition se nuove."""
+        with self._lock:
+            content_hash = self._upload_hashes.get(upload_id) if upload_id else None
+        if content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if upload_id:
+                self._upload_hashes[upload_id] = content_hash
+            known = content_hash in self._sources
+            if not known:
+                # Se c'è già (bytes o file registrato) si tiene quella: niente copie a ogni rerun
+                self._sources[content_hash] = data
+                self._bytes += len(data)
+        if decode and not known:
+            self._decode(content_hash)
+        return content_hash
+
+    def register_path(self, path: Path, content_hash: str) -> None:
+        """Associa un file salvato su disco a un contenuto già nello store."""
+        stat = path.stat()
+        with self._lock:
+            self._path_hashes[(str(path), stat.st_mtime_ns, stat.st_size)] = content_hash
+            self._drop_source(content_hash)
+            self._sources[content_hash] = path  # I bytes dell'upload non servono più
+
+    def retain(self, content_hashes: Iterable[str]) -> None:
+        """Libera i bytes degli upload non più nella sessione (le rendition restano nell'LRU)."""
+        keep = set(content_hashes)
+        with self._lock:
+            for content_hash in [h for h, source in self._sources.items()
+                                 if isinstance(source, bytes) and h not in keep]:
+                self._drop_source(content_hash)
+            self._upload_hashes = {u: h for u, h in self._upload_hashes.items() if h in keep}
+
+    def _drop_source(self, content_hash: str) -> None:
+        source = self._sources.pop(content_hash, None)
+        if isinstance(source, bytes):
+            self._bytes -= len(source)
+
+    def hash_for_path(self, path: Path) -> str:
+        stat = path.stat()
+        path_key = (str(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            content_hash = self._path_hashes.get(path_key)
+        if content_hash is None:
+            content_hash = file_sha256(path)
+            with self._lock:
+                self._path_hashes[path_key] = content_hash
+                self._sources.setdefault(content_hash, path)
+        return content_hash
+
+    def get(self, content_hash: str, rendition: str, aspect_ratio: str = VEO_ASPECT_RATIO) -> Image.Image:
+        """Rendition condivisa (sola lettura): 'preview', 'gemini' o 'veo'."""
+        key = (content_hash, rendition, aspect_ratio if rendition == "veo" else None)
+        with self._lock:
+            img = self._renditions.get(key)
+            if img is not None:
+                self._renditions.move_to_end(key)
+                return img
+
+        if rendition == "preview":
+            return self._decode_preview(content_hash)
+        return self._decode(content_hash, aspect_ratio)[key]
+
+    def rendition_for_path(self, path: Path, rendition: str, aspect_ratio: str = VEO_ASPECT_RATIO) -> Image.Image:
+        return self.get(self.hash_for_path(path), rendition, aspect_ratio)
+
+    def _decode(self, content_hash: str, aspect_ratio: str = VEO_ASPECT_RATIO) -> Dict[tuple, Image.Image]:
+        with self._lock:
+            source = self._sources[content_hash]
+
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            # Draft mode: il decoder JPEG scala già di 1/2, 1/4, 1/8 (lato ≥ input Veo)
+            img.draft("RGB", (VEO_INPUT_LONG_SIDE, VEO_INPUT_LONG_SIDE))
+            base = ImageOps.exif_transpose(img).convert("RGB")
+
+        gemini = base.copy()
+        gemini.thumbnail(GEMINI_IMAGE_SIZE, Image.LANCZOS, reducing_gap=2.0)
+        preview = gemini.copy()
+        preview.thumbnail(PREVIEW_IMAGE_SIZE, Image.LANCZOS)
+
+        renditions = {
+            (content_hash, "veo", aspect_ratio): render_veo_reference(base, aspect_ratio, VEO_REFERENCE_FIT),
+            (content_hash, "gemini", None): gemini,
+            (content_hash, "preview", None): preview,
+        }
+
+        self._store(renditions)
+        return renditions
+
+    def _store(self, renditions: Dict[tuple, Image.Image]) -> None:
+        with self._lock:
+            self.decodes += 1
+            for key, rendition in renditions.items():
+                old = self._renditions.pop(key, None)
+                if old is not None:
+                    self._bytes -= _image_nbytes(old)
+                self._renditions[key] = rendition
+                self._bytes += _image_nbytes(rendition)
+
+            while self._bytes > self.max_bytes and len(self._renditions) > len(renditions):
+                _, evicted = self._renditions.popitem(last=False)
+                self._bytes -= _image_nbytes(evicted)
+
+    def _decode_preview(self, content_hash: str) -> Image.Image:
+        """Solo la preview: draft direttamente alla sua scala (1/8 per le foto grandi)."""
+        with self._lock:
+            source = self._sources[content_hash]
+
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            img.draft("RGB", PREVIEW_IMAGE_SIZE)
+            preview = ImageOps.exif_transpose(img).convert("RGB")
+        preview.thumbnail(PREVIEW_IMAGE_SIZE, Image.LANCZOS)
+
+        self._store({(content_hash, "preview", None): preview})
+        return preview
+
+    def stats(self) -> Dict:
+        """`bytes`: pixel delle rendition + bytes degli upload tenuti come sorgente."""
+        with self._lock:
+            return {"decodes": self.decodes, "entries": len(self._renditions), "bytes": self._bytes}
+
+def _image_nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+_SHARED_IMAGE_STORE = ImageStore(IMAGE_STORE_MAX_BYTES)
+
+def get_image_store() -> ImageStore:
+    """
+    Store del thread (image_store_scope, es. job della sessione), altrimenti
+    della sessione Streamlit corrente (condiviso fuori da `streamlit run`).
+    """
+    store = getattr(_EVENTS_LOCAL, "image_store", None)
+    if store is not None:
+        return store
+    if _script_run_ctx() is None:
+        return _SHARED_IMAGE_STORE
+    import streamlit as st  # già caricato: siamo dentro `streamlit run`
+    if "image_store" not in st.session_state:
+        st.session_state["image_store"] = ImageStore(IMAGE_STORE_MAX_BYTES)
+    return st.session_state["image_store"]
+
+@contextmanager
+def image_store_scope(store: Optional[ImageStore]):
+    """Usa `store` per le foto di questo thread (e dei worker): i job girano senza sessione Streamlit."""
+    previous = getattr(_EVENTS_LOCAL, "image_store", None)
+    _EVENTS_LOCAL.image_store = store
+    try:
+        yield store
+    finally:
+        _EVENTS_LOCAL.image_store = previous
+
+# ============================================================================
+# SELEZIONE FOTO: quasi duplicati e migliori MAX_PHOTOS, prima di storia e render
+# ============================================================================
+
+METRICS.describe("pipeline_photos_skipped_total", "counter", "Foto escluse prima dello storyboard (reason)")
+
+def photo_quality(gray: np.ndarray) -> np.ndarray:
+    """Punteggio per un blocco N×H×W di grigi: nitidezza (varianza del laplaciano) × esposizione."""
+    g = gray.astype(np.float32) / 255.0
+    lap = 4 * g[:, 1:-1, 1:-1] - g[:, :-2, 1:-1] - g[:, 2:, 1:-1] - g[:, 1:-1, :-2] - g[:, 1:-1, 2:]
+    sharpness = lap.var(axis=(1, 2))
+    clipped = ((g < 0.02) | (g > 0.98)).mean(axis=(1, 2))
+    exposure = (1 - clipped) * (1 - np.abs(g.mean(axis=(1, 2)) - 0.5))
+    return np.log1p(sharpness * 1000) * exposure
+
+def photo_fingerprints(images: Iterable[Image.Image], batch: int = 32) -> tuple:
+    """
+    dHash a 64 bit (N×64 bool) e punteggio qualità (N) di ogni foto.
+
+    Da ogni immagine si tengono solo due miniature in grigio (9×8 e
+    DEDUP_QUALITY_SIZE), poi hash e qualità sono calcolati in blocco.
+    """
+    hash_px, quality_px = [], []
+    for img in images:
+        gray = img.convert("L")
+        hash_px.append(np.asarray(gray.resize((DEDUP_HASH_SIZE + 1, DEDUP_HASH_SIZE), Image.BILINEAR)))
+        quality_px.append(np.asarray(gray.resize(DEDUP_QUALITY_SIZE, Image.BILINEAR)))
+
+    small = np.stack(hash_px).astype(np.int16)
+    bits = (small[:, :, 1:] > small[:, :, :-1]).reshape(len(hash_px), -1)
+    quality = np.concatenate([photo_quality(np.stack(quality_px[i:i + batch]))
+                              for i in range(0, len(quality_px), batch)])
+    return bits, quality
+
+def select_photos(n: int, load: Callable[[int], Image.Image], max_photos: int = 0,
+                  max_distance: int = DEDUP_MAX_DISTANCE) -> Dict:
+    """
+    Foto da usare tra `n` (load(i) → immagine i), nell'ordine originale.
+
+    I quasi duplicati (distanza di Hamming ≤ max_distance dal primo del
+    gruppo) si riducono alla foto con qualità migliore; oltre `max_photos`
+    gruppi restano i migliori. Ritorna keep (indici tenuti), duplicate_of
+    (indice → indice tenuto al suo posto), over_limit e quality.
+    """
+    if not n or (not DEDUP_ENABLED and (not max_photos or n <= max_photos)):
+        return {"n_photos": n, "max_photos": max_photos, "keep": list(range(n)), "duplicate_of": {},
+                "over_limit": [], "quality": []}
+
+    bits, quality = photo_fingerprints(load(i) for i in range(n))
+
+    leaders: List[int] = []
+    groups: List[List[int]] = []
+    if DEDUP_ENABLED:
+        distance = (bits[:, None, :] != bits[None, :, :]).sum(axis=-1)
+        for i in range(n):
+            if leaders:
+                nearest = int(np.argmin(distance[i, leaders]))
+                if distance[i, leaders[nearest]] <= max_distance:
+                    groups[nearest].append(i)
+                    continue
+            leaders.append(i)
+            groups.append([i])
+    else:
+        groups = [[i] for i in range(n)]
+
+    duplicate_of: Dict[int, int] = {}
+    representatives = []
+    for members in groups:
+        best = max(members, key=lambda i: quality[i])
+        representatives.append(best)
+        duplicate_of.update({i: best for i in members if i != best})
+
+    over_limit = []
+    if max_photos and len(representatives) > max_photos:
+        ranked = sorted(representatives, key=lambda i: -quality[i])
+        over_limit = sorted(ranked[max_photos:])
+        representatives = ranked[:max_photos]
+
+    if duplicate_of:
+        METRICS.inc("pipeline_photos_skipped_total", len(duplicate_of), reason="duplicate")
+    if over_limit:
+        METRICS.inc("pipeline_photos_skipped_total", len(over_limit), reason="over_limit")
+
+    return {
+        "n_photos": n,
+        "max_photos": max_photos,
+        "keep": sorted(representatives),
+        "duplicate_of": duplicate_of,
+        "over_limit": over_limit,
+        "quality": [round(float(q), 3) for q in quality],
+    }
+
+def select_photo_paths(photo_paths: List[Path], max_photos: int = 0) -> Dict:
+    """select_photos sulle preview dello store (decodifica draft, mai a piena risoluzione)."""
+    store = get_image_store()
+    return select_photos(len(photo_paths), lambda i: store.rendition_for_path(photo_paths[i], "preview"), max_photos)
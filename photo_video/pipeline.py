@@ -0,0 +1,695 @@
+"""
+Orchestrazione: hedging Veo/fallback, scheduler delle scene e pipeline completa.
+"""
+
+from __future__ import annotations
+
+import time
+import threading
+from concurrent.futures import Future, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional
+
+from .config import (
+    HEDGE_DEFAULT_AFTER_SECONDS, HEDGE_LATENCY_PERCENTILE, HEDGING_ENABLED, MAX_CONCURRENT_SCENES,
+    MERGE_CROSSFADE, METRICS_FILE, PROGRESSIVE_OUTPUT, RUN_DEADLINE_SECONDS, STORY_STREAMING,
+    TRACE_DIR, VEO_MAX_OPERATIONS, VEO_USE_OPERATIONS,
+)
+from .telemetry import (
+    METRICS, PipelineEvents, RunTrace, _EVENTS_LOCAL, _attach_thread_context,
+    _capture_thread_context, _run_with_thread_context, current_events, current_run_id,
+    events_scope, span, trace_scope, write_metrics_file,
+)
+from .backends import CircuitOpenError, LatencyTracker, VEO_GUARD, VEO_LATENCY
+from .storage import CLIP_CACHE, run_scope
+from .story import StoryStream, create_story_from_photos, resolve_scene_photo
+from .veo import generate_veo_clip, submit_veo_operation
+from .render import FALLBACK_POOL, ProgressiveOutput, create_simple_clip_ffmpeg, merge_videos_ffmpeg
+
+# ============================================================================
+# HEDGING: deadline per scena + fallback speculativo
+# ============================================================================
+
+class DeadlinePolicy:
+    """
+    Quando far partire il fallback speculativo e quando smettere di aspettare Veo.
+
+    - hedge_after(): oltre il percentile `percentile` delle latenze Veo
+      (o `default_hedge_after` senza storico) parte il render fallback
+    - run_deadline: oltre questa durata del run si committa il fallback
+    """
+
+    def __init__(self, percentile: float = HEDGE_LATENCY_PERCENTILE,
+                 run_deadline: float = RUN_DEADLINE_SECONDS,
+                 default_hedge_after: float = HEDGE_DEFAULT_AFTER_SECONDS,
+                 tracker: Optional[LatencyTracker] = None):
+        self.percentile = percentile
+        self.run_deadline = run_deadline
+        self.default_hedge_after = default_hedge_after
+        self.tracker = tracker or VEO_LATENCY
+        self.hedges = 0
+        self.fallback_committed = 0
+        self._lock = threading.Lock()
+
+    def hedge_after(self) -> float:
+        observed = self.tracker.percentile(self.percentile)
+        return observed if observed is not None else self.default_hedge_after
+
+    def deadline_from(self, started_at: float) -> float:
+        """Deadline assoluta (time.monotonic) di un run iniziato a `started_at`."""
+        return started_at + self.run_deadline
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+_HEDGED_CALL_SLOTS: Dict[int, threading.BoundedSemaphore] = {}
+_HEDGED_CALL_SLOTS_LOCK = threading.Lock()
+
+def _hedged_call_slots() -> threading.BoundedSemaphore:
+    """Tetto di processo alle chiamate Veo sotto hedging: MAX_CONCURRENT_SCENES o il limite di VEO_GUARD se più alto."""
+    limit = max(1, MAX_CONCURRENT_SCENES, VEO_GUARD.max_in_flight)
+    with _HEDGED_CALL_SLOTS_LOCK:
+        if limit not in _HEDGED_CALL_SLOTS:
+            _HEDGED_CALL_SLOTS[limit] = threading.BoundedSemaphore(limit)
+        return _HEDGED_CALL_SLOTS[limit]
+
+def _start_hedged_call(context: tuple, fn: Callable, *args,
+                       on_started: Optional[Callable[[], None]] = None) -> Future:
+    """
+    Chiamata Veo sincrona sotto hedging in un thread dedicato, così i timer
+    non aspettano in coda a un pool. Il thread tiene uno slot di
+    _hedged_call_slots() fino alla fine della chiamata: una chiamata
+    abbandonata (fallback già scelto) continua e finisce nella clip cache,
+    ma conta nel tetto finché non termina; una annullata mentre aspetta lo
+    slot non parte. `on_started` è chiamato da mark_veo_call_started().
+    """
+    future: Future = Future()
+    slots = _hedged_call_slots()
+
+    def run() -> None:
+        with slots:
+            if not future.set_running_or_notify_cancel():
+                return
+            _EVENTS_LOCAL.veo_call_started = on_started
+            try:
+                future.set_result(_run_with_thread_context(context, fn, *args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                _EVENTS_LOCAL.veo_call_started = None
+
+    threading.Thread(target=run, name="veo-hedged", daemon=True).start()
+    return future
+
+def hedged_scene(
+    start_veo: Callable[[Callable[[], None]], Future],
+    start_fallback: Callable[[], Future],
+    policy: DeadlinePolicy,
+    deadline_at: float,
+) -> Future:
+    """
+    Combina Veo e fallback in un unico Future con il clip da usare.
+
+    `start_veo(started)` chiama `started()` quando la richiesta Veo parte
+    davvero: attese di quota o di slot non contano per l'hedging (lo stesso
+    intervallo misurato da VEO_LATENCY).
+
+    - Veo pronto prima della deadline del run → clip Veo (fallback annullato)
+    - Veo in corso da oltre `policy.hedge_after()` → il fallback parte in parallelo
+    - Veo fallito → fallback (già avviato o avviato ora)
+    - deadline del run superata → si committa il fallback (se è già
+      passata, Veo non parte nemmeno)
+
+    Non blocca nessun thread: tutto avanza su callback e timer.
+    """
+    result: Future = Future()
+    lock = threading.Lock()
+    state = {"veo": None, "fallback": None, "veo_failed": False, "committed": False, "hedge_armed": False}
+    timers: List[threading.Timer] = []
+    started = time.monotonic()
+
+    def finish(clip: Optional[Path]) -> bool:
+        with lock:
+            if result.done():
+                return False
+            result.set_result(clip)
+        for timer in timers:
+            timer.cancel()
+        return True
+
+    def start_timer(delay: float, action: Callable[[], None]) -> None:
+        timer = threading.Timer(max(0.0, delay), action)
+        timer.daemon = True
+        timers.append(timer)
+        timer.start()
+
+    def veo_started() -> None:
+        # Una volta sola (i retry non fanno ripartire il conteggio), mai a scena chiusa
+        with lock:
+            if state["hedge_armed"] or result.done():
+                return
+            state["hedge_armed"] = True
+            start_timer(policy.hedge_after(), lambda: launch_fallback("hedge"))
+
+    def launch_fallback(reason: str) -> None:
+        with lock:
+            if state["fallback"] is not None or result.done():
+                return
+            try:
+                state["fallback"] = fallback = start_fallback()
+            except Exception as e:
+                fallback = Future()
+                fallback.set_exception(e)
+                state["fallback"] = fallback
+        if reason == "hedge":
+            policy._count("hedges")
+        METRICS.inc("pipeline_fallback_total", reason=reason)
+        fallback.add_done_callback(on_fallback_done)
+
+    def on_fallback_done(fallback: Future) -> None:
+        clip = None if fallback.cancelled() or fallback.exception() else fallback.result()
+        with lock:
+            use_now = state["veo_failed"] or state["committed"]
+        if use_now:
+            finish(clip)
+        # altrimenti il clip resta pronto: lo usano la deadline o un errore Veo
+
+    def on_veo_done(veo: Future) -> None:
+        clip = None if veo.cancelled() or veo.exception() else veo.result()
+        with lock:
+            committed, fallback = state["committed"], state["fallback"]
+            if not clip:
+                state["veo_failed"] = True
+
+        if clip and not committed:
+            if finish(clip) and fallback is not None:
+                fallback.cancel()
+            return
+
+        if fallback is None:
+            launch_fallback("error")
+        elif fallback.done():
+            on_fallback_done(fallback)
+
+    def on_deadline() -> None:
+        with lock:
+            if result.done():
+                return
+            state["committed"] = True
+            veo, fallback = state["veo"], state["fallback"]
+        policy._count("fallback_committed")
+        if veo is not None:
+            veo.cancel()
+        if fallback is None:
+            launch_fallback("deadline")
+        elif fallback.done():
+            on_fallback_done(fallback)
+
+    if started >= deadline_at:
+        state["committed"] = True
+        policy._count("fallback_committed")
+        launch_fallback("deadline")
+        return result
+
+    try:
+        veo = start_veo(veo_started)
+    except Exception as e:
+        veo = Future()
+        veo.set_exception(e)
+    with lock:
+        state["veo"] = veo
+        start_timer(deadline_at - started, on_deadline)
+    veo.add_done_callback(on_veo_done)
+
+    return result
+
+# ============================================================================
+# SCENE SCHEDULER: generazione scene in parallelo
+# ============================================================================
+
+def generate_video_with_veo2(photo_path: Path, scene: Dict, style: str) -> Optional[Path]:
+    """
+    Genera VIDEO ANIMATO usando Veo 2 da Vertex AI.
+
+    Veo 2 genera video veri con movimento, non foto statiche!
+
+    Args:
+        photo_path: Foto di riferimento
+        scene: Dati scena con veo_prompt
+        style: Stile video
+
+    Returns:
+        Path al video generato (MP4)
+    """
+    events = current_events()
+    try:
+        return generate_veo_clip(photo_path, scene, style)
+
+    except CircuitOpenError as e:
+        events.warning(f"⚡ {e}")
+
+        return create_simple_clip_ffmpeg(photo_path, scene, reason="circuit_open")
+
+    except Exception as e:
+        events.error(f"❌ Veo 2 generation failed: {e}")
+        events.info("💡 Possibili cause: Quota API, Veo non abilitato, credenziali errate")
+
+        # Fallback: crea clip semplice con FFmpeg
+        return create_simple_clip_ffmpeg(photo_path, scene, reason="error")
+
+def generate_scenes_concurrently(
+    photo_paths: List[Path],
+    scenes: Iterable[Dict],
+    style: str,
+    max_concurrency: int = MAX_CONCURRENT_SCENES,
+    generate_fn: Optional[Callable[[Path, Dict, str], Optional[Path]]] = None,
+    on_scene_done: Optional[Callable[[int, Dict, Optional[Path]], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[Optional[Path]]:
+    """
+    Genera le scene in parallelo con al massimo `max_concurrency` richieste in volo.
+
+    Args:
+        photo_paths: Foto caricate
+        scenes: Scene dello storyboard (in ordine); anche un iteratore che
+            le produce man mano (storyboard in streaming): ogni scena parte
+            appena arriva
+        style: Stile video
+        max_concurrency: Limite richieste Veo contemporanee
+        generate_fn: Generatore di clip (default: generate_video_with_veo2).
+            Iniettabile per usare un client Veo stub con latenza configurabile.
+        on_scene_done: Callback (indice, scena, clip) chiamata nel thread
+            chiamante appena una scena termina, in ordine di completamento
+        cancel_event: Se settato non parte più nessuna scena: quelle in coda
+            vengono scartate, quelle già in corso finiscono (e vanno in cache)
+            senza essere attese
+
+    Returns:
+        Clip in ordine di scena (None per le scene fallite o annullate)
+    """
+    generate_fn = generate_fn or generate_video_with_veo2
+    if isinstance(scenes, list) and not scenes:
+        return []
+
+    submitted: List[Dict] = []
+    results: List[Optional[Path]] = []
+    futures: Dict[Future, int] = {}
+
+    def collect(future: Future) -> None:
+        i = futures.pop(future)
+        try:
+            results[i] = future.result()
+        except Exception as e:
+            current_events().error(f"❌ Scena {i+1} error: {e}")
+            results[i] = None
+
+        if on_scene_done:
+            on_scene_done(i, submitted[i], results[i])
+
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
+    context = _capture_thread_context()
+
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(scenes)) if isinstance(scenes, list) else max_concurrency),
+        thread_name_prefix="veo-scene",
+        initializer=_attach_thread_context,
+        initargs=(context,),
+    )
+    try:
+        for i, scene in enumerate(scenes):
+            if cancelled():
+                break
+            submitted.append(scene)
+            results.append(None)
+            futures[pool.submit(generate_fn, resolve_scene_photo(photo_paths, scene, i), scene, style)] = i
+
+            # Callback delle scene già finite mentre arrivano le successive
+            for future in [f for f in futures if f.done()]:
+                collect(future)
+
+        while futures and not cancelled():
+            done, _ = wait(list(futures), timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+    finally:
+        pool.shutdown(wait=not cancelled(), cancel_futures=cancelled())
+
+    return results
+
+def generate_scenes_with_operations(
+    photo_paths: List[Path],
+    scenes: Iterable[Dict],
+    style: str,
+    max_in_flight: int = VEO_MAX_OPERATIONS,
+    on_scene_done: Optional[Callable[[int, Dict, Optional[Path]], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    policy: Optional[DeadlinePolicy] = None,
+    deadline_at: Optional[float] = None,
+) -> List[Optional[Path]]:
+    """
+    Come generate_scenes_concurrently, ma con operation Veo non bloccanti.
+
+    Nessun thread resta fermo sui 30-60s di generazione: il thread chiamante
+    attende i Future del poller; le scene fallite passano al pool fallback
+    (anch'esso come Future). Se `cancel_event` viene settato, le operation
+    in volo vengono abbandonate e le scene restanti restano None.
+    Con `policy` ogni operation è coperta da hedging (vedi hedged_scene).
+    `scenes` può essere un iteratore (storyboard in streaming).
+    """
+    source = iter(scenes)
+    scenes: List[Dict] = []
+    results: List[Optional[Path]] = []
+    exhausted = False
+    in_flight: Dict[Future, tuple] = {}  # future → (indice scena, 'veo' | 'hedged' | 'fallback')
+
+    def launch_fallback(i: int, reason: str) -> None:
+        METRICS.inc("pipeline_fallback_total", reason=reason)
+        photo_path = resolve_scene_photo(photo_paths, scenes[i], i)
+        in_flight[FALLBACK_POOL.submit(photo_path, scenes[i])] = (i, 'fallback')
+
+    def launch_veo(i: int) -> None:
+        if VEO_GUARD.breaker.state == "open":
+            launch_fallback(i, "circuit_open")
+            return
+        photo_path = resolve_scene_photo(photo_paths, scenes[i], i)
+        if policy is not None:
+            future = hedged_scene(
+                lambda started: submit_veo_operation(photo_path, scenes[i], style, on_started=started),
+                lambda: FALLBACK_POOL.submit(photo_path, scenes[i]),
+                policy, deadline_at
+            )
+            in_flight[future] = (i, 'hedged')
+            return
+        try:
+            future = submit_veo_operation(photo_path, scenes[i], style)
+            in_flight[future] = (i, 'veo')
+        except Exception as e:
+            current_events().error(f"❌ Veo submit scena {i+1} fallito: {e}")
+            launch_fallback(i, "error")
+
+    while not exhausted or in_flight:
+        if cancel_event is not None and cancel_event.is_set():
+            for future in in_flight:
+                future.cancel()
+            break
+
+        veo_in_flight = sum(1 for _, kind in in_flight.values() if kind != 'fallback')
+        while not exhausted and veo_in_flight < max_in_flight:
+            # Con uno storyboard in streaming next() attende la scena successiva
+            scene = next(source, None)
+            if scene is None:
+                exhausted = True
+                break
+            scenes.append(scene)
+            results.append(None)
+            launch_veo(len(scenes) - 1)
+            veo_in_flight += 1
+
+        if not in_flight:
+            continue
+
+        done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, kind = in_flight.pop(future)
+            try:
+                clip = future.result()
+            except Exception as e:
+                current_events().error(f"❌ Scena {i+1} ({kind}) error: {e}")
+                clip = None
+
+            if clip is None and kind == 'veo':
+                launch_fallback(i, "error")
+                continue
+
+            results[i] = clip
+            if on_scene_done:
+                on_scene_done(i, scenes[i], clip)
+
+    return results
+
+def hedged_generate_fn(
+    policy: DeadlinePolicy,
+    deadline_at: float,
+    veo_fn: Optional[Callable[[Path, Dict, str], Optional[Path]]] = None,
+    fallback_fn: Optional[Callable[[Path, Dict], Future]] = None,
+) -> Callable[[Path, Dict, str], Optional[Path]]:
+    """
+    generate_fn per generate_scenes_concurrently con hedging.
+
+    `veo_fn` (default generate_veo_clip) e `fallback_fn` (default
+    FALLBACK_POOL.submit) sono iniettabili: uno stub con latenza
+    configurabile permette di verificare la policy senza Vertex.
+    """
+    veo_fn = veo_fn or generate_veo_clip
+    fallback_fn = fallback_fn or FALLBACK_POOL.submit
+
+    def generate(photo_path: Path, scene: Dict, style: str) -> Optional[Path]:
+        context = _capture_thread_context()
+        return hedged_scene(
+            lambda started: _start_hedged_call(context, veo_fn, photo_path, scene, style, on_started=started),
+            lambda: fallback_fn(photo_path, scene),
+            policy, deadline_at
+        ).result()
+
+    return generate
+
+def generate_scenes(
+    photo_paths: List[Path],
+    scenes: Iterable[Dict],
+    style: str,
+    use_veo: bool = True,
+    on_scene_done: Optional[Callable[[int, Dict, Optional[Path]], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    policy: Optional[DeadlinePolicy] = None,
+    deadline_at: Optional[float] = None,
+) -> List[Optional[Path]]:
+    """
+    Sceglie la strategia: operation Veo, chiamate Veo sincrone o solo fallback.
+
+    Con HEDGING_ENABLED le scene Veo sono coperte da hedging fino a
+    `deadline_at` (time.monotonic; default: ora + RUN_DEADLINE_SECONDS).
+    """
+    if not use_veo:
+        policy = None
+    elif policy is None and HEDGING_ENABLED:
+        policy = DeadlinePolicy()
+    if policy is not None and deadline_at is None:
+        deadline_at = policy.deadline_from(time.monotonic())
+
+    if use_veo and VEO_USE_OPERATIONS:
+        return generate_scenes_with_operations(
+            photo_paths, scenes, style, on_scene_done=on_scene_done, cancel_event=cancel_event,
+            policy=policy, deadline_at=deadline_at
+        )
+
+    if policy is not None:
+        generate_fn, concurrency = hedged_generate_fn(policy, deadline_at), MAX_CONCURRENT_SCENES
+    elif use_veo:
+        generate_fn, concurrency = generate_video_with_veo2, MAX_CONCURRENT_SCENES
+    else:
+        # Senza Vertex ogni scena è un render locale: parallelismo = worker del pool fallback
+        generate_fn = lambda photo_path, scene, _style: create_simple_clip_ffmpeg(photo_path, scene, reason="no_veo")
+        concurrency = FALLBACK_POOL.workers
+
+    return generate_scenes_concurrently(
+        photo_paths, scenes, style,
+        max_concurrency=concurrency,
+        generate_fn=generate_fn,
+        on_scene_done=on_scene_done,
+        cancel_event=cancel_event
+    )
+
+# ============================================================================
+# MAIN PIPELINE
+# ============================================================================
+
+def process_photos_to_video(photo_paths: List[Path], style: str, use_veo: bool = True,
+                            events: Optional[PipelineEvents] = None) -> Optional[Path]:
+    """
+    Pipeline completa (use_veo=False: tutte le scene dal pool fallback).
+
+    Con STORY_STREAMING la storia arriva in streaming e ogni scena entra
+    nella generazione video appena completa.
+
+    Args:
+        events: Destinatario di progresso ed eventi (default:
+            current_events()); la CLI batch passa il proprio
+    """
+    events = events or current_events()
+    # Il trace costa un append per span: sempre attivo, scritto su disco solo con TRACE_DIR
+    trace = RunTrace("pipeline")
+    with events_scope(events), trace_scope(trace), run_scope(current_run_id()):
+        with span("pipeline", photos=len(photo_paths), style=style, use_veo=use_veo):
+            final_video = _run_pipeline(photo_paths, style, use_veo, events)
+
+        METRICS.inc("pipeline_runs_total", status="done" if final_video else "failed")
+        report_run_metrics(trace, events)
+
+    return final_video
+
+def report_run_metrics(trace: RunTrace, events: PipelineEvents) -> None:
+    """Riepilogo tempi per stage, trace JSON (TRACE_DIR) e file metriche (METRICS_FILE)."""
+    totals = trace.totals()
+    events.run_finished(totals)
+
+    breakdown = sorted(((s, t) for s, t in totals.items() if s != "pipeline"), key=lambda item: -item[1])
+    if breakdown:
+        events.caption("⏱️ Tempi per stage: " + " · ".join(f"{s} {t:.1f}s" for s, t in breakdown[:6]))
+
+    try:
+        if TRACE_DIR:
+            events.caption(f"🧭 Trace: {trace.dump(Path(TRACE_DIR))}")
+        if METRICS_FILE:
+            write_metrics_file(Path(METRICS_FILE))
+    except OSError as e:
+        events.warning(f"⚠️ Export metriche fallito: {e}")
+
+def _run_pipeline(photo_paths: List[Path], style: str, use_veo: bool, events: PipelineEvents) -> Optional[Path]:
+    try:
+        started_at = time.perf_counter()
+        hedge_policy = DeadlinePolicy() if use_veo and HEDGING_ENABLED else None
+        deadline_at = hedge_policy.deadline_from(time.monotonic()) if hedge_policy else None
+        events.progress(0)
+
+        # Step 1: Storia
+        events.stage("story", "📖 Step 1: Creazione Storia")
+        events.progress(0.1)
+
+        story_stream = None
+        if STORY_STREAMING:
+            story_stream = StoryStream(photo_paths, style)
+
+            def announced(scenes: Iterable[Dict]) -> Iterable[Dict]:
+                for i, scene in enumerate(scenes):
+                    events.scene_planned(i, scene)
+                    yield scene
+                # Stream chiuso: storia completa mentre le ultime scene sono ancora in corso
+                events.story_ready(story_stream.story)
+
+            scene_source = announced(story_stream.scenes())
+            expected_scenes = len(photo_paths)
+        else:
+            with span("story"):
+                story = create_story_from_photos(photo_paths, style)
+
+            if not story or 'scenes' not in story:
+                events.error("❌ Storia fallita")
+                return None
+
+            # Mostra storia
+            events.story_ready(story)
+            for i, scene in enumerate(story['scenes']):
+                events.scene_planned(i, scene)
+
+            scene_source = story['scenes']
+            expected_scenes = len(story['scenes'])
+
+        events.progress(0.3)
+
+        # Step 2: Video generation
+        events.stage("scenes", "🎥 Step 2: Generazione Video con Veo 2")
+
+        completed = 0
+
+        if use_veo and VEO_USE_OPERATIONS:
+            concurrency = VEO_MAX_OPERATIONS
+        else:
+            concurrency = MAX_CONCURRENT_SCENES if use_veo else FALLBACK_POOL.workers
+
+        events.write(f"🎬 Generando {expected_scenes} scene (max {concurrency} in parallelo)")
+
+        # Output progressivo (non compatibile con il crossfade, che ricodifica tutto);
+        # creato alla prima scena, quando il titolo è noto anche in streaming
+        use_progressive = PROGRESSIVE_OUTPUT and not MERGE_CROSSFADE
+        progressive = None
+
+        def on_scene_done(i: int, scene: Dict, video_path: Optional[Path]) -> None:
+            nonlocal completed, progressive, use_progressive
+            completed += 1
+
+            if video_path:
+                events.success(f"✅ Scena {i+1} completata: {scene.get('scene_title', '')}")
+            else:
+                events.warning(f"⚠️ Scena {i+1} fallita - continuo")
+            METRICS.inc("pipeline_scenes_total", status="done" if video_path else "failed")
+            events.scene_done(i, scene, video_path)
+
+            if use_progressive:
+                try:
+                    if progressive is None:
+                        title = story_stream.fields.get('title', style) if story_stream else story['title']
+                        progressive = ProgressiveOutput(title, started_at)
+                    for clip in progressive.add(i, video_path):
+                        events.preview_clip(clip)
+                except Exception as e:
+                    events.warning(f"⚠️ Anteprima progressiva disattivata: {e}")
+                    progressive, use_progressive = None, False
+
+            events.progress(0.3 + (0.5 * min(1.0, completed / max(expected_scenes, 1))))
+
+        with span("scenes"):
+            clips = generate_scenes(
+                photo_paths, scene_source, style,
+                use_veo=use_veo,
+                on_scene_done=on_scene_done,
+                policy=hedge_policy,
+                deadline_at=deadline_at
+            )
+
+        if story_stream:
+            story = story_stream.story
+            if story_stream.first_scene_s is not None:
+                events.caption(f"⚡ Prima scena dallo stream dopo {story_stream.first_scene_s:.1f}s")
+
+        # Ordine di scena preservato per il merge
+        generated_videos = [clip for clip in clips if clip]
+
+        cache_stats = CLIP_CACHE.stats()
+        events.caption(f"🗄️ Clip cache: {cache_stats['hits']} hit / {cache_stats['misses']} miss")
+
+        if hedge_policy and (hedge_policy.hedges or hedge_policy.fallback_committed):
+            events.caption(
+                f"⏱️ Hedging: {hedge_policy.hedges} fallback speculativi "
+                f"(oltre {hedge_policy.hedge_after():.0f}s), "
+                f"{hedge_policy.fallback_committed} scene chiuse alla deadline"
+            )
+
+        if not generated_videos:
+            events.error("❌ Nessun video generato")
+            return None
+
+        events.progress(0.8)
+
+        # Step 3: Merge
+        events.stage("merge", "🎬 Step 3: Creazione Video Finale")
+
+        final_video = None
+        with span("merge"):
+            if progressive:
+                try:
+                    final_video = progressive.finalize()
+                except Exception as e:
+                    events.warning(f"⚠️ Remux progressivo fallito, merge classico: {e}")
+                if progressive.first_playable_s is not None:
+                    events.caption(
+                        f"⚡ Prima scena riproducibile dopo {progressive.first_playable_s:.1f}s "
+                        f"(playlist: {progressive.playlist})"
+                    )
+
+            if final_video:
+                events.success(f"✅ Video finale: {final_video.name} ({final_video.stat().st_size / 1024 / 1024:.1f} MB)")
+            else:
+                final_video = merge_videos_ffmpeg(clips, story)
+
+        events.progress(1.0)
+
+        return final_video
+
+    except Exception as e:
+        events.error(f"❌ Pipeline error: {e}")
+        import traceback
+        events.code(traceback.format_exc())
+        return None
@@ -0,0 +1,641 @@
+"""
+Rendering locale con FFmpeg: fallback Ken Burns, merge finale, output progressivo HLS.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import re
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
+import tempfile
+
+from .config import (
+    CLIP_DURATION, CROSSFADE_SECONDS, FALLBACK_JOB_TIMEOUT, FALLBACK_OUTPUT_SIZE,
+    FALLBACK_X264_THREADS, MERGE_CROSSFADE, OUTPUT_FOLDER, VIDEO_FPS,
+)
+from .telemetry import (
+    METRICS, _attach_thread_context, _capture_thread_context, _run_with_thread_context,
+    current_events, span,
+)
+from .backends import Image, ImageOps, np
+from .storage import run_folder, unique_clip_path
+
+# ============================================================================
+# FALLBACK: Ken Burns renderer (NumPy + un solo encoder FFmpeg)
+# ============================================================================
+
+def _smoothstep(t: np.ndarray) -> np.ndarray:
+    return t * t * (3 - 2 * t)
+
+def ken_burns_windows(camera_movement: str, n_frames: int, src_size: tuple,
+                      out_size: tuple = FALLBACK_OUTPUT_SIZE) -> np.ndarray:
+    """
+    Finestre di crop (left, top, right, bottom) per ogni frame, calcolate in blocco.
+
+    Coordinate float: il resize con box subpixel evita il jitter di zoompan.
+    Movimenti supportati (da `camera_movement` dello storyboard):
+    dolly/zoom (in/out), pan (left/right), tilt (up/down), orbit.
+    """
+    src_w, src_h = src_size
+    out_ratio = out_size[0] / out_size[1]
+
+    # Finestra massima con l'aspect ratio di output (cover)
+    full_w = min(src_w, src_h * out_ratio)
+    full_h = full_w / out_ratio
+
+    t = _smoothstep(np.linspace(0.0, 1.0, n_frames))
+    # Parole intere: "throughout" non è "out", "panoramic" non è "pan"
+    words = set(re.findall(r"[a-z]+", (camera_movement or "").lower()))
+
+    def has(*forms: str) -> bool:
+        return not words.isdisjoint(forms)
+
+    reverse = has("out", "back", "backward", "backwards", "pull", "pulls", "pulling")
+
+    # Default: zoom lento verso il centro
+    scale = 1.0 - 0.2 * t
+    cx = np.full(n_frames, 0.5)
+    cy = np.full(n_frames, 0.5)
+
+    if has("pan", "pans", "panning"):
+        scale = np.full(n_frames, 0.85)
+        cx = 0.5 + (0.5 - scale / 2) * (2 * t - 1) * (-1 if has("left") else 1)
+    elif has("tilt", "tilts", "tilting"):
+        scale = np.full(n_frames, 0.85)
+        cy = 0.5 + (0.5 - scale / 2) * (2 * t - 1) * (1 if has("down") else -1)
+    elif has("orbit", "orbits", "orbiting", "orbital"):
+        scale = 0.88 - 0.06 * t
+        angle = np.pi * (0.75 + 0.5 * t)
+        cx = 0.5 + (0.5 - scale / 2) * np.cos(angle)
+        cy = 0.5 + 0.5 * (0.5 - scale / 2) * np.sin(angle)
+    elif has("zoom", "zooms", "zooming", "dolly", "dollies", "dollying"):
+        scale = 1.0 - 0.25 * t
+
+    if reverse:
+        scale, cx, cy = scale[::-1], cx[::-1], cy[::-1]
+
+    win_w = full_w * scale
+    win_h = full_h * scale
+    left = np.clip(cx * src_w - win_w / 2, 0, src_w - win_w)
+    top = np.clip(cy * src_h - win_h / 2, 0, src_h - win_h)
+
+    return np.stack([left, top, left + win_w, top + win_h], axis=1)
+
+def render_ken_burns_clip(photo_path: Path, output_path: Path, camera_movement: str,
+                          duration: float = CLIP_DURATION, fps: int = VIDEO_FPS,
+                          out_size: tuple = FALLBACK_OUTPUT_SIZE, timeout: float = FALLBACK_JOB_TIMEOUT,
+                          threads: int = 0) -> Path:
+    """
+    Clip Ken Burns: una decodifica della foto, frame raw via stdin a un solo ffmpeg.
+
+    `timeout` vale per l'intero job (decodifica + frame + encoding);
+    `threads` limita i thread x264 (0 = automatico).
+
+    Raises:
+        subprocess.CalledProcessError / TimeoutExpired se l'encoder fallisce
+    """
+    import subprocess
+
+    out_w, out_h = out_size
+    deadline = time.monotonic() + timeout
+
+    # Decodifica unica, già ridotta (draft) a ~1.5x output per margine di zoom
+    with Image.open(photo_path) as img:
+        img.draft("RGB", (int(out_w * 1.5), int(out_h * 1.5)))
+        source = ImageOps.exif_transpose(img).convert("RGB")
+
+    n_frames = max(1, int(round(duration * fps)))
+    windows = ken_burns_windows(camera_movement, n_frames, source.size, out_size)
+
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+        '-s', f'{out_w}x{out_h}', '-r', str(fps),
+        '-i', '-',
+        '-c:v', 'libx264', '-preset', 'veryfast',
+        '-threads', str(threads),
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        str(output_path)
+    ]
+
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr)
+        try:
+            for box in windows:
+                if time.monotonic() > deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                frame = source.resize(out_size, Image.BILINEAR, box=tuple(box))
+                proc.stdin.write(frame.tobytes())
+            proc.stdin.close()
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except BrokenPipeError:
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr.read())
+
+    return output_path
+
+def available_cpus() -> int:
+    """Core utilizzabili da questo processo (rispetta affinity/cgroup)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class FallbackRenderPool:
+    """
+    Pool di encoder per i clip fallback, dimensionato sui core disponibili.
+
+    Ogni job è un processo ffmpeg (più la generazione frame, che rilascia il
+    GIL nel resize di PIL); i thread x264 per job sono limitati così
+    `workers × x264_threads` non supera i core.
+    """
+
+    def __init__(self, cpus: int = 0, x264_threads: int = FALLBACK_X264_THREADS,
+                 timeout: float = FALLBACK_JOB_TIMEOUT):
+        cpus = cpus or available_cpus()
+        self.x264_threads = max(1, min(x264_threads, cpus))
+        self.workers = max(1, cpus // self.x264_threads)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fallback-render")
+
+    def submit(self, photo_path: Path, scene: Dict):
+        """Accoda un render; ritorna un Future con il Path del clip."""
+        output_path = unique_clip_path("clip", scene.get('photo_index', 'x'))
+        return self._executor.submit(
+            self._render,
+            _capture_thread_context(),
+            photo_path,
+            output_path,
+            scene.get('camera_movement', ''),
+            scene.get('duration', CLIP_DURATION),
+        )
+
+    def _render(self, context: tuple, photo_path: Path, output_path: Path,
+                camera_movement: str, duration: float) -> Path:
+        _attach_thread_context(context)
+        with span("fallback_render"):
+            return render_ken_burns_clip(
+                photo_path, output_path, camera_movement,
+                duration=duration, timeout=self.timeout, threads=self.x264_threads,
+            )
+
+    def submit_task(self, fn: Callable, *args) -> Future:
+        """Lavoro FFmpeg generico sul pool (es. ricodifica di un clip), con il contesto del chiamante."""
+        return self._executor.submit(_run_with_thread_context, _capture_thread_context(), fn, *args)
+
+    def run_many(self, fn: Callable, items: List) -> List:
+        """Applica `fn` agli item sul pool, risultati nell'ordine degli item."""
+        context = _capture_thread_context()
+        futures = [self._executor.submit(_run_with_thread_context, context, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+FALLBACK_POOL = FallbackRenderPool()
+
+def create_simple_clip_ffmpeg(photo_path: Path, scene: Dict, reason: str = "error") -> Optional[Path]:
+    """Fallback: clip Ken Burns (foto animata) se Veo fallisce (`reason` per le metriche)."""
+    METRICS.inc("pipeline_fallback_total", reason=reason)
+    try:
+        current_events().warning("⚠️ Usando FFmpeg fallback (Ken Burns su foto)")
+
+        output_path = FALLBACK_POOL.submit(photo_path, scene).result()
+
+        if output_path.exists():
+            return output_path
+        return None
+
+    except Exception as e:
+        current_events().error(f"❌ FFmpeg fallback failed: {e}")
+        return None
+
+# ============================================================================
+# STEP 3: MERGE VIDEO
+# ============================================================================
+
+CANONICAL_PROFILE = {
+    "codec": "h264",
+    "width": FALLBACK_OUTPUT_SIZE[0],
+    "height": FALLBACK_OUTPUT_SIZE[1],
+    "fps": f"{VIDEO_FPS}/1",
+    "pix_fmt": "yuv420p",
+    "time_base": f"1/{VIDEO_FPS * 512}",
+}
+
+# Parole chiave in `transition_to_next` → transizione xfade di FFmpeg
+XFADE_TRANSITIONS = [
+    (("dissolv",), "dissolve"),
+    (("black", "nero", "buio", "dark"), "fadeblack"),
+    (("white", "bianco", "luce", "light", "flash"), "fadewhite"),
+    (("wipe",), "wipeleft"),
+    (("slide", "scorr"), "slideleft"),
+    (("zoom",), "zoomin"),
+    (("circle", "cerchio", "iris"), "circleopen"),
+]
+
+def probe_clip(path: Path) -> Dict:
+    """Parametri dello stream video (ffprobe, solo header: pochi ms)."""
+    import subprocess
+
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,width,height,r_frame_rate,pix_fmt,time_base:format=duration',
+        '-of', 'json',
+        str(path)
+    ]
+    out = subprocess.run(cmd, capture_output=True, check=True, timeout=30).stdout
+    data = json.loads(out)
+    stream = data['streams'][0]
+
+    return {
+        "codec": stream.get('codec_name'),
+        "width": stream.get('width'),
+        "height": stream.get('height'),
+        "fps": stream.get('r_frame_rate'),
+        "pix_fmt": stream.get('pix_fmt'),
+        "time_base": stream.get('time_base'),
+        "duration": float(data.get('format', {}).get('duration') or 0),
+    }
+
+def _stream_signature(info: Dict) -> tuple:
+    """
+    Parametri che devono coincidere per unire clip in stream copy.
+
+    Unica regola per il merge (concat) e l'output progressivo (segmenti TS
+    e remux finale): il demuxer concat vuole anche stessi fps e time_base.
+    """
+    return tuple(info.get(k) for k in ("codec", "width", "height", "fps", "pix_fmt", "time_base"))
+
+def _profile_filters(profile: Dict) -> str:
+    w, h = profile['width'], profile['height']
+    return (
+        f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+        f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+        f"fps={profile['fps']},format={profile['pix_fmt']}"
+    )
+
+def normalize_clip(path: Path, profile: Dict, threads: int = 0) -> Path:
+    """Ricodifica un clip al profilo target (stesso codec/risoluzione/fps/timebase)."""
+    import subprocess
+
+    output_path = unique_clip_path("norm", path.stem)
+    timescale = profile['time_base'].split('/')[1]
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', str(path),
+        '-vf', _profile_filters(profile),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-threads', str(threads),
+        '-an',
+        '-video_track_timescale', timescale,
+        '-movflags', '+faststart',
+        str(output_path)
+    ]
+    subprocess.run(cmd, capture_output=True, check=True, timeout=FALLBACK_JOB_TIMEOUT)
+    return output_path
+
+def xfade_transition(transition_text: str) -> str:
+    """Tipo di transizione xfade per il testo `transition_to_next` dello storyboard."""
+    text = (transition_text or "").lower()
+    for keywords, transition in XFADE_TRANSITIONS:
+        if any(k in text for k in keywords):
+            return transition
+    return "fade"
+
+def _crossfade_command(clips: List[Path], durations: List[float], transitions: List[str],
+                       output_path: Path, fade: float) -> List[str]:
+    """Un solo filtergraph: normalizza ogni input e concatena con xfade."""
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+    for clip in clips:
+        cmd += ['-i', str(clip)]
+
+    filters = [
+        f"[{i}:v]settb=AVTB,setpts=PTS-STARTPTS,{_profile_filters(CANONICAL_PROFILE)}[v{i}]"
+        for i in range(len(clips))
+    ]
+
+    last, offset = "v0", 0.0
+    for i in range(1, len(clips)):
+        offset += durations[i - 1] - fade
+        label = f"x{i}"
+        filters.append(
+            f"[{last}][v{i}]xfade=transition={transitions[i - 1]}:duration={fade}:offset={offset:.3f}[{label}]"
+        )
+        last = label
+
+    return cmd + [
+        '-filter_complex', ";".join(filters),
+        '-map', f"[{last}]",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', CANONICAL_PROFILE['pix_fmt'],
+        '-r', str(VIDEO_FPS),
+        '-movflags', '+faststart',
+        str(output_path)
+    ]
+
+def merge_videos_ffmpeg(video_paths: List[Optional[Path]], story: Dict,
+                        crossfade: bool = MERGE_CROSSFADE) -> Optional[Path]:
+    """
+    Merge tutti i clip in video continuo.
+
+    Senza crossfade: probe di ogni clip, stream copy della maggioranza
+    compatibile e ricodifica (in parallelo) solo dei clip diversi.
+    Con crossfade: un unico filtergraph xfade guidato da `transition_to_next`.
+
+    Args:
+        video_paths: Clip in ordine di scena (None = scena fallita)
+        story: Storia (scene allineate a video_paths per le transizioni)
+    """
+    events = current_events()
+    try:
+        import subprocess
+
+        events.info("🎬 Merging video clips in video continuo...")
+        start = time.perf_counter()
+
+        # Filtra clip validi (conservando la scena di ciascuno per le transizioni)
+        scenes = story.get('scenes', [])
+        valid = [(i, p) for i, p in enumerate(video_paths) if p and p.exists()]
+        valid_clips = [p for _, p in valid]
+
+        if not valid_clips:
+            events.error("❌ Nessun clip da mergare")
+            return None
+
+        # Output
+        title_safe = story.get('title', 'video').replace(' ', '_')[:30]
+        output_path = run_folder(OUTPUT_FOLDER) / f"{title_safe}_{int(time.time())}_{uuid.uuid4().hex[:8]}.mp4"
+
+        with span("merge_probe", clips=len(valid_clips)):
+            infos = list(FALLBACK_POOL.run_many(probe_clip, valid_clips))
+
+        if crossfade and len(valid_clips) > 1:
+            fade = min(CROSSFADE_SECONDS, min(info['duration'] for info in infos) / 2)
+            transitions = [
+                xfade_transition(scenes[i].get('transition_to_next', '') if i < len(scenes) else '')
+                for i, _ in valid
+            ]
+            cmd = _crossfade_command(
+                valid_clips, [info['duration'] for info in infos], transitions, output_path, fade
+            )
+            reencoded = len(valid_clips)
+
+            with events.busy("⏳ Merging con crossfade..."), span("merge_crossfade", clips=len(valid_clips)):
+                subprocess.run(cmd, capture_output=True, check=True, timeout=FALLBACK_JOB_TIMEOUT * len(valid_clips))
+        else:
+            # Profilo target: la maggioranza se è H.264, altrimenti il profilo canonico
+            signatures = [_stream_signature(info) for info in infos]
+            majority = max(set(signatures), key=signatures.count)
+            target = dict(zip(("codec", "width", "height", "fps", "pix_fmt", "time_base"), majority))
+            if target['codec'] != "h264" or not target['time_base']:
+                target = CANONICAL_PROFILE
+
+            target_sig = _stream_signature(target)
+            outliers = [i for i, sig in enumerate(signatures) if sig != target_sig]
+            with span("merge_normalize", clips=len(outliers)):
+                normalized = FALLBACK_POOL.run_many(
+                    lambda clip: normalize_clip(clip, target, FALLBACK_POOL.x264_threads),
+                    [valid_clips[i] for i in outliers]
+                )
+            merge_clips = list(valid_clips)
+            for i, clip in zip(outliers, normalized):
+                merge_clips[i] = clip
+            reencoded = len(outliers)
+
+            # Concat list per-merge (niente file condiviso tra sessioni)
+            concat_file = unique_clip_path("concat", "merge", ".txt")
+            with open(concat_file, "w") as f:
+                for clip in merge_clips:
+                    f.write(f"file '{clip.absolute()}'\n")
+
+            cmd = [
+                'ffmpeg', '-y',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', str(concat_file),
+                '-map', '0:v',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                str(output_path)
+            ]
+
+            try:
+                with events.busy("⏳ Merging... (~30s)"), span("merge_concat", clips=len(merge_clips)):
+                    subprocess.run(cmd, capture_output=True, check=True, timeout=120)
+            finally:
+                concat_file.unlink(missing_ok=True)
+
+        if output_path.exists():
+            file_size = output_path.stat().st_size / 1024 / 1024
+            events.success(f"✅ Video finale: {output_path.name} ({file_size:.1f} MB)")
+            events.caption(
+                f"⏱️ Merge: {time.perf_counter() - start:.1f}s, "
+                f"{reencoded}/{len(valid_clips)} clip ricodificati"
+            )
+            return output_path
+
+        return None
+
+    except Exception as e:
+        events.error(f"❌ Merge failed: {e}")
+        return None
+
+# ============================================================================
+# OUTPUT PROGRESSIVO: playlist HLS che cresce scena per scena
+# ============================================================================
+
+class ProgressiveOutput:
+    """
+    Output incrementale in OUTPUT_FOLDER mentre le scene vengono generate.
+
+    Ogni clip finito (in ordine di scena) viene rimuxato senza ricodifica in
+    un segmento MPEG-TS con timestamp continui e aggiunto a una playlist HLS
+    di tipo EVENT, subito riproducibile. Probe ed eventuale ricodifica (se
+    la firma dello stream non è quella del profilo canonico) girano su
+    FALLBACK_POOL, non nel thread che raccoglie le scene; remux dei segmenti
+    e playlist su un thread dedicato, fuori dal lock. Il video finale è solo
+    un remux in stream copy (nessuna ricodifica né probe alla fine).
+    """
+
+    def __init__(self, title: str, started_at: Optional[float] = None):
+        title_safe = title.replace(' ', '_')[:30]
+        self.folder = run_folder(OUTPUT_FOLDER) / f"{title_safe}_{int(time.time())}_{uuid.uuid4().hex[:8]}_hls"
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.playlist = self.folder / "playlist.m3u8"
+        self.output_path = self.folder.with_name(self.folder.name[:-len("_hls")] + ".mp4")
+        self.started_at = started_at or time.perf_counter()
+        self.first_playable_s: Optional[float] = None
+        self.reencoded = 0
+        self.segments: List[tuple] = []  # (segmento .ts, durata)
+        self.clips: List[Path] = []  # clip MP4 pubblicati (profilo canonico)
+        self.error: Optional[Exception] = None
+        self._pending: Dict[int, Future] = {}  # indice scena → (clip, info) preparato, o None
+        self._next_index = 0
+        self._published: List[Path] = []  # pubblicati ma non ancora ritornati da add()
+        self._lock = threading.Lock()  # solo bookkeeping, mai durante FFmpeg
+        # Un solo worker: i segmenti escono in ordine, uno alla volta
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progressive")
+        self._write_playlist(ended=False)
+
+    def add(self, index: int, clip: Optional[Path]) -> List[Path]:
+        """
+        Registra la scena `index` (None = fallita); il prefisso contiguo viene
+        pubblicato appena i suoi clip sono pronti, senza bloccare il chiamante.
+
+        Returns:
+            Clip pubblicati dall'ultima chiamata, in ordine di scena
+        """
+        if clip and clip.exists():
+            future = FALLBACK_POOL.submit_task(self._prepare, clip)
+        else:
+            future = Future()
+            future.set_result(None)
+        with self._lock:
+            self._pending[index] = future
+        future.add_done_callback(lambda _: self._schedule_publish())
+
+        with self._lock:
+            published, self._published = self._published, []
+        return published
+
+    def _prepare(self, clip: Path) -> tuple:
+        """Probe e, se serve, ricodifica al profilo canonico (sul pool fallback)."""
+        info = probe_clip(clip)
+        if _stream_signature(info) != _stream_signature(CANONICAL_PROFILE):
+            with span("progressive_normalize"):
+                clip = normalize_clip(clip, CANONICAL_PROFILE, FALLBACK_POOL.x264_threads)
+            info = probe_clip(clip)
+            with self._lock:
+                self.reencoded += 1
+        return clip, info
+
+    def _schedule_publish(self) -> None:
+        """Callback dei clip pronti (anche inline in add()): il remux va sul publisher."""
+        try:
+            self._publisher.submit(self._publish)
+        except RuntimeError:
+            pass  # publisher già chiuso da finalize(), che ha pubblicato tutto
+
+    def _publish(self) -> None:
+        """Pubblica il prefisso contiguo pronto (solo sul thread publisher)."""
+        with self._lock:
+            ready = []
+            while self._next_index in self._pending and self._pending[self._next_index].done():
+                ready.append(self._pending.pop(self._next_index))
+                self._next_index += 1
+
+        published = []
+        for future in ready:
+            try:
+                prepared = future.result()
+                if prepared and self.error is None:
+                    self._append_segment(*prepared)
+                    published.append(prepared[0])
+            except Exception as e:
+                # Una scena mancante renderebbe l'MP4 incompleto: finalize() lo segnala
+                self.error = self.error or e
+
+        if published:
+            self._write_playlist(ended=False)
+            with self._lock:
+                self._published += published
+                if self.first_playable_s is None:
+                    self.first_playable_s = time.perf_counter() - self.started_at
+
+    def _append_segment(self, clip: Path, info: Dict) -> None:
+        with span("progressive_segment", index=len(self.segments)):
+            self._remux_segment(clip, info)
+
+    def _remux_segment(self, clip: Path, info: Dict) -> None:
+        import subprocess
+
+        offset = sum(duration for _, duration in self.segments)
+        segment = self.folder / f"seg_{len(self.segments):03d}.ts"
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-i', str(clip),
+            '-map', '0:v',
+            '-c', 'copy',
+            '-bsf:v', 'h264_mp4toannexb',
+            '-output_ts_offset', f"{offset:.3f}",
+            '-f', 'mpegts',
+            str(segment)
+        ]
+        subprocess.run(cmd, capture_output=True, check=True, timeout=60)
+        self.segments.append((segment, info['duration']))
+        self.clips.append(clip)
+
+    def _write_playlist(self, ended: bool) -> None:
+        target = max([int(d) + 1 for _, d in self.segments] or [CLIP_DURATION])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for segment, duration in self.segments:
+            lines += [f"#EXTINF:{duration:.3f},", segment.name]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Scrittura atomica: i player non leggono mai una playlist a metà
+        tmp = self.playlist.with_suffix(".m3u8.tmp")
+        tmp.write_text("\n".join(lines) + "\n")
+        os.replace(tmp, self.playlist)
+
+    def finalize(self) -> Optional[Path]:
+        """
+        Attende i clip ancora in preparazione, chiude la playlist e produce
+        l'MP4 finale con un remux dei clip pubblicati.
+
+        Raises:
+            l'errore di preparazione/remux di una scena (→ merge classico)
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+        wait(pending)
+        try:
+            self._publisher.submit(self._publish).result()
+        finally:
+            self._publisher.shutdown()
+        if self.error is not None:
+            raise self.error
+        with span("progressive_finalize", clips=len(self.clips)):
+            return self._remux_final()
+
+    def _remux_final(self) -> Optional[Path]:
+        import subprocess
+
+        self._write_playlist(ended=True)
+        if not self.clips:
+            return None
+
+        concat_file = self.folder / "concat.txt"
+        with open(concat_file, "w") as f:
+            for clip in self.clips:
+                f.write(f"file '{clip.absolute()}'\n")
+
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', str(concat_file),
+            '-map', '0:v',
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            str(self.output_path)
+        ]
+        subprocess.run(cmd, capture_output=True, check=True, timeout=120)
+        return self.output_path if self.output_path.exists() else None
@@ -0,0 +1,389 @@
+"""
+File su disco: cartelle per run con quote e TTL, upload, cache di clip e storyboard.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import uuid
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional
+import tempfile
+
+from .config import (
+    CACHE_FOLDER, CLIP_CACHE_MAX_BYTES, OUTPUT_FOLDER, OUTPUT_QUOTA_BYTES, OUTPUT_TTL_SECONDS,
+    STORAGE_SWEEP_SECONDS, STORY_CACHE_MAX_ENTRIES, STORY_CACHE_TTL_SECONDS, TEMP_FOLDER,
+    TEMP_QUOTA_BYTES, TEMP_TTL_SECONDS, UPLOAD_FOLDER, UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS,
+    ensure_folder,
+)
+from .telemetry import METRICS, _EVENTS_LOCAL, current_events, current_run_id
+
+# ============================================================================
+# STORAGE: cartelle per run, quote, TTL e sweeper
+# ============================================================================
+
+class StorageManager:
+    """
+    Ciclo di vita di upload, clip temporanei e output su disco.
+
+    Ogni run scrive in `<cartella>/<run_id>/` (vedi run_scope), così run
+    concorrenti non collidono e si eliminano in blocco. Lo sweeper rimuove
+    per ogni cartella le entry oltre il TTL e poi, se la cartella supera la
+    quota, le meno recenti; i run attivi (pin espliciti o job in corso dalle
+    `pin_sources`) non vengono mai toccati.
+    """
+
+    def __init__(self, folders: Dict[str, tuple]):
+        self.folders = folders  # nome → (cartella, quota byte, TTL secondi)
+        self.pin_sources: List[Callable[[], Iterable[str]]] = []
+        self.usage: Dict[str, Dict] = {}
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def pin(self, run_id: str) -> None:
+        with self._lock:
+            self._pins[run_id] = self._pins.get(run_id, 0) + 1
+
+    def unpin(self, run_id: str) -> None:
+        with self._lock:
+            if self._pins.get(run_id, 0) <= 1:
+                self._pins.pop(run_id, None)
+            else:
+                self._pins[run_id] -= 1
+
+    def pinned(self) -> set:
+        """Run protetti; se una sorgente fallisce l'errore passa a sweep, che salta il giro."""
+        with self._lock:
+            pinned = set(self._pins)
+        for source in self.pin_sources:
+            pinned.update(source())
+        return pinned
+
+    @staticmethod
+    def _measure(entry: Path) -> tuple:
+        """(byte, ultimo mtime) di un file o di una cartella di run."""
+        stat = entry.stat()
+        if not entry.is_dir():
+            return stat.st_size, stat.st_mtime
+        size, newest = 0, stat.st_mtime
+        for dirpath, _, filenames in os.walk(entry):
+            for name in filenames:
+                try:
+                    file_stat = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                size += file_stat.st_size
+                newest = max(newest, file_stat.st_mtime)
+        return size, newest
+
+    def sweep(self) -> Dict[str, Dict]:
+        """Un passaggio su tutte le cartelle; ritorna l'uso per cartella dopo la pulizia."""
+        with self._sweep_lock:
+            try:
+                pinned = self.pinned()
+            except Exception:
+                return self.usage  # meglio non pulire nulla che pulire un job attivo
+            now = time.time()
+
+            for name, (folder, quota, ttl) in self.folders.items():
+                entries = []
+                if folder.exists():
+                    for entry in folder.iterdir():
+                        try:
+                            size, mtime = self._measure(entry)
+                        except FileNotFoundError:
+                            continue
+                        entries.append((mtime, size, entry))
+
+                total = sum(size for _, size, _ in entries)
+                removed = {"ttl": 0, "quota": 0}
+                freed = 0
+
+                # Vecchie prima: TTL, poi quota fino a rientrare
+                for mtime, size, entry in sorted(entries):
+                    if entry.name in pinned or entry.stem in pinned:
+                        continue
+                    if now - mtime > ttl:
+                        reason = "ttl"
+                    elif total > quota:
+                        reason = "quota"
+                    else:
+                        continue
+                    if entry.is_dir():
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        entry.unlink(missing_ok=True)
+                    total -= size
+                    freed += size
+                    removed[reason] += 1
+                    METRICS.inc("pipeline_storage_evicted_total", folder=name, reason=reason)
+                    METRICS.inc("pipeline_storage_freed_bytes_total", size, folder=name)
+
+                self.usage[name] = {
+                    "bytes": total,
+                    "entries": len(entries) - sum(removed.values()),
+                    "quota": quota,
+                    "freed": freed,
+                    "removed": removed,
+                }
+            return self.usage
+
+    def start_sweeper(self, interval: float = STORAGE_SWEEP_SECONDS) -> threading.Thread:
+        """Sweep subito e poi ogni `interval` secondi (thread daemon)."""
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception:
+                    pass
+                if self._stop.wait(interval):
+                    return
+
+        thread = threading.Thread(target=loop, name="storage-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+STORAGE = StorageManager({
+    "upload": (UPLOAD_FOLDER, UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS),
+    "temp": (TEMP_FOLDER, TEMP_QUOTA_BYTES, TEMP_TTL_SECONDS),
+    "output": (OUTPUT_FOLDER, OUTPUT_QUOTA_BYTES, OUTPUT_TTL_SECONDS),
+})
+METRICS.describe("pipeline_storage_evicted_total", "counter", "Entry rimosse dallo sweeper (folder, reason)")
+METRICS.describe("pipeline_storage_freed_bytes_total", "counter", "Byte liberati dallo sweeper")
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+@contextmanager
+def run_scope(run_id: Optional[str] = None):
+    """
+    Run isolato: i file di questo thread (e dei worker) vanno in `<cartella>/<run_id>/`,
+    protetti dallo sweeper finché il run è in corso.
+    """
+    run_id = run_id or new_run_id()
+    previous = current_run_id()
+    _EVENTS_LOCAL.run_id = run_id
+    STORAGE.pin(run_id)
+    try:
+        yield run_id
+    finally:
+        STORAGE.unpin(run_id)
+        _EVENTS_LOCAL.run_id = previous
+
+def run_folder(root: Path, run_id: Optional[str] = None) -> Path:
+    """Cartella del run corrente in `root` (la radice stessa fuori da un run)."""
+    run_id = run_id or current_run_id()
+    if run_id is None:
+        return ensure_folder(root)
+    folder = root / run_id
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+def save_uploaded_file(uploaded_file, save_path: Path) -> bool:
+    """Salva file uploadato."""
+    try:
+        with open(save_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        return True
+    except Exception as e:
+        current_events().error(f"❌ Error: {e}")
+        return False
+
+def unique_clip_path(prefix: str, photo_index, suffix: str = ".mp4") -> Path:
+    """Path univoco nella cartella temp del run (due render nello stesso secondo non collidono)."""
+    return run_folder(TEMP_FOLDER) / f"{prefix}_{photo_index}_{uuid.uuid4().hex[:12]}{suffix}"
+
+def storage_metrics() -> Iterable[tuple]:
+    for name, usage in STORAGE.usage.items():
+        yield "pipeline_storage_bytes", "gauge", {"folder": name}, usage['bytes']
+        yield "pipeline_storage_entries", "gauge", {"folder": name}, usage['entries']
+        yield "pipeline_storage_quota_bytes", "gauge", {"folder": name}, usage['quota']
+    disk = shutil.disk_usage(tempfile.gettempdir())
+    yield "pipeline_disk_free_bytes", "gauge", {}, disk.free
+    yield "pipeline_disk_total_bytes", "gauge", {}, disk.total
+
+METRICS.add_collector(storage_metrics)
+
+# ============================================================================
+# CACHE SU DISCO (clip Veo + storyboard Gemini)
+# ============================================================================
+
+class ClipCache:
+    """
+    Cache su disco dei clip Veo, indirizzata per contenuto.
+
+    Chiave = sha256(hash immagine + parametri richiesta). Le scritture sono
+    atomiche (file temporaneo + os.replace) così sessioni concorrenti non
+    leggono mai clip a metà; l'eviction è LRU sull'mtime fino a `max_bytes`.
+    """
+
+    def __init__(self, folder: Path, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_hash: str, params: Dict) -> str:
+        """Hash di immagine (sha256 del contenuto) + parametri completi della richiesta."""
+        h = hashlib.sha256(image_hash.encode('ascii'))
+        h.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.folder / f"{key}.mp4"
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """Se in cache, materializza il clip in `dest` (hardlink, copia come fallback)."""
+        entry = self._entry(key)
+        try:
+            os.utime(entry)  # Aggiorna LRU
+            _link_or_copy(entry, dest)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key: str, src: Path) -> None:
+        """Aggiunge un clip alla cache in modo atomico, poi applica il limite."""
+        tmp = ensure_folder(self.folder) / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            _link_or_copy(src, tmp)
+            os.replace(tmp, self._entry(key))
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Rimuove i clip usati meno di recente finché la cache sta nel limite."""
+        entries = []
+        for path in self.folder.glob("*.mp4"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+def file_sha256(path: Path) -> str:
+    """Hash del contenuto di un file (letto a blocchi)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    """Hardlink (istantaneo, nessuna copia) o copia se su filesystem diversi."""
+    dest.unlink(missing_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+class StoryCache:
+    """
+    Cache persistente degli storyboard Gemini (JSON su disco).
+
+    Chiave = hash ordinato delle foto + stile + hash del prompt template, così
+    cambiare il prompt invalida automaticamente le storie vecchie. Le entry
+    scadono dopo `ttl_seconds` e oltre `max_entries` si elimina la meno usata.
+    """
+
+    def __init__(self, folder: Path, ttl_seconds: float, max_entries: int):
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(photo_hashes: List[str], style: str, template_hash: str) -> str:
+        payload = json.dumps([photo_hashes, style, template_hash], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.folder / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entry(key)
+        try:
+            with open(entry, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - data["created"] > self.ttl_seconds:
+                entry.unlink(missing_ok=True)
+                raise FileNotFoundError(entry)
+            os.utime(entry)  # Aggiorna LRU
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data["story"]
+
+    def put(self, key: str, story: Dict) -> None:
+        tmp = ensure_folder(self.folder) / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "story": story}, f, ensure_ascii=False)
+            os.replace(tmp, self._entry(key))
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for path in self.folder.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+
+        for _, path in sorted(entries)[:max(0, len(entries) - self.max_entries)]:
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+CLIP_CACHE = ClipCache(CACHE_FOLDER / "clips", CLIP_CACHE_MAX_BYTES)
+STORY_CACHE = StoryCache(CACHE_FOLDER / "stories", STORY_CACHE_TTL_SECONDS, STORY_CACHE_MAX_ENTRIES)
+
+def cache_metrics() -> Iterable[tuple]:
+    for name, cache in (("clip", CLIP_CACHE), ("story", STORY_CACHE)):
+        stats = cache.stats()
+        yield "pipeline_cache_hits_total", "counter", {"cache": name}, stats['hits']
+        yield "pipeline_cache_misses_total", "counter", {"cache": name}, stats['misses']
+
+METRICS.add_collector(cache_metrics)
@@ -0,0 +1,637 @@
+"""
+Storyboard con Gemini: richiesta (anche in streaming), cache, album a capitoli.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Dict, Optional
+
+from .config import (
+    CLIP_DURATION, STORY_CHUNK_CONCURRENCY, STORY_CHUNK_SIZE, STORY_MODEL, STYLE_PRESETS,
+    VEO_SCENE_SECONDS_ESTIMATE,
+)
+from .telemetry import (
+    METRICS, _capture_thread_context, _run_with_thread_context, current_events, record_span, span,
+)
+from .backends import CLIENTS, GEMINI_GUARD, VEO_LATENCY
+from .storage import STORY_CACHE, StoryCache
+from .photos import get_image_store
+
+# ============================================================================
+# STEP 1: STORIA con Gemini (descrizione narrativa lunga)
+# ============================================================================
+
+STORY_PROMPT_TEMPLATE = """Sei uno storyteller cinematografico. Analizza queste {n_photos} foto e crea una STORIA NARRATIVA coinvolgente.
+
+Stile: {style}
+Descrizione stile: {style_description}
+
+Per ogni foto, crea:
+1. **Descrizione scena dettagliata** (3-4 frasi): Cosa succede, atmosfera, emozioni
+2. **Video prompt ricco** per AI video generation: Descrivi movimenti camera, azione, dettagli visivi
+3. **Connessione narrativa** con scena precedente/successiva
+
+Crea una storia che LEGA tutte le foto in un video continuo e fluido.
+
+Return ONLY valid JSON:
+{{
+    "title": "Titolo creativo del video",
+    "story_summary": "Riassunto storia completa in 2-3 frasi",
+    "narrative_arc": "Tipo di arco narrativo (e.g., 'journey', 'transformation', 'discovery')",
+    "scenes": [
+        {{
+            "photo_index": 0,
+            "scene_title": "Titolo scena",
+            "description": "Descrizione dettagliata cosa succede in questa scena (3-4 frasi)",
+            "veo_prompt": "Prompt DETTAGLIATO per Veo 2 video generation - include: azione, movimento camera, atmosfera, dettagli visivi, stile cinematografico. Min 20 parole.",
+            "camera_movement": "Tipo movimento (dolly, pan, tilt, zoom, orbit)",
+            "duration": {clip_duration},
+            "transition_to_next": "Come questa scena si collega alla prossima"
+        }}
+    ],
+    "final_message": "Messaggio/emozione finale del video"
+}}
+
+IMPORTANTE:
+- Veo prompts devono essere MOLTO DETTAGLIATI (20+ parole)
+- Includi sempre: movimento camera, azione, atmosfera
+- Usa linguaggio cinematografico
+"""
+
+# Album grandi: ogni capitolo usa il prompt base più il contesto del capitolo
+STORY_CHAPTER_PROMPT_TEMPLATE = STORY_PROMPT_TEMPLATE + """
+CONTESTO: queste foto sono il CAPITOLO {chapter} di {n_chapters} di un album di {album_photos} foto, in ordine cronologico.
+- "title" e "story_summary" descrivono solo questo capitolo
+- photo_index va da 0 a {last_index} (posizione della foto in QUESTO capitolo)
+- "transition_to_next" dell'ultima scena può restare generico: il collegamento al capitolo successivo viene scritto dopo
+"""
+
+STORY_REDUCE_PROMPT_TEMPLATE = """Sei uno storyteller cinematografico. Un video di {n_photos} foto è stato scritto in {n_chapters} capitoli, in ordine cronologico:
+
+{chapters}
+
+Stile: {style}
+Descrizione stile: {style_description}
+
+Unisci i capitoli in UN SOLO arco narrativo e scrivi la transizione tra ogni capitolo e il successivo (dall'ultima scena di un capitolo alla prima del successivo).
+
+Return ONLY valid JSON:
+{{
+    "title": "Titolo creativo del video completo",
+    "story_summary": "Riassunto della storia completa in 2-3 frasi",
+    "narrative_arc": "Tipo di arco narrativo (e.g., 'journey', 'transformation', 'discovery')",
+    "transitions": [
+        {{
+            "from_chapter": 1,
+            "transition_to_next": "Come l'ultima scena del capitolo 1 si collega alla prima del capitolo 2"
+        }}
+    ],
+    "final_message": "Messaggio/emozione finale del video"
+}}
+
+IMPORTANTE:
+- Esattamente {n_transitions} transizioni, una per ogni coppia di capitoli consecutivi
+- Transizioni cinematografiche (dissolvenza, match cut, fade, ...) coerenti con lo stile
+"""
+
+def story_cache_key(photo_paths: List[Path], style: str) -> str:
+    """Cache: stesse foto (per contenuto, in ordine) + stesso stile + stesso prompt."""
+    store = get_image_store()
+    prompts = f"{STORY_MODEL}\n{STORY_PROMPT_TEMPLATE}"
+    if len(photo_paths) > STORY_CHUNK_SIZE:
+        # La divisione in capitoli cambia la storia: fa parte della chiave
+        prompts += f"\n{STORY_CHAPTER_PROMPT_TEMPLATE}\n{STORY_REDUCE_PROMPT_TEMPLATE}\n{STORY_CHUNK_SIZE}"
+    return StoryCache.make_key(
+        [store.hash_for_path(p) for p in photo_paths],
+        style,
+        hashlib.sha256(prompts.encode('utf-8')).hexdigest()
+    )
+
+def request_story(photo_paths: List[Path], style: str, stream: bool = False, prompt: Optional[str] = None):
+    """
+    Chiamata Gemini per lo storyboard (quota, retry, breaker); `prompt` sostituisce quello base.
+
+    Con `stream` ritorna un iteratore di chunk: il primo arriva dentro il
+    guard (errori prima di qualsiasi dato si ritentano), gli errori a metà
+    stream contano comunque per breaker e metriche.
+    """
+    store = get_image_store()
+
+    prompt = prompt or STORY_PROMPT_TEMPLATE.format(
+        n_photos=len(photo_paths),
+        style=style,
+        style_description=STYLE_PRESETS.get(style, style),
+        clip_duration=CLIP_DURATION
+    )
+
+    # Foto per Gemini: rendition 1024px già decodificate dallo store
+    images = [store.rendition_for_path(p, "gemini") for p in photo_paths]
+
+    def generate():
+        try:
+            with span("gemini_call", stream=stream):
+                response = CLIENTS.gemini_model(STORY_MODEL).generate_content([prompt] + images, stream=stream)
+                if not stream:
+                    return response
+                chunks = iter(response)
+                return next(chunks, None), chunks
+        except Exception as e:
+            CLIENTS.report_error(f"gemini:{STORY_MODEL}", e)
+            raise
+
+    if not stream:
+        return GEMINI_GUARD.call(generate)
+    first, chunks = GEMINI_GUARD.call(generate)
+    return _guarded_story_chunks(first, chunks)
+
+def _guarded_story_chunks(first, chunks) -> Iterable:
+    """
+    Resto dello stream Gemini. Un errore a metà non si ritenta (le scene già
+    emesse sono in generazione) ma va a breaker e metriche di GEMINI_GUARD.
+    """
+    if first is None:
+        return
+    yield first
+    try:
+        yield from chunks
+    except Exception as e:
+        CLIENTS.report_error(f"gemini:{STORY_MODEL}", e)
+        GEMINI_GUARD.record_outcome(e)
+        raise
+
+def create_story_from_photos(photo_paths: List[Path], style: str) -> Dict:
+    """
+    Usa Gemini per creare una STORIA NARRATIVA dalle foto.
+
+    Non solo storyboard tecnico, ma vera storia con:
+    - Descrizione dettagliata di ogni scena
+    - Connessioni narrative tra le foto
+    - Prompts ricchi per Veo 2
+    """
+    if len(photo_paths) > STORY_CHUNK_SIZE:
+        # Album grande: capitoli in parallelo + reduce, stesso percorso dello streaming
+        stream = StoryStream(photo_paths, style)
+        for _ in stream.scenes():
+            pass
+        return stream.story
+
+    events = current_events()
+    try:
+        cache_key = story_cache_key(photo_paths, style)
+        cached_story = STORY_CACHE.get(cache_key)
+        if cached_story:
+            events.success(f"⚡ Storia dalla cache: '{cached_story.get('title', 'Untitled')}'")
+            return cached_story
+
+        events.info("📖 Gemini sta creando la tua storia...")
+
+        # Chiamata Gemini
+        with events.busy("🤖 Gemini sta analizzando le foto e creando la storia..."):
+            response = request_story(photo_paths, style)
+
+        response_text = response.text
+        METRICS.inc("pipeline_payload_bytes_total", len(response_text), service="gemini", direction="received")
+
+        # Parse JSON
+        with span("story_parse"):
+            story = parse_story_text(response_text)
+
+        # Solo storie vere: i fallback (errori Gemini) non finiscono mai in cache
+        if story.get('scenes'):
+            STORY_CACHE.put(cache_key, story)
+
+        events.success(f"✅ Storia creata: '{story.get('title', 'Untitled')}'")
+
+        return story
+
+    except json.JSONDecodeError as e:
+        events.error(f"❌ JSON parse error: {e}")
+        events.code(response_text[:500])
+        return create_fallback_story(photo_paths, style)
+    except Exception as e:
+        events.error(f"❌ Story generation error: {e}")
+        return create_fallback_story(photo_paths, style)
+
+def parse_story_text(text: str) -> Dict:
+    """JSON dello storyboard dal testo Gemini (con o senza code fence)."""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+
+    return json.loads(text.strip())
+
+def create_fallback_story(photo_paths: List[Path], style: str) -> Dict:
+    """Fallback story se Gemini fallisce."""
+    scenes = []
+
+    for i, photo_path in enumerate(photo_paths):
+        scenes.append({
+            "photo_index": i,
+            "scene_title": f"Scene {i+1}",
+            "description": f"A {style.lower()} scene captured in this moment",
+            "veo_prompt": f"Cinematic {style.lower()} scene with smooth camera movement, professional cinematography, high quality, dramatic lighting",
+            "camera_movement": "dolly forward",
+            "duration": CLIP_DURATION,
+            "transition_to_next": "Flows naturally into next scene"
+        })
+
+    return {
+        "title": f"My {style} Story",
+        "story_summary": f"A {style.lower()} journey through captured moments",
+        "narrative_arc": "journey",
+        "scenes": scenes,
+        "final_message": "A memorable journey"
+    }
+
+class StoryStreamParser:
+    """
+    Parser JSON incrementale per lo storyboard Gemini.
+
+    `feed()` riceve il testo a pezzi e ritorna gli elementi di "scenes"
+    appena il loro oggetto si chiude; i campi stringa di primo livello già
+    completi (title, story_summary, ...) sono in `fields`. Testo e code
+    fence prima della prima graffa vengono ignorati.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, str] = {}
+        self.complete = False
+        self._pos = 0
+        self._root = None  # offset della graffa di apertura
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key = None
+        self._after_colon = False
+        self._in_scenes = False
+        self._scene_start = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Aggiunge testo; ritorna le scene completate da questo pezzo."""
+        self.text += chunk
+        scenes = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            c = text[i]
+
+            if self.complete:
+                break
+            if self._root is None:
+                if c == '{':
+                    self._root, self._depth = i, 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._top_level_string(json.loads(text[self._string_start:i + 1]))
+                continue
+
+            if c == '"':
+                self._in_string, self._string_start = True, i
+            elif c in '{[':
+                self._depth += 1
+                if c == '[' and self._depth == 2 and self._key == 'scenes':
+                    self._in_scenes = True
+                elif c == '{' and self._in_scenes and self._depth == 3:
+                    self._scene_start = i
+            elif c in '}]':
+                self._depth -= 1
+                if c == '}' and self._scene_start is not None and self._depth == 2:
+                    scenes.append(json.loads(text[self._scene_start:i + 1]))
+                    self._scene_start = None
+                elif c == ']' and self._depth == 1:
+                    self._in_scenes = False
+                elif self._depth == 0:
+                    self.complete = True
+            elif self._depth == 1 and c == ':':
+                self._after_colon = True
+            elif self._depth == 1 and c == ',':
+                self._after_colon = False
+
+        self._pos = len(text)
+        return scenes
+
+    def _top_level_string(self, value: str) -> None:
+        if self._after_colon:
+            self.fields[self._key] = value
+            self._after_colon = False
+        else:
+            self._key = value
+
+    def finish(self) -> Dict:
+        """Storia completa; JSONDecodeError se lo stream è troncato o malformato."""
+        if self._root is None:
+            raise json.JSONDecodeError("Nessun oggetto JSON nello stream", self.text, 0)
+        return json.JSONDecoder().raw_decode(self.text[self._root:])[0]
+
+class StoryStream:
+    """
+    Storyboard Gemini in streaming: ogni scena è usabile appena completa.
+
+    Iterando `scenes()` le scene arrivano nell'ordine del JSON, così la
+    generazione video parte mentre Gemini scrive ancora le successive. A
+    fine iterazione `story` contiene la storia completa. Uno stream
+    malformato degrada a create_fallback_story: le scene già emesse restano,
+    le foto non ancora coperte ricevono scene di fallback.
+
+    Oltre STORY_CHUNK_SIZE foto la storia è scritta a capitoli in parallelo:
+    le scene di un capitolo escono appena lui e i precedenti sono pronti, e
+    il reduce finale aggiorna titolo e transizioni tra capitoli in `story`.
+    """
+
+    def __init__(self, photo_paths: List[Path], style: str):
+        self.photo_paths = photo_paths
+        self.style = style
+        self.story: Optional[Dict] = None
+        self.fields: Dict[str, str] = {}
+        self.first_scene_s: Optional[float] = None
+        self.degraded = False
+
+    def scenes(self) -> Iterable[Dict]:
+        events = current_events()
+        started = time.perf_counter()
+        cache_key = story_cache_key(self.photo_paths, self.style)
+        cached_story = STORY_CACHE.get(cache_key)
+        if cached_story:
+            events.success(f"⚡ Storia dalla cache: '{cached_story.get('title', 'Untitled')}'")
+            self.fields = {k: v for k, v in cached_story.items() if isinstance(v, str)}
+            self.story = cached_story
+            record_span("story", started, cached=True)
+            yield from cached_story['scenes']
+            return
+
+        if len(self.photo_paths) > STORY_CHUNK_SIZE:
+            yield from self._chapter_scenes(cache_key, started)
+            return
+
+        emitted: List[Dict] = []
+        parser = StoryStreamParser()
+
+        try:
+            events.info("📖 Gemini sta scrivendo la storia (streaming)...")
+            response = request_story(self.photo_paths, self.style, stream=True)
+
+            for chunk in response:
+                for scene in parser.feed(chunk.text):
+                    if self.first_scene_s is None:
+                        self.first_scene_s = time.perf_counter() - started
+                    self.fields = parser.fields
+                    emitted.append(scene)
+                    yield scene
+
+            # Fino alla chiusura dello stream: le prime scene sono già in generazione
+            METRICS.inc("pipeline_payload_bytes_total", len(parser.text), service="gemini", direction="received")
+            record_span("story", started, streamed=True, scenes=len(emitted))
+
+            story = parser.finish()
+            self.fields = parser.fields
+            if not story.get('scenes'):
+                raise ValueError("storia senza scene")
+
+            STORY_CACHE.put(cache_key, story)
+            events.success(f"✅ Storia creata: '{story.get('title', 'Untitled')}'")
+
+        except Exception as e:
+            events.error(f"❌ Story streaming error: {e}")
+            self.degraded = True
+            if not parser.complete:
+                record_span("story", started, type(e).__name__, streamed=True, scenes=len(emitted))
+
+            story = create_fallback_story(self.photo_paths, self.style)
+            covered = {
+                resolve_scene_photo_index(len(self.photo_paths), scene, k)
+                for k, scene in enumerate(emitted)
+            }
+            story['scenes'] = emitted + [s for s in story['scenes'] if s['photo_index'] not in covered]
+            story.update(self.fields)
+
+        self.story = story
+        yield from story['scenes'][len(emitted):]
+
+    def _chapter_scenes(self, cache_key: str, started: float) -> Iterable[Dict]:
+        events = current_events()
+        chapters = story_chapters(len(self.photo_paths))
+        workers = max(1, min(STORY_CHUNK_CONCURRENCY, len(chapters)))
+        events.info(f"📖 Album grande: {len(chapters)} capitoli (max {STORY_CHUNK_SIZE} foto), "
+                    f"{workers} in parallelo")
+
+        context = _capture_thread_context()
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story-chapter")
+        futures = [
+            pool.submit(_run_with_thread_context, context, request_chapter,
+                        self.photo_paths[chapter.start:chapter.stop], self.style, n, len(chapters),
+                        len(self.photo_paths))
+            for n, chapter in enumerate(chapters)
+        ]
+
+        chapter_stories: List[Dict] = []
+        emitted: List[Dict] = []
+        try:
+            # In ordine: le scene del capitolo n partono appena n (e i precedenti) sono pronti
+            for n, (chapter, future) in enumerate(zip(chapters, futures)):
+                chapter_paths = self.photo_paths[chapter.start:chapter.stop]
+                try:
+                    chapter_story = future.result()
+                except Exception as e:
+                    events.warning(f"⚠️ Capitolo {n + 1} fallito ({e}): scene di fallback")
+                    self.degraded = True
+                    chapter_story = create_fallback_story(chapter_paths, self.style)
+
+                chapter_stories.append(chapter_story)
+                if n == 0:
+                    # Titolo provvisorio (output progressivo) finché il reduce non scrive quello finale
+                    self.fields = {k: v for k, v in chapter_story.items() if isinstance(v, str)}
+
+                for scene in rebase_chapter_scenes(chapter_story, len(chapter_paths), chapter.start, n):
+                    if self.first_scene_s is None:
+                        self.first_scene_s = time.perf_counter() - started
+                    emitted.append(scene)
+                    yield scene
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        story, reduced = reduce_chapters(chapter_stories, emitted, self.style, len(self.photo_paths))
+        self.fields = {k: v for k, v in story.items() if isinstance(v, str)}
+        record_span("story", started, chapters=len(chapters), scenes=len(emitted))
+
+        # Storie con capitoli di fallback o senza reduce non finiscono in cache
+        if reduced and not self.degraded:
+            STORY_CACHE.put(cache_key, story)
+        events.success(f"✅ Storia creata: '{story.get('title', 'Untitled')}' ({len(chapters)} capitoli)")
+
+        self.story = story
+
+# ============================================================================
+# STORYBOARD A CAPITOLI: album grandi riassunti in parallelo e poi uniti
+# ============================================================================
+
+def story_chapters(n_photos: int, chunk_size: int = 0) -> List[range]:
+    """Capitoli consecutivi bilanciati (9 foto → 5 + 4, non 8 + 1)."""
+    chunk_size = chunk_size or STORY_CHUNK_SIZE
+    n_chapters = max(1, -(-n_photos // chunk_size))
+    base, extra = divmod(n_photos, n_chapters)
+
+    chapters, start = [], 0
+    for n in range(n_chapters):
+        size = base + (1 if n < extra else 0)
+        chapters.append(range(start, start + size))
+        start += size
+    return chapters
+
+def request_chapter(photo_paths: List[Path], style: str, chapter: int, n_chapters: int, album_photos: int) -> Dict:
+    """Storia di un capitolo (una richiesta Gemini con le sue foto); ValueError se senza scene."""
+    prompt = STORY_CHAPTER_PROMPT_TEMPLATE.format(
+        n_photos=len(photo_paths),
+        style=style,
+        style_description=STYLE_PRESETS.get(style, style),
+        clip_duration=CLIP_DURATION,
+        chapter=chapter + 1,
+        n_chapters=n_chapters,
+        album_photos=album_photos,
+        last_index=len(photo_paths) - 1
+    )
+
+    with span("story_chapter", chapter=chapter, photos=len(photo_paths)):
+        response = request_story(photo_paths, style, prompt=prompt)
+
+    response_text = response.text
+    METRICS.inc("pipeline_payload_bytes_total", len(response_text), service="gemini", direction="received")
+
+    with span("story_parse", chapter=chapter):
+        story = parse_story_text(response_text)
+    if not story.get('scenes'):
+        raise ValueError("capitolo senza scene")
+    return story
+
+def rebase_chapter_scenes(chapter_story: Dict, n_photos: int, offset: int, chapter: int) -> List[Dict]:
+    """Scene di un capitolo con photo_index riportato sull'album intero."""
+    return [
+        dict(scene, photo_index=offset + resolve_scene_photo_index(n_photos, scene, k), chapter=chapter)
+        for k, scene in enumerate(chapter_story['scenes'])
+    ]
+
+def chapter_outline(n: int, chapter_story: Dict, scenes: List[Dict]) -> str:
+    """Riga compatta di un capitolo per il reduce (niente foto: il prompt resta piccolo)."""
+    first, last = scenes[0], scenes[-1]
+    return (
+        f"Capitolo {n + 1} (foto {first['photo_index'] + 1}-{last['photo_index'] + 1}): "
+        f"\"{chapter_story.get('title', '')}\" - {chapter_story.get('story_summary', '')}\n"
+        f"  Prima scena: {first.get('scene_title', '')} - {first.get('description', '')}\n"
+        f"  Ultima scena: {last.get('scene_title', '')} - {last.get('description', '')}"
+    )
+
+def reduce_chapters(chapter_stories: List[Dict], scenes: List[Dict], style: str, n_photos: int) -> tuple:
+    """
+    Unisce i capitoli in una storia sola: titolo, arco e transizioni tra
+    capitoli da una richiesta Gemini di solo testo. Le scene (già in
+    generazione) sono aggiornate sul posto. Ritorna (storia, reduce riuscito):
+    se il reduce fallisce restano titolo e riassunti dei capitoli.
+    """
+    events = current_events()
+    by_chapter: Dict[int, List[Dict]] = {}
+    for scene in scenes:
+        by_chapter.setdefault(scene['chapter'], []).append(scene)
+
+    outlines = [chapter_outline(n, chapter_story, by_chapter[n])
+                for n, chapter_story in enumerate(chapter_stories)]
+    first = chapter_stories[0]
+    story = {
+        "title": first.get('title', f"My {style} Story"),
+        "story_summary": " ".join(c.get('story_summary', '') for c in chapter_stories).strip(),
+        "narrative_arc": first.get('narrative_arc', 'journey'),
+        "scenes": scenes,
+        "final_message": chapter_stories[-1].get('final_message', ''),
+        "chapters": [
+            {"title": c.get('title', ''), "summary": c.get('story_summary', ''), "scenes": len(by_chapter[n])}
+            for n, c in enumerate(chapter_stories)
+        ],
+    }
+
+    transitions: Dict[int, str] = {}
+    reduced = False
+    try:
+        prompt = STORY_REDUCE_PROMPT_TEMPLATE.format(
+            n_photos=n_photos,
+            n_chapters=len(chapter_stories),
+            chapters="\n".join(outlines),
+            style=style,
+            style_description=STYLE_PRESETS.get(style, style),
+            n_transitions=len(chapter_stories) - 1
+        )
+        with span("story_reduce", chapters=len(chapter_stories)):
+            response = request_story([], style, prompt=prompt)
+            METRICS.inc("pipeline_payload_bytes_total", len(response.text), service="gemini", direction="received")
+            merged = parse_story_text(response.text)
+
+        story.update({k: v for k, v in merged.items()
+                      if k in ("title", "story_summary", "narrative_arc", "final_message") and isinstance(v, str) and v})
+        for k, item in enumerate(merged.get('transitions') or []):
+            if not isinstance(item, dict) or not item.get('transition_to_next'):
+                continue
+            chapter = item.get('from_chapter')
+            chapter = chapter - 1 if isinstance(chapter, int) and 1 <= chapter < len(chapter_stories) else k
+            transitions[chapter] = str(item['transition_to_next'])
+        reduced = True
+    except Exception as e:
+        events.warning(f"⚠️ Unione capitoli fallita ({e}): titolo e transizioni dei singoli capitoli")
+
+    # Collegamenti coerenti: ogni scena (tranne l'ultima) punta alla successiva
+    for n in range(len(chapter_stories) - 1):
+        by_chapter[n][-1]['transition_to_next'] = transitions.get(n) or "Dissolve into the next chapter"
+    for scene in scenes[:-1]:
+        if not scene.get('transition_to_next'):
+            scene['transition_to_next'] = "Flows naturally into next scene"
+
+    return story, reduced
+
+def story_requests(n_photos: int) -> int:
+    """Richieste Gemini per lo storyboard di n foto (capitoli + reduce oltre STORY_CHUNK_SIZE)."""
+    if n_photos <= STORY_CHUNK_SIZE:
+        return 1 if n_photos else 0
+    return len(story_chapters(n_photos)) + 1
+
+def selection_savings(selection: Dict) -> Dict:
+    """
+    Chiamate e secondi risparmiati rispetto a usare tutte le foto (le prime
+    max_photos, come senza selezione): secondi = generazioni Veo evitate ×
+    latenza Veo mediana (o VEO_SCENE_SECONDS_ESTIMATE senza misure).
+    """
+    n, max_photos = selection['n_photos'], selection['max_photos']
+    before = min(n, max_photos) if max_photos else n
+    after = len(selection['keep'])
+    scenes = max(0, before - after)
+    veo_seconds = VEO_LATENCY.stats().get("p50", VEO_SCENE_SECONDS_ESTIMATE)
+    return {
+        "veo_calls": scenes,
+        "gemini_images": scenes,
+        "gemini_calls": max(0, story_requests(before) - story_requests(after)),
+        "seconds": round(scenes * veo_seconds, 1),
+    }
+
+def resolve_scene_photo_index(n_photos: int, scene: Dict, scene_idx: int) -> int:
+    """Indice foto di una scena (photo_index fuori range → ciclico)."""
+    photo_idx = scene.get('photo_index', scene_idx)
+
+    if not isinstance(photo_idx, int) or not 0 <= photo_idx < n_photos:
+        photo_idx = scene_idx % n_photos
+
+    return photo_idx
+
+def resolve_scene_photo(photo_paths: List[Path], scene: Dict, scene_idx: int) -> Path:
+    """Foto di riferimento per una scena."""
+    return photo_paths[resolve_scene_photo_index(len(photo_paths), scene, scene_idx)]
@@ -0,0 +1,367 @@
+"""
+Eventi, metriche e contesto dei thread della pipeline.
+
+Qui non si importa nulla del resto del package: gli altri moduli registrano
+le proprie metriche con METRICS.add_collector() e la UI il proprio sink
+eventi con set_default_events().
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional
+
+# ============================================================================
+# EVENTI PIPELINE: progresso e messaggi indipendenti dalla UI
+# ============================================================================
+
+class PipelineEvents:
+    """
+    Callback di progresso/eventi della pipeline.
+
+    La pipeline non chiama mai st.* direttamente: usa current_events().
+    StreamlitEvents (app.py) disegna nella pagina, la CLI batch (batch_render.py)
+    scrive log e tempi; questa classe base ignora tutto (job in background).
+    """
+
+    def message(self, level: str, text: str) -> None:
+        """level: info | success | warning | error | write | caption | code"""
+
+    def info(self, text: str) -> None:
+        self.message("info", text)
+
+    def success(self, text: str) -> None:
+        self.message("success", text)
+
+    def warning(self, text: str) -> None:
+        self.message("warning", text)
+
+    def error(self, text: str) -> None:
+        self.message("error", text)
+
+    def write(self, text: str) -> None:
+        self.message("write", text)
+
+    def caption(self, text: str) -> None:
+        self.message("caption", text)
+
+    def code(self, text: str) -> None:
+        self.message("code", text)
+
+    @contextmanager
+    def busy(self, text: str):
+        """Operazione lunga in corso (spinner nella UI)."""
+        yield
+
+    def stage(self, key: str, title: str) -> None:
+        """Inizio di uno step: 'story', 'scenes', 'merge'."""
+
+    def progress(self, fraction: float) -> None:
+        """Avanzamento complessivo 0..1."""
+
+    def story_ready(self, story: Dict) -> None:
+        """Storia completa (titolo, tema, arco narrativo)."""
+
+    def scene_planned(self, index: int, scene: Dict) -> None:
+        """Scena dello storyboard disponibile (anche durante lo streaming)."""
+
+    def scene_done(self, index: int, scene: Dict, clip: Optional[Path]) -> None:
+        """Scena generata (clip None = fallita)."""
+
+    def preview_clip(self, clip: Path) -> None:
+        """Clip pubblicato nell'output progressivo, già riproducibile."""
+
+    def run_finished(self, stage_seconds: Dict[str, float]) -> None:
+        """Fine run: secondi cumulati per stage/sotto-step (vedi span)."""
+
+_EVENTS_LOCAL = threading.local()
+_DEFAULT_EVENTS: Callable[[], PipelineEvents] = PipelineEvents
+
+def set_default_events(factory: Callable[[], PipelineEvents]) -> None:
+    """Sink dei thread senza events_scope (la UI registra StreamlitEvents)."""
+    global _DEFAULT_EVENTS
+    _DEFAULT_EVENTS = factory
+
+def current_events() -> PipelineEvents:
+    """Sink eventi del thread corrente (default: set_default_events, nella UI la pagina Streamlit)."""
+    sink = getattr(_EVENTS_LOCAL, "sink", None)
+    return sink if sink is not None else _DEFAULT_EVENTS()
+
+@contextmanager
+def events_scope(sink: PipelineEvents):
+    """Instrada gli eventi della pipeline di questo thread verso `sink`."""
+    previous = getattr(_EVENTS_LOCAL, "sink", None)
+    _EVENTS_LOCAL.sink = sink
+    try:
+        yield sink
+    finally:
+        _EVENTS_LOCAL.sink = previous
+
+# ============================================================================
+# METRICHE: span per stage, contatori, export Prometheus e trace JSON
+# ============================================================================
+
+# Bucket (s) per le durate: dai ms del decode base64 ai minuti di Veo
+STAGE_BUCKETS = (0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+class MetricsRegistry:
+    """
+    Contatori e istogrammi di processo, esportati in formato testo Prometheus.
+
+    Registrare costa un lock e un dict update (µs): resta attivo sempre.
+    I `collectors` producono metriche al momento dell'export (breaker,
+    cache, ...) senza toccare il percorso caldo.
+    """
+
+    def __init__(self, buckets: tuple = STAGE_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, list] = {}  # → [conteggi per bucket, somma, count]
+        self._help: Dict[str, tuple] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[tuple] = None) -> None:
+        """`buckets`: limiti propri di un istogramma (default: durate STAGE_BUCKETS)."""
+        self._help[name] = (kind, help_text)
+        if buckets:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets = self._buckets.get(name, self.buckets)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        """`collector()` → iterabile di (nome, tipo, labels, valore)."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": {_metric_id(n, l): v for (n, l), v in self._counters.items()},
+                "histograms": {_metric_id(n, l): {"sum": h[1], "count": h[2]}
+                               for (n, l), h in self._histograms.items()},
+            }
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: [list(h[0]), h[1], h[2]] for k, h in self._histograms.items()}
+
+        families: Dict[str, list] = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append(f"{_metric_id(name, labels)} {value:g}")
+
+        for (name, labels), (counts, total, count) in histograms.items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, n in zip(self._buckets.get(name, self.buckets), counts):
+                cumulative += n
+                lines.append(f"{_metric_id(name + '_bucket', labels + (('le', f'{bound:.12g}'),))} {cumulative}")
+            lines.append(f"{_metric_id(name + '_bucket', labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{_metric_id(name + '_sum', labels)} {total:.6f}")
+            lines.append(f"{_metric_id(name + '_count', labels)} {count}")
+
+        kinds = {}
+        for collector in self._collectors:
+            try:
+                for name, kind, labels, value in collector():
+                    kinds.setdefault(name, kind)
+                    families.setdefault(name, []).append(
+                        f"{_metric_id(name, tuple(sorted(labels.items())))} {value:g}"
+                    )
+            except Exception:
+                continue  # un collector rotto non deve bloccare l'export
+
+        out = []
+        for name in sorted(families):
+            kind, help_text = self._help.get(name, (kinds.get(name, "untyped"), ""))
+            if help_text:
+                out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(families[name])
+        return "\n".join(out) + "\n"
+
+def _metric_id(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                        for k, v in labels)
+    return f"{name}{{{rendered}}}"
+
+METRICS = MetricsRegistry()
+METRICS.describe("pipeline_stage_seconds", "histogram", "Durata di stage e sotto-step della pipeline")
+METRICS.describe("pipeline_payload_bytes_total", "counter", "Byte scambiati con i backend (service, direction)")
+METRICS.describe("pipeline_fallback_total", "counter", "Clip fallback Ken Burns usati, per motivo")
+METRICS.describe("pipeline_scenes_total", "counter", "Scene completate per esito")
+METRICS.describe("pipeline_runs_total", "counter", "Run della pipeline per esito")
+
+class RunTrace:
+    """Span di un run, esportabili come trace JSON (formato Chrome/Perfetto)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, duration: float, attrs: Dict, error: Optional[str]) -> None:
+        record = {
+            "name": stage,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.current_thread().name,
+            "args": dict(attrs, error=error) if error else attrs,
+        }
+        with self._lock:
+            self.spans.append(record)
+
+    def totals(self) -> Dict[str, float]:
+        """Secondi cumulati per stage (gli span paralleli si sommano)."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record["name"]] = totals.get(record["name"], 0.0) + record["dur"] / 1e6
+        return totals
+
+    def dump(self, folder: Path) -> Path:
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{self.run_id}.json"
+        with self._lock:
+            payload = {"traceEvents": list(self.spans), "metadata": {"run": self.name, "run_id": self.run_id}}
+        path.write_text(json.dumps(payload))
+        return path
+
+def record_span(stage: str, start: float, error: Optional[str] = None,
+                trace: Optional[RunTrace] = None, **attrs) -> None:
+    """
+    Registra uno stage iniziato a `start` (perf_counter) e finito ora.
+
+    Per i casi in cui un `with span(...)` non è possibile: generatori,
+    callback di Future (`trace` catturato dal thread che ha avviato il lavoro).
+    """
+    duration = time.perf_counter() - start
+    METRICS.observe("pipeline_stage_seconds", duration, stage=stage)
+    trace = trace or getattr(_EVENTS_LOCAL, "trace", None)
+    if trace is not None:
+        trace.add(stage, start, duration, attrs, error)
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Misura uno stage: istogramma di processo + span nel trace del run (se attivo)."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record_span(stage, start, error, **attrs)
+
+@contextmanager
+def trace_scope(trace: Optional[RunTrace]):
+    """Raccoglie in `trace` gli span di questo thread (e dei worker che lo ereditano)."""
+    previous = getattr(_EVENTS_LOCAL, "trace", None)
+    _EVENTS_LOCAL.trace = trace
+    try:
+        yield trace
+    finally:
+        _EVENTS_LOCAL.trace = previous
+
+def write_metrics_file(path: Path) -> None:
+    """Export atomico per il textfile collector di node_exporter."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(METRICS.render_prometheus())
+    os.replace(tmp, path)
+
+def start_metrics_server(port: int):
+    """Endpoint /metrics locale (thread daemon); ritorna il server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+# ============================================================================
+# CONTESTO DEI THREAD: sessione Streamlit, sink, trace e run propagati ai worker
+# ============================================================================
+
+def current_run_id() -> Optional[str]:
+    return getattr(_EVENTS_LOCAL, "run_id", None)
+
+def _script_run_ctx():
+    """Contesto Streamlit del thread corrente (None fuori da `streamlit run`)."""
+    if "streamlit" not in sys.modules:
+        return None  # CLI batch e test: niente import di streamlit solo per scoprirlo
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        return None
+
+def _attach_script_run_ctx(ctx) -> None:
+    """Collega il thread corrente alla sessione Streamlit, così st.* funziona nei worker."""
+    if ctx is None:
+        return
+    from streamlit.runtime.scriptrunner import add_script_run_ctx
+    add_script_run_ctx(threading.current_thread(), ctx)
+
+def _capture_thread_context() -> tuple:
+    """Contesto da propagare ai worker: sessione Streamlit, sink eventi, trace, cartelle del run e image store."""
+    return (_script_run_ctx(), getattr(_EVENTS_LOCAL, "sink", None), getattr(_EVENTS_LOCAL, "trace", None),
+            current_run_id(), getattr(_EVENTS_LOCAL, "image_store", None))
+
+def _attach_thread_context(context: tuple) -> None:
+    script_ctx, sink, trace, run_id, image_store = context
+    _attach_script_run_ctx(script_ctx)
+    _EVENTS_LOCAL.sink = sink
+    _EVENTS_LOCAL.trace = trace
+    _EVENTS_LOCAL.run_id = run_id
+    _EVENTS_LOCAL.image_store = image_store
+
+def _run_with_thread_context(context: tuple, fn: Callable, *args):
+    _attach_thread_context(context)
+    return fn(*args)
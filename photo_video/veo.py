@@ -0,0 +1,505 @@
+"""
+Clip Veo: richiesta, decode base64 su disco, validazione MP4, operation long-running.
+"""
+
+from __future__ import annotations
+
+import random
+import asyncio
+import time
+import base64
+import binascii
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional
+
+from .config import (
+    CLIP_DURATION, GCP_LOCATION, GCP_PROJECT_ID, STYLE_PRESETS, VEO_API_BASE, VEO_ASPECT_RATIO,
+    VEO_DECODE_CHUNK_BYTES, VEO_INPUT_LONG_SIDE, VEO_MAX_OPERATIONS, VEO_MIN_CLIP_SECONDS,
+    VEO_MODEL, VEO_OPERATION_TIMEOUT, VEO_POLL_INITIAL_SECONDS, VEO_POLL_MAX_SECONDS,
+    VEO_REFERENCE_FIT, VEO_REFERENCE_MAX_BYTES, VIDEO_FPS,
+)
+from .telemetry import METRICS, _EVENTS_LOCAL, current_events, record_span, span, trace_scope
+from .backends import CLIENTS, VEO_GUARD, VEO_LATENCY, VeoClipError, VeoOperationError
+from .storage import CLIP_CACHE, ClipCache, unique_clip_path
+from .photos import prepare_veo_reference
+
+# ============================================================================
+# STEP 2: VIDEO GENERATION con Veo 2
+# ============================================================================
+
+def build_veo_request(photo_path: Path, scene: Dict, style: str) -> Dict:
+    """
+    Richiesta Veo per una scena: prompt completo, reference ridotta,
+    parametri, instances e chiave cache.
+    """
+    # Prepara prompt per Veo 2
+    veo_prompt = scene.get('veo_prompt', scene.get('description', ''))
+
+    # Arricchisci prompt con stile
+    full_prompt = f"{veo_prompt}. Style: {STYLE_PRESETS.get(style, style)}. Cinematic quality, smooth motion, {scene.get('camera_movement', 'slow movement')}"
+
+    veo_parameters = {
+        "duration": f"{CLIP_DURATION}s",
+        "aspectRatio": VEO_ASPECT_RATIO,
+        "fps": VIDEO_FPS
+    }
+
+    # Immagine di riferimento ridotta (memoizzata per foto)
+    with span("veo_reference"):
+        reference = prepare_veo_reference(photo_path, VEO_ASPECT_RATIO)
+
+    # Cache: stessa foto + stessa richiesta → nessuna nuova prediction
+    cache_key = ClipCache.make_key(reference['content_hash'], {
+        "model": VEO_MODEL,
+        "prompt": full_prompt,
+        "parameters": veo_parameters,
+        "reference": [VEO_INPUT_LONG_SIDE, VEO_REFERENCE_FIT, VEO_REFERENCE_MAX_BYTES]
+    })
+
+    instances = [{
+        "prompt": full_prompt,
+        "reference_image": {
+            "bytesBase64Encoded": reference['b64'],
+            "mimeType": reference['mime_type']
+        },
+        "parameters": veo_parameters
+    }]
+
+    return {
+        "prompt": full_prompt,
+        "reference": reference,
+        "parameters": veo_parameters,
+        "instances": instances,
+        "cache_key": cache_key,
+    }
+
+def extract_veo_video_b64(payload: Dict) -> str:
+    """Video base64 da una prediction (`videoBase64`) o da una operation (`videos[]`)."""
+    if payload.get('videoBase64'):
+        return payload['videoBase64']
+    videos = payload.get('videos') or []
+    if videos:
+        return videos[0].get('bytesBase64Encoded', '')
+    return ''
+
+def serialized_size(message) -> int:
+    """Byte di un messaggio protobuf (proto-plus o nativo); 0 se non è un proto."""
+    try:
+        pb = type(message).pb(message) if hasattr(type(message), "pb") else message
+        return pb.ByteSize()
+    except Exception:
+        return 0
+
+METRICS.describe("pipeline_veo_invalid_clips_total", "counter", "Clip Veo scartati dalla validazione")
+METRICS.describe("pipeline_veo_decode_estimated_peak_bytes", "histogram",
+                 "Stima del picco di memoria per scena nel decode Veo (response + base64 + blocchi)",
+                 buckets=(256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20))
+
+def decode_base64_to_file(data: str, f, chunk_chars: int = VEO_DECODE_CHUNK_BYTES) -> int:
+    """Decodifica base64 a blocchi (multipli di 4 caratteri) scrivendo su `f`; ritorna i byte scritti."""
+    chunk_chars = max(4, chunk_chars - chunk_chars % 4)
+    written = 0
+    for start in range(0, len(data), chunk_chars):
+        try:
+            block = base64.b64decode(data[start:start + chunk_chars], validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise VeoClipError(f"base64 non valido (carattere {start}+): {e}") from e
+        f.write(block)
+        written += len(block)
+    return written
+
+def probe_mp4_fast(path: Path) -> Dict:
+    """
+    Controllo rapido del container, senza ffprobe: i box di primo livello
+    devono coprire esattamente il file (niente troncamenti), con ftyp in
+    testa, moov e mdat presenti; la durata viene da moov/mvhd. Legge solo
+    header e moov (pochi KB).
+
+    Raises:
+        VeoClipError se il file non è un MP4 completo o dura meno di VEO_MIN_CLIP_SECONDS
+    """
+    size = path.stat().st_size
+    boxes: Dict[bytes, tuple] = {}
+    order = []
+
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset < size:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                raise VeoClipError(f"MP4 troncato: header incompleto a {offset}")
+            box_size, box_type = struct.unpack('>I4s', header[:8])
+            header_len = 8
+            if box_size == 1:
+                if len(header) < 16:
+                    raise VeoClipError(f"MP4 troncato: header incompleto a {offset}")
+                box_size, header_len = struct.unpack('>Q', header[8:16])[0], 16
+            elif box_size == 0:
+                box_size = size - offset  # ultimo box fino a fine file
+            if box_size < header_len or offset + box_size > size:
+                raise VeoClipError(f"MP4 troncato: box {box_type!r} di {box_size} byte a {offset} su {size}")
+            boxes.setdefault(box_type, (offset + header_len, box_size - header_len))
+            order.append(box_type)
+            offset += box_size
+
+        if not order or order[0] != b'ftyp':
+            raise VeoClipError("non è un MP4 (manca ftyp in testa)")
+        if b'moov' not in boxes or b'mdat' not in boxes or not boxes[b'mdat'][1]:
+            raise VeoClipError(f"MP4 incompleto: box {[t.decode('latin-1') for t in order]}")
+
+        moov_start, moov_size = boxes[b'moov']
+        f.seek(moov_start)
+        moov = f.read(min(moov_size, 16 << 20))
+
+    duration = None
+    pos = 0
+    while pos + 8 <= len(moov):
+        child_size, child_type = struct.unpack('>I4s', moov[pos:pos + 8])
+        if child_type == b'mvhd':
+            version = moov[pos + 8]
+            if version == 1:
+                timescale, length = struct.unpack('>IQ', moov[pos + 28:pos + 40])
+            else:
+                timescale, length = struct.unpack('>II', moov[pos + 20:pos + 28])
+            duration = length / timescale if timescale else None
+            break
+        if child_size < 8:
+            break
+        pos += child_size
+
+    if duration is None:
+        raise VeoClipError("MP4 senza mvhd valido")
+    if duration < VEO_MIN_CLIP_SECONDS:
+        raise VeoClipError(f"clip di {duration:.2f}s (minimo {VEO_MIN_CLIP_SECONDS:g}s)")
+
+    return {"duration": duration, "boxes": [t.decode('latin-1') for t in order], "size": size}
+
+def save_veo_video(video_b64: str, output_path: Path, cache_key: str, response_bytes: int = 0) -> Dict:
+    """
+    Decodifica il clip a blocchi direttamente su file, lo valida e lo
+    aggiunge alla cache.
+
+    Mai i byte del video interi in memoria: restano la response ancora viva
+    (`response_bytes`, es. il proto della chiamata sincrona; 0 se il base64
+    è l'unica copia, come nel dict JSON delle operation), la stringa base64
+    e un blocco alla volta. `estimated_peak_bytes` è la somma: una stima
+    per scena, non una misura del processo.
+
+    Returns:
+        {"bytes", "duration", "estimated_peak_bytes"}
+
+    Raises:
+        VeoClipError se base64 o container non sono validi (file parziale rimosso)
+    """
+    METRICS.inc("pipeline_payload_bytes_total", len(video_b64), service="veo", direction="received")
+    chunk = min(VEO_DECODE_CHUNK_BYTES, len(video_b64))
+    # response + stringa base64 + blocco base64 + blocco decodificato
+    estimated_peak_bytes = response_bytes + len(video_b64) + chunk + chunk * 3 // 4
+
+    try:
+        with span("veo_decode", estimated_peak_bytes=estimated_peak_bytes), open(output_path, "wb") as f:
+            size = decode_base64_to_file(video_b64, f, VEO_DECODE_CHUNK_BYTES)
+        with span("veo_validate"):
+            info = probe_mp4_fast(output_path)
+    except VeoClipError:
+        METRICS.inc("pipeline_veo_invalid_clips_total")
+        output_path.unlink(missing_ok=True)
+        raise
+
+    METRICS.observe("pipeline_veo_decode_estimated_peak_bytes", estimated_peak_bytes)
+    CLIP_CACHE.store(cache_key, output_path)
+    return {"bytes": size, "duration": info['duration'], "estimated_peak_bytes": estimated_peak_bytes}
+
+def mark_veo_call_started() -> None:
+    """
+    La richiesta Veo vera parte ora (dopo quota e slot di VEO_GUARD): fa
+    partire il timer di hedging della scena, se la chiamata è sotto hedging.
+    """
+    callback = getattr(_EVENTS_LOCAL, "veo_call_started", None)
+    if callback is not None:
+        callback()
+
+def generate_veo_clip(photo_path: Path, scene: Dict, style: str) -> Optional[Path]:
+    """
+    Solo Veo 2, senza fallback: gli errori vengono propagati.
+
+    Usata dall'hedging, che gestisce il fallback in parallelo.
+    """
+    events = current_events()
+    events.info(f"🎥 Veo 2 sta generando video per: {scene['scene_title']}")
+
+    request = build_veo_request(photo_path, scene, style)
+    reference = request['reference']
+
+    events.write(f"📝 Prompt Veo: {request['prompt'][:100]}...")
+
+    saved = reference['original_bytes'] - reference['encoded_bytes']
+    events.caption(
+        f"🖼️ Reference: {reference['original_bytes'] / 1024:.0f} KB → "
+        f"{reference['encoded_bytes'] / 1024:.0f} KB (-{saved / 1024:.0f} KB, "
+        f"encode {reference['encode_ms']:.0f} ms)"
+    )
+
+    output_path = unique_clip_path("veo_clip", scene['photo_index'])
+
+    if CLIP_CACHE.fetch(request['cache_key'], output_path):
+        events.success(f"⚡ Clip dalla cache: {output_path.name}")
+        return output_path
+
+    # CHIAMA VEO 2 API via Vertex AI
+    # Documentazione: https://cloud.google.com/vertex-ai/docs/generative-ai/video/generate-videos
+
+    # Endpoint Veo 2
+    endpoint = f"projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/publishers/google/models/{VEO_MODEL}"
+
+    instances = request['instances']
+
+    def predict():
+        # Client riletto a ogni tentativo: un canale non sano viene ricreato
+        METRICS.inc("pipeline_payload_bytes_total", len(reference['b64']), service="veo", direction="sent")
+        call_started = time.monotonic()
+        mark_veo_call_started()
+        try:
+            with span("veo_call"):
+                response = CLIENTS.prediction_client().predict(
+                    endpoint=endpoint,
+                    instances=instances
+                )
+        except Exception as e:
+            CLIENTS.report_error("prediction", e)
+            raise
+
+        # Estrai video generato
+        if not response.predictions:
+            events.error("❌ Nessuna prediction da Veo")
+            return None
+
+        # Veo ritorna video in base64; decode e validazione dentro il retry (VeoClipError è ritentabile)
+        video_b64 = extract_veo_video_b64(response.predictions[0])
+        if not video_b64:
+            events.error("❌ Veo non ha ritornato video")
+            return None
+        # Il proto della response resta vivo durante il decode, accanto alla stringa estratta
+        saved = save_veo_video(video_b64, output_path, request['cache_key'], serialized_size(response))
+        # Solo chiamate vere, dall'inizio della chiamata: niente cache hit né attese in coda
+        VEO_LATENCY.record(time.monotonic() - call_started)
+        return saved
+
+    # Esegui predizione (quota, retry con backoff, circuit breaker)
+    with events.busy(f"⏳ Veo 2 sta generando video... (~30-60s)"):
+        saved = VEO_GUARD.call(predict)
+
+    if saved is None:
+        return None
+
+    events.success(
+        f"✅ Video generato: {output_path.name} ({saved['bytes'] / 1024 / 1024:.1f} MB, "
+        f"{saved['duration']:.1f}s, picco decode stimato {saved['estimated_peak_bytes'] / 1024 / 1024:.1f} MB)"
+    )
+    return output_path
+
+# ============================================================================
+# VEO LONG-RUNNING OPERATIONS: submit + polling asyncio
+# ============================================================================
+
+class VeoOperationsClient:
+    """
+    Client REST per `predictLongRunning` / `fetchPredictOperation` di Vertex AI.
+
+    `session` è una requests.Session (AuthorizedSession per Vertex, semplice
+    per il fake server locale).
+    """
+
+    def __init__(self, base_url: str, session, project: str, location: str, model: str = VEO_MODEL):
+        self.session = session
+        self.model_url = f"{base_url.rstrip('/')}/projects/{project}/locations/{location}/publishers/google/models/{model}"
+
+    def submit(self, instances: List[Dict], parameters: Dict) -> str:
+        """Avvia la generazione, ritorna il nome dell'operation."""
+        response = self.session.post(
+            f"{self.model_url}:predictLongRunning",
+            json={"instances": instances, "parameters": parameters},
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()['name']
+
+    def fetch(self, operation_name: str) -> Dict:
+        response = self.session.post(
+            f"{self.model_url}:fetchPredictOperation",
+            json={"operationName": operation_name},
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()
+
+class VeoOperationPoller:
+    """
+    Segue tutte le operation Veo in volo da un event loop asyncio dedicato.
+
+    `submit` ritorna subito un concurrent Future (awaitable con
+    asyncio.wrap_future, callback con add_done_callback); ogni operation
+    viene interrogata con backoff esponenziale + jitter. `Future.cancel()`
+    smette di seguirla (es. utente che abbandona il run). Se `finalize`
+    scarta il clip (VeoClipError) l'operation viene rilanciata, fino a
+    RETRY_MAX_ATTEMPTS tentativi. `guard` (default VEO_GUARD) applica quota,
+    retry e breaker a submit e poll: attese e backoff sul loop (asyncio.sleep),
+    le richieste HTTP su un pool dedicato, separato da quello dei finalize.
+    """
+
+    def __init__(self, client: VeoOperationsClient,
+                 initial_interval: float = VEO_POLL_INITIAL_SECONDS,
+                 max_interval: float = VEO_POLL_MAX_SECONDS,
+                 timeout: float = VEO_OPERATION_TIMEOUT,
+                 guard: Optional["ServiceGuard"] = None):
+        self.client = client
+        self.guard = guard or VEO_GUARD
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.polls = 0
+        self._outstanding = 0
+        self._http = ThreadPoolExecutor(max_workers=max(1, VEO_MAX_OPERATIONS), thread_name_prefix="veo-http")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="veo-poller", daemon=True)
+        self._thread.start()
+
+    def submit(self, instances: List[Dict], parameters: Dict,
+               finalize: Optional[Callable[[Dict], object]] = None,
+               on_started: Optional[Callable[[], None]] = None) -> Future:
+        """
+        Avvia un'operation; il Future si risolve con `finalize(response)`
+        (eseguito fuori dal loop) o con la response grezza. `on_started` è
+        chiamato a ogni richiesta di submit, dopo l'attesa di quota.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._track(instances, parameters, finalize, on_started), self._loop
+        )
+
+    @property
+    def outstanding(self) -> int:
+        return self._outstanding
+
+    async def _track(self, instances, parameters, finalize, on_started):
+        self._outstanding += 1
+        try:
+            for attempt in range(self.guard.max_attempts):
+                try:
+                    return await self._run_operation(instances, parameters, finalize, on_started)
+                except VeoClipError as e:
+                    # Clip corrotto o troncato: nuova operation, come un errore transitorio
+                    if attempt == self.guard.max_attempts - 1:
+                        self.guard.record_outcome(e)
+                        raise
+                    self.guard.record_retry(e)
+        finally:
+            self._outstanding -= 1
+
+    async def _run_operation(self, instances, parameters, finalize, on_started):
+        def submit():
+            if on_started is not None:
+                on_started()
+            return self.client.submit(instances, parameters)
+
+        name = await self.guard.call_async(submit, executor=self._http)
+        deadline = time.monotonic() + self.timeout
+        interval = self.initial_interval
+
+        while True:
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+            operation = await self.guard.call_async(
+                lambda: self.client.fetch(name), rate_limited=False, executor=self._http
+            )
+            self.polls += 1
+
+            if operation.get('done'):
+                if 'error' in operation:
+                    error = VeoOperationError(operation['error'].get('message', str(operation['error'])),
+                                              operation['error'].get('code'))
+                    self.guard.record_outcome(error)
+                    raise error
+                response = operation.get('response', {})
+                if finalize is None:
+                    return response
+                return await asyncio.to_thread(finalize, response)
+
+            if time.monotonic() > deadline:
+                raise VeoOperationError(f"Operation {name} oltre {self.timeout:.0f}s")
+            interval = min(interval * 1.6, self.max_interval)
+
+    def shutdown(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._http.shutdown(wait=False)
+
+_VEO_POLLER: Optional[VeoOperationPoller] = None
+_VEO_POLLER_LOCK = threading.Lock()
+
+def get_veo_poller() -> VeoOperationPoller:
+    """Poller unico per processo (VEO_API_BASE → fake server senza auth)."""
+    global _VEO_POLLER
+    with _VEO_POLLER_LOCK:
+        if _VEO_POLLER is None:
+            if VEO_API_BASE:
+                import requests
+                session, base_url = requests.Session(), VEO_API_BASE
+            else:
+                import google.auth
+                from google.auth.transport.requests import AuthorizedSession
+                credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+                session = AuthorizedSession(credentials)
+                base_url = f"https://{GCP_LOCATION}-aiplatform.googleapis.com/v1"
+            client = VeoOperationsClient(base_url, session, GCP_PROJECT_ID, GCP_LOCATION)
+            _VEO_POLLER = VeoOperationPoller(client)
+        return _VEO_POLLER
+
+def operations_metrics() -> Iterable[tuple]:
+    if _VEO_POLLER is not None:
+        yield "pipeline_veo_operations_in_flight", "gauge", {}, _VEO_POLLER.outstanding
+        yield "pipeline_veo_polls_total", "counter", {}, _VEO_POLLER.polls
+
+METRICS.add_collector(operations_metrics)
+
+def submit_veo_operation(photo_path: Path, scene: Dict, style: str,
+                         on_started: Optional[Callable[[], None]] = None) -> Future:
+    """
+    Scena come operation Veo non bloccante.
+
+    Args:
+        on_started: Chiamato quando parte la richiesta di submit (dopo la quota)
+
+    Returns:
+        Future con il Path del clip (già risolto se il clip è in cache)
+    """
+    request = build_veo_request(photo_path, scene, style)
+    output_path = unique_clip_path("veo_clip", scene.get('photo_index', 'x'))
+
+    if CLIP_CACHE.fetch(request['cache_key'], output_path):
+        future = Future()
+        future.set_result(output_path)
+        return future
+
+    trace = getattr(_EVENTS_LOCAL, "trace", None)
+
+    def finalize(response: Dict) -> Path:
+        predictions = response.get('predictions') or [response]
+        video_b64 = extract_veo_video_b64(predictions[0])
+        if not video_b64:
+            raise VeoOperationError("Veo non ha ritornato video")
+        # Gira su un thread del poller: il trace del run va passato esplicitamente
+        with trace_scope(trace):
+            save_veo_video(video_b64, output_path, request['cache_key'])
+        return output_path
+
+    def on_done(future: Future) -> None:
+        error = None if future.cancelled() or not future.exception() else type(future.exception()).__name__
+        record_span("veo_operation", started, error, trace, cancelled=future.cancelled())
+
+    METRICS.inc("pipeline_payload_bytes_total", len(request['reference']['b64']), service="veo", direction="sent")
+    started = time.perf_counter()
+    future = get_veo_poller().submit(request['instances'], request['parameters'], finalize, on_started)
+    future.add_done_callback(on_done)
+    return future
@@ -0,0 +1,68 @@
+"""
+Fixture comuni: nessuna chiamata API, nessuna sessione Streamlit.
+
+Gemini, Veo e FFmpeg sono sostituiti da stub; i test girano con
+`python -m pytest -q` dalla radice del repo.
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_video.telemetry import PipelineEvents, events_scope  # noqa: E402
+from photo_video.storage import StoryCache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet_events():
+    """Eventi della pipeline scartati (niente st.* fuori da `streamlit run`)."""
+    with events_scope(PipelineEvents()) as events:
+        yield events
+
+
+def make_photo(seed: int, size: tuple = (320, 240)) -> Image.Image:
+    """Foto sintetica con struttura (gradiente + rettangoli), diversa per ogni seed."""
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for k in range(4):
+        x = (seed * 53 + k * 71) % (size[0] - 40)
+        y = (seed * 29 + k * 37) % (size[1] - 40)
+        draw.rectangle([x, y, x + 40, y + 40], fill=((seed * 40) % 255, (k * 60) % 255, 128))
+    return img
+
+
+def jpeg_bytes(img: Image.Image, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def photo_paths(tmp_path):
+    """Quattro JPEG distinti su disco."""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"photo_{i}.jpg"
+        path.write_bytes(jpeg_bytes(make_photo(i)))
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    """Backoff dei retry quasi nullo."""
+    monkeypatch.setattr("photo_video.backends.RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr("photo_video.backends.RETRY_MAX_DELAY", 0.001)
+
+
+@pytest.fixture
+def story_cache(tmp_path, monkeypatch):
+    """STORY_CACHE in una cartella del test."""
+    cache = StoryCache(tmp_path / "story_cache", ttl_seconds=3600, max_entries=10)
+    monkeypatch.setattr("photo_video.story.STORY_CACHE", cache)
+    return cache
@@ -0,0 +1,132 @@
+import os
+import time
+
+import pytest
+
+from photo_video.config import GEMINI_IMAGE_SIZE, PREVIEW_IMAGE_SIZE, VEO_ASPECT_RATIO
+from photo_video.storage import ClipCache, StoryCache
+from photo_video.photos import ImageStore
+from conftest import jpeg_bytes, make_photo
+
+
+def test_clip_cache_roundtrip_and_lru_eviction(tmp_path):
+    cache = ClipCache(tmp_path / "cache", max_bytes=1000)
+    for age, name in ((30, "a"), (20, "b"), (10, "c")):
+        src = tmp_path / f"{name}.mp4"
+        src.write_bytes(b"x" * 100)
+        cache.store(name, src)
+        # mtime distinti: l'LRU ordina per mtime
+        os.utime(cache._entry(name), (time.time() - age, time.time() - age))
+    cache.max_bytes = 250
+    cache.evict()
+
+    assert not cache.fetch("a", tmp_path / "out_a.mp4")
+    assert cache.fetch("c", tmp_path / "out_c.mp4")
+    assert (tmp_path / "out_c.mp4").read_bytes() == b"x" * 100
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_clip_cache_key_depends_on_params():
+    key = ClipCache.make_key("hash", {"prompt": "p", "duration": 5})
+    assert key == ClipCache.make_key("hash", {"duration": 5, "prompt": "p"})
+    assert key != ClipCache.make_key("hash", {"prompt": "p", "duration": 6})
+    assert key != ClipCache.make_key("other", {"prompt": "p", "duration": 5})
+
+
+def test_story_cache_ttl(tmp_path):
+    cache = StoryCache(tmp_path, ttl_seconds=60, max_entries=10)
+    cache.put("k", {"title": "T"})
+    assert cache.get("k") == {"title": "T"}
+
+    cache.ttl_seconds = -1
+    assert cache.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+
+
+def test_story_cache_keeps_most_recent_entries(tmp_path):
+    cache = StoryCache(tmp_path, ttl_seconds=60, max_entries=2)
+    for age, key in ((30, "a"), (20, "b")):
+        cache.put(key, {"title": key})
+        os.utime(cache._entry(key), (time.time() - age, time.time() - age))
+    cache.put("c", {"title": "c"})
+
+    assert cache.get("a") is None
+    assert cache.get("b") == {"title": "b"} and cache.get("c") == {"title": "c"}
+
+
+def test_story_cache_key_depends_on_photos_style_and_prompt():
+    key = StoryCache.make_key(["h1", "h2"], "x", "prompt")
+    assert key != StoryCache.make_key(["h2", "h1"], "x", "prompt")
+    assert key != StoryCache.make_key(["h1", "h2"], "y", "prompt")
+    assert key != StoryCache.make_key(["h1", "h2"], "x", "prompt v2")
+
+
+def test_image_store_decodes_each_upload_once():
+    store = ImageStore(1 << 30)
+    data = jpeg_bytes(make_photo(1, (800, 600)))
+
+    h1 = store.add_bytes(data)
+    h2 = store.add_bytes(data)  # rerun
+    preview = store.get(h1, "preview")
+    gemini = store.get(h1, "gemini")
+
+    assert h1 == h2
+    assert store.stats()["decodes"] == 1
+    assert max(preview.size) <= max(PREVIEW_IMAGE_SIZE)
+    assert max(gemini.size) <= max(GEMINI_IMAGE_SIZE)
+
+
+def test_image_store_maps_saved_paths_without_rehashing(tmp_path, monkeypatch):
+    store = ImageStore(1 << 30)
+    data = jpeg_bytes(make_photo(2))
+    content_hash = store.add_bytes(data)
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+    store.register_path(path, content_hash)
+
+    monkeypatch.setattr("photo_video.photos.file_sha256", lambda p: pytest.fail("hash ricalcolato"))
+    assert store.hash_for_path(path) == content_hash
+    assert store.rendition_for_path(path, "preview") is store.get(content_hash, "preview")
+
+
+def test_image_store_keeps_registered_path_and_budgets_bytes(tmp_path):
+    store = ImageStore(1 << 30)
+    data = jpeg_bytes(make_photo(2))
+    content_hash = store.add_bytes(data, decode=False, upload_id="u1")
+    assert store.stats()["bytes"] == len(data)
+
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+    store.register_path(path, content_hash)
+    store.add_bytes(data, decode=False, upload_id="u1")  # rerun dopo il salvataggio
+
+    assert store._sources[content_hash] == path
+    assert store.stats()["bytes"] == 0
+
+
+def test_image_store_retain_frees_removed_uploads():
+    store = ImageStore(1 << 30)
+    kept = store.add_bytes(jpeg_bytes(make_photo(3)), decode=False, upload_id="u1")
+    removed = store.add_bytes(jpeg_bytes(make_photo(4)), decode=False, upload_id="u2")
+
+    store.retain([kept])
+
+    assert removed not in store._sources
+    assert store._upload_hashes == {"u1": kept}
+    assert store.stats()["bytes"] == len(store._sources[kept])
+
+
+
+def test_image_store_evicts_least_recently_used_renditions():
+    first = jpeg_bytes(make_photo(3, (800, 600)))
+    probe = ImageStore(1 << 30)
+    probe.add_bytes(first)
+    one_photo = probe.stats()["bytes"]
+
+    store = ImageStore(int(one_photo * 1.5))
+    old = store.add_bytes(first)
+    new = store.add_bytes(jpeg_bytes(make_photo(4, (800, 600))))
+
+    assert store.stats()["bytes"] <= int(one_photo * 1.5)
+    assert {key[0] for key in list(store._renditions)[-3:]} == {new}  # l'ultima foto resta intera
+    assert (old, "veo", VEO_ASPECT_RATIO) not in store._renditions  # la più vecchia esce per prima
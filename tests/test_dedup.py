@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import ImageEnhance, ImageFilter
+
+from photo_video.config import DEDUP_MAX_DISTANCE, VEO_SCENE_SECONDS_ESTIMATE
+from photo_video.backends import LatencyTracker
+from photo_video.photos import photo_fingerprints, photo_quality, select_photos
+from photo_video.story import selection_savings, story_requests
+from conftest import make_photo
+
+
+def test_dhash_stable_under_resize_and_recompression():
+    img = make_photo(1, (640, 480))
+    bits, _ = photo_fingerprints([img, img.resize((320, 240)), make_photo(7, (640, 480))])
+
+    near = (bits[0] != bits[1]).sum()
+    far = (bits[0] != bits[2]).sum()
+    assert bits.shape == (3, 64)
+    assert near <= DEDUP_MAX_DISTANCE < far
+
+
+def test_select_photos_keeps_sharpest_of_each_burst():
+    sharp = make_photo(1)
+    blurred = sharp.filter(ImageFilter.GaussianBlur(3))
+    other = make_photo(5)
+    dark = ImageEnhance.Brightness(make_photo(9)).enhance(0.98)
+    images = [blurred, sharp, other, dark]
+
+    selection = select_photos(len(images), lambda i: images[i])
+
+    assert selection["keep"] == [1, 2, 3]
+    assert selection["duplicate_of"] == {0: 1}
+    assert selection["over_limit"] == []
+
+
+def test_select_photos_max_photos_keeps_best_in_original_order():
+    images = [make_photo(i) for i in range(6)]
+    images[2] = images[2].filter(ImageFilter.GaussianBlur(4))  # la peggiore
+
+    selection = select_photos(len(images), lambda i: images[i], max_photos=5)
+
+    assert len(selection["keep"]) == 5 and selection["keep"] == sorted(selection["keep"])
+    assert selection["over_limit"] == [2]
+
+
+def test_photo_quality_prefers_sharp_well_exposed():
+    rng = np.random.default_rng(0)
+    sharp = rng.integers(60, 200, size=(1, 64, 64)).astype(np.uint8)
+    flat = np.full((1, 64, 64), 128, dtype=np.uint8)
+    burnt = np.full((1, 64, 64), 255, dtype=np.uint8)
+
+    quality = photo_quality(np.concatenate([sharp, flat, burnt]))
+    assert quality[0] > quality[1] >= quality[2]
+
+
+def test_selection_savings_counts_avoided_calls(monkeypatch):
+    monkeypatch.setattr("photo_video.story.VEO_LATENCY", LatencyTracker())
+    selection = {"n_photos": 10, "max_photos": 0, "keep": list(range(7))}
+
+    savings = selection_savings(selection)
+
+    assert savings["veo_calls"] == 3
+    assert savings["gemini_images"] == 3
+    assert savings["gemini_calls"] == story_requests(10) - story_requests(7)
+    assert savings["seconds"] == round(3 * VEO_SCENE_SECONDS_ESTIMATE, 1)
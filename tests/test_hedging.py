@@ -0,0 +1,175 @@
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from photo_video.telemetry import _capture_thread_context
+from photo_video.backends import LatencyTracker
+from photo_video.veo import mark_veo_call_started
+from photo_video.pipeline import DeadlinePolicy, _start_hedged_call, hedged_scene
+
+
+def delayed(value, delay):
+    """start_* stub: Future risolto dopo `delay` secondi (chiamata Veo partita subito)."""
+    def start(started=None):
+        if started is not None:
+            started()
+        future = Future()
+
+        def resolve():
+            if future.set_running_or_notify_cancel():  # hedged_scene può cancellare il perdente
+                future.set_result(value)
+
+        if delay == 0:
+            resolve()
+        else:
+            threading.Timer(delay, resolve).start()
+        return future
+    return start
+
+
+def policy(hedge_after=10.0):
+    tracker = LatencyTracker(min_samples=1000)
+    return DeadlinePolicy(default_hedge_after=hedge_after, tracker=tracker)
+
+
+def test_fast_veo_wins_without_fallback():
+    started = []
+
+    def fallback():
+        started.append(1)
+        return delayed(Path("fallback.mp4"), 0)()
+
+    p = policy()
+    clip = hedged_scene(delayed(Path("veo.mp4"), 0.05), fallback, p, time.monotonic() + 5).result(2)
+
+    assert clip == Path("veo.mp4")
+    assert not started
+    assert p.hedges == 0
+
+
+def test_slow_veo_is_hedged_and_committed_at_deadline():
+    p = policy(hedge_after=0.05)
+    t0 = time.monotonic()
+    clip = hedged_scene(
+        delayed(Path("veo.mp4"), 2), delayed(Path("fallback.mp4"), 0.05), p, t0 + 0.3
+    ).result(2)
+
+    assert clip == Path("fallback.mp4")
+    assert time.monotonic() - t0 < 1
+    assert p.hedges == 1 and p.fallback_committed == 1
+
+
+def test_hedged_veo_still_wins_before_the_deadline():
+    p = policy(hedge_after=0.05)
+    clip = hedged_scene(
+        delayed(Path("veo.mp4"), 0.2), delayed(Path("fallback.mp4"), 0.05), p, time.monotonic() + 5
+    ).result(2)
+
+    assert clip == Path("veo.mp4")
+    assert p.hedges == 1 and p.fallback_committed == 0
+
+
+def test_failed_veo_falls_back():
+    def failing(started):
+        future = Future()
+        future.set_exception(RuntimeError("veo down"))
+        return future
+
+    clip = hedged_scene(failing, delayed(Path("fallback.mp4"), 0), policy(), time.monotonic() + 5).result(2)
+    assert clip == Path("fallback.mp4")
+
+
+def test_latency_tracker_needs_min_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.record(1.0)
+    assert tracker.percentile(90) is None
+
+    for seconds in (2.0, 3.0, 10.0):
+        tracker.record(seconds)
+    assert tracker.percentile(50) == 2.5
+    assert tracker.stats()["max"] == 10.0
+
+
+def test_hedge_after_uses_observed_percentile():
+    tracker = LatencyTracker(min_samples=2)
+    p = DeadlinePolicy(percentile=50, default_hedge_after=99, tracker=tracker)
+    assert p.hedge_after() == 99
+
+    tracker.record(4.0)
+    tracker.record(6.0)
+    assert p.hedge_after() == 5.0
+
+
+def test_deadline_already_passed_skips_veo():
+    started = []
+
+    def veo(on_started):
+        started.append(1)
+        return Future()
+
+    p = policy()
+    clip = hedged_scene(veo, delayed(Path("fallback.mp4"), 0), p, time.monotonic() - 1).result(2)
+
+    assert clip == Path("fallback.mp4")
+    assert not started
+    assert p.fallback_committed == 1
+
+
+def test_abandoned_veo_calls_stay_bounded(monkeypatch):
+    monkeypatch.setattr("photo_video.pipeline.MAX_CONCURRENT_SCENES", 2)
+    monkeypatch.setattr("photo_video.pipeline._HEDGED_CALL_SLOTS", {})
+    release, lock = threading.Event(), threading.Lock()
+    state = {"in_flight": 0, "peak": 0, "calls": 0}
+
+    def veo():
+        with lock:
+            state["calls"] += 1
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        release.wait(5)
+        with lock:
+            state["in_flight"] -= 1
+        return Path("veo.mp4")
+
+    futures = [_start_hedged_call(_capture_thread_context(), veo) for _ in range(4)]
+    time.sleep(0.2)
+    assert state["calls"] == 2  # le altre aspettano uno slot
+    assert futures[3].cancel()  # annullata prima di partire: nessuna chiamata
+
+    release.set()
+    for future in futures[:3]:
+        assert future.result(2) == Path("veo.mp4")
+    assert state["calls"] == 3 and state["peak"] == 2
+
+
+def test_hedge_clock_starts_with_the_veo_call_not_the_quota_wait():
+    def veo(started):
+        future = Future()
+
+        def call():
+            started()  # dopo 0.3s di attesa quota/slot
+            threading.Timer(0.05, future.set_result, [Path("veo.mp4")]).start()
+
+        threading.Timer(0.3, call).start()
+        return future
+
+    p = policy(hedge_after=0.1)
+    clip = hedged_scene(veo, delayed(Path("fallback.mp4"), 0), p, time.monotonic() + 5).result(2)
+
+    assert clip == Path("veo.mp4")
+    assert p.hedges == 0
+
+
+def test_hedged_call_reports_when_the_request_starts():
+    started = threading.Event()
+
+    def veo():
+        assert not started.is_set()
+        mark_veo_call_started()
+        return Path("veo.mp4")
+
+    future = _start_hedged_call(_capture_thread_context(), veo, on_started=started.set)
+
+    assert future.result(2) == Path("veo.mp4") and started.is_set()
+    mark_veo_call_started()  # fuori dall'hedging: nessun effetto
@@ -0,0 +1,13 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_pipeline_import_does_not_load_streamlit():
+    # Interprete nuovo: qui conftest e altri test potrebbero averlo già importato
+    probe = "import sys, batch_render, photo_video.jobs, photo_video.media_server; print('streamlit' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,243 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from photo_video.photos import ImageStore, get_image_store
+from photo_video.jobs import JobRunner, JobStore, complete_partial_story, run_job
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def story_for(n):
+    return {
+        "title": "Titolo",
+        "story_summary": "Riassunto",
+        "scenes": [{"photo_index": i, "scene_title": f"Scena {i}"} for i in range(n)],
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.db")
+
+
+@pytest.fixture
+def no_render(monkeypatch, tmp_path):
+    """Fallback e merge stub: clip finti su disco, scene richieste registrate."""
+    requested = []
+
+    def render(photo_path, scene, reason="error"):
+        requested.append(scene)
+        clip = tmp_path / f"clip_{scene['photo_index']}.mp4"
+        clip.write_bytes(b"mp4")
+        return clip
+
+    def merge(clips, story):
+        output = tmp_path / "final.mp4"
+        output.write_bytes(b"".join(c.read_bytes() for c in clips if c))
+        return output
+
+    monkeypatch.setattr("photo_video.pipeline.create_simple_clip_ffmpeg", render)
+    monkeypatch.setattr("photo_video.jobs.merge_videos_ffmpeg", merge)
+    monkeypatch.setattr("photo_video.jobs.STORY_STREAMING", False)
+    monkeypatch.setattr("photo_video.jobs.PROGRESSIVE_OUTPUT", False)
+    return requested
+
+
+def test_job_runs_story_scenes_and_merge(store, photo_paths, monkeypatch, no_render):
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos", lambda paths, style: story_for(len(paths)))
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+
+    final_video = run_job(store, job_id)
+
+    job = store.get_job(job_id)
+    assert job["status"] == "done" and job["output_path"] == str(final_video)
+    assert job["story"]["title"] == "Titolo"
+    assert [s["status"] for s in job["scenes"]] == ["done"] * 4
+
+
+def test_resumed_job_keeps_story_and_done_scenes(store, photo_paths, monkeypatch, no_render, tmp_path):
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+    store.set_story(job_id, story_for(4))
+    done_clip = tmp_path / "done_0.mp4"
+    done_clip.write_bytes(b"old")
+    store.set_scene(job_id, 0, "done", done_clip)
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos", lambda *a: pytest.fail("storia rigenerata"))
+
+    final_video = run_job(store, job_id)
+
+    assert [s["photo_index"] for s in no_render] == [1, 2, 3]  # la scena 0 non si rigenera
+    assert store.get_job(job_id)["scenes"][0]["clip_path"] == str(done_clip)
+    assert final_video.read_bytes().startswith(b"old")
+
+
+def test_failed_story_fails_the_job(store, photo_paths, monkeypatch, no_render):
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos", lambda paths, style: {})
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+
+    assert run_job(store, job_id) is None
+    assert store.get_job(job_id)["status"] == "failed"
+
+
+def test_claim_and_resumable_jobs(store, photo_paths, monkeypatch):
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+    assert store.resumable_jobs() == [job_id]
+    assert store.claim(job_id)
+    assert not store.claim(job_id)  # già in corso con heartbeat recente
+    assert store.resumable_jobs() == []
+
+    monkeypatch.setattr("photo_video.jobs.JOB_STALE_SECONDS", -1)  # heartbeat scaduto: processo morto
+    assert store.resumable_jobs() == [job_id]
+    assert store.claim(job_id)
+
+
+def test_job_runner_runs_in_background(store, photo_paths, monkeypatch, no_render):
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos", lambda paths, style: story_for(len(paths)))
+
+    runner = JobRunner(store, workers=1)
+    job_id = runner.submit(photo_paths, "x", use_veo=False)
+    deadline = time.monotonic() + 10
+    while store.get_job(job_id)["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert store.get_job(job_id)["status"] == "done"
+
+
+def test_job_store_closes_its_connections(tmp_path, photo_paths, monkeypatch):
+    opened, closed = [], []
+    connect = sqlite3.connect
+
+    class Tracked(sqlite3.Connection):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    def tracked_connect(*args, **kwargs):
+        conn = connect(*args, factory=Tracked, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", tracked_connect)
+    store = JobStore(tmp_path / "jobs.db")
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+    store.get_job(job_id)
+
+    assert opened and len(closed) == len(opened)
+
+
+def test_cancelled_job_is_not_overwritten(store, photo_paths):
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+    store.cancel(job_id)
+    store.finish(job_id, Path("/tmp/out.mp4"))
+    assert store.get_job(job_id)["status"] == "cancelled"
+
+
+def test_job_runner_uses_the_session_image_store(store, photo_paths, monkeypatch, no_render):
+    session_store = ImageStore(1 << 26)
+    seen = []
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos",
+                        lambda paths, style: seen.append(get_image_store()) or story_for(len(paths)))
+    monkeypatch.setattr("photo_video.jobs.STORY_STREAMING", False)
+
+    runner = JobRunner(store, workers=1)
+    job_id = runner.submit(photo_paths, "x", use_veo=False, image_store=session_store)
+    deadline = time.monotonic() + 10
+    while store.get_job(job_id)["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert store.get_job(job_id)["status"] == "done"
+    assert seen == [session_store]
+
+
+def test_streaming_job_renders_scenes_and_stores_the_story(store, photo_paths, monkeypatch, no_render, story_cache):
+    text = json.dumps(story_for(4))
+    monkeypatch.setattr("photo_video.jobs.STORY_STREAMING", True)
+    monkeypatch.setattr("photo_video.story.request_story",
+                        lambda paths, style, stream=False: (Chunk(text[i:i + 16]) for i in range(0, len(text), 16)))
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+
+    final_video = run_job(store, job_id)
+
+    job = store.get_job(job_id)
+    assert job["status"] == "done" and final_video.exists()
+    assert job["story"] == story_for(4)
+    assert sorted(s["photo_index"] for s in no_render) == [0, 1, 2, 3]
+
+
+def test_streamed_scenes_are_persisted_as_partial_story(store, photo_paths):
+    job_id = store.create_job(photo_paths, "Cinematic Adventure", use_veo=False)
+    store.add_stream_scene(job_id, 0, {"photo_index": 0}, {"title": "T"})
+    store.add_stream_scene(job_id, 1, {"photo_index": 3}, {"title": "T"})
+    store.set_scene(job_id, 0, "done", Path("/tmp/c0.mp4"))
+
+    job = store.get_job(job_id)
+
+    assert job["story"] == {"title": "T", "partial": True, "scenes": [{"photo_index": 0}, {"photo_index": 3}]}
+    assert [s["status"] for s in job["scenes"]] == ["done", "pending"]
+    assert "scene" not in job["scenes"][0]
+
+
+def test_complete_partial_story_only_asks_for_missing_photos(monkeypatch, photo_paths):
+    asked = []
+
+    def create_story(paths, style):
+        asked.append(paths)
+        return {"title": "Altro", "music": "m", "scenes": [{"photo_index": 1}, {"photo_index": 0}]}
+
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos", create_story)
+    partial = {"title": "T", "partial": True, "scenes": [{"photo_index": 0}, {"photo_index": 2}]}
+
+    story = complete_partial_story(photo_paths, "x", partial)
+
+    assert asked == [[photo_paths[1], photo_paths[3]]]
+    assert story["title"] == "T" and story["music"] == "m" and "partial" not in story
+    assert [s["photo_index"] for s in story["scenes"]] == [0, 2, 3, 1]
+
+
+def test_interrupted_streaming_job_resumes_without_regenerating(store, photo_paths, monkeypatch, no_render, tmp_path):
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+    done_clip = tmp_path / "done_0.mp4"
+    done_clip.write_bytes(b"old")
+    store.add_stream_scene(job_id, 0, {"photo_index": 0, "scene_title": "A"}, {"title": "T"})
+    store.add_stream_scene(job_id, 1, {"photo_index": 1, "scene_title": "B"}, {"title": "T"})
+    store.set_scene(job_id, 0, "done", done_clip)
+
+    monkeypatch.setattr("photo_video.jobs.create_story_from_photos",
+                        lambda paths, style: {"scenes": [{"photo_index": 0}, {"photo_index": 1}]})
+
+    final_video = run_job(store, job_id)
+
+    job = store.get_job(job_id)
+    assert job["status"] == "done" and final_video.exists()
+    assert sorted(s["photo_index"] for s in no_render) == [1, 2, 3]  # la scena 0 non si rigenera
+    assert [s["status"] for s in job["scenes"]] == ["done"] * 4
+    assert job["scenes"][0]["clip_path"] == str(done_clip)
+    assert final_video.read_bytes().startswith(b"old")
+
+
+def test_streaming_job_saves_each_scene_before_it_renders(store, photo_paths, monkeypatch, story_cache):
+    text = json.dumps(story_for(4))
+    monkeypatch.setattr("photo_video.jobs.STORY_STREAMING", True)
+    monkeypatch.setattr("photo_video.story.request_story",
+                        lambda paths, style, stream=False, prompt=None: (Chunk(text[i:i + 16])
+                                                                         for i in range(0, len(text), 16)))
+
+    def crash_after_two(photo_paths, scenes, style, **kw):
+        for k, scene in enumerate(scenes):
+            if k == 2:
+                raise RuntimeError("processo terminato")
+
+    monkeypatch.setattr("photo_video.jobs.generate_scenes", crash_after_two)
+    job_id = store.create_job(photo_paths, "x", use_veo=False)
+
+    assert run_job(store, job_id) is None
+
+    story = store.get_job(job_id)["story"]
+    assert story["partial"] and story["title"] == "Titolo"
+    assert [s["scene_title"] for s in story["scenes"]] == ["Scena 0", "Scena 1", "Scena 2"]
@@ -0,0 +1,62 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from photo_video.render import ken_burns_windows, render_ken_burns_clip
+from conftest import jpeg_bytes, make_photo
+
+SRC = (1600, 1200)
+OUT = (1280, 720)
+
+
+def window_sizes(movement, n=24):
+    windows = ken_burns_windows(movement, n, SRC, OUT)
+    return windows, windows[:, 2] - windows[:, 0], windows[:, 3] - windows[:, 1]
+
+
+@pytest.mark.parametrize("movement", ["dolly forward", "zoom out", "pan left", "tilt up", "orbit", ""])
+def test_windows_stay_inside_the_photo_with_output_aspect(movement):
+    windows, widths, heights = window_sizes(movement)
+
+    assert windows.shape == (24, 4)
+    assert (windows[:, :2] >= 0).all()
+    assert (windows[:, 2] <= SRC[0] + 1e-6).all() and (windows[:, 3] <= SRC[1] + 1e-6).all()
+    np.testing.assert_allclose(widths / heights, OUT[0] / OUT[1])
+
+
+def test_zoom_in_and_out_are_mirrored():
+    _, zoom_in, _ = window_sizes("zoom in")
+    _, zoom_out, _ = window_sizes("zoom out")
+
+    assert zoom_in[0] > zoom_in[-1]
+    np.testing.assert_allclose(zoom_out, zoom_in[::-1])
+
+
+def test_pan_direction():
+    left, _, _ = window_sizes("pan left")
+    right, _, _ = window_sizes("pan right")
+
+    assert left[-1, 0] < left[0, 0]
+    assert right[-1, 0] > right[0, 0]
+
+
+def test_movement_matches_whole_words():
+    _, slow_drift, _ = window_sizes("slow drift throughout")
+    _, default, _ = window_sizes("")
+    panoramic, _, _ = window_sizes("panoramic dolly")
+    dolly, _, _ = window_sizes("dolly")
+
+    np.testing.assert_allclose(slow_drift, default)  # "throughout" non inverte lo zoom
+    np.testing.assert_allclose(panoramic, dolly)     # "panoramic" non è un pan
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg non installato")
+def test_render_ken_burns_clip(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(jpeg_bytes(make_photo(1, (800, 600))))
+    output = tmp_path / "clip.mp4"
+
+    render_ken_burns_clip(photo, output, "pan right", duration=0.5, fps=8, out_size=(320, 180))
+
+    assert output.stat().st_size > 0
@@ -0,0 +1,101 @@
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+from photo_video.media_server import MediaServer, media_server_port, parse_byte_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=0-1,5-9", None),  # multi-range → file intero
+    ("items=0-9", None),
+    ("bytes=abc-", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10"])
+def test_parse_byte_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, 1000)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def media(tmp_path):
+    server = MediaServer({"out": tmp_path}, port=free_port(), bind="127.0.0.1").start()
+    yield server
+    server.shutdown()
+
+
+def test_signed_urls_only(media, tmp_path):
+    video = tmp_path / "run" / "video.mp4"
+    video.parent.mkdir()
+    video.write_bytes(b"0123456789")
+
+    url = media.url_for(video)
+    assert media.resolve(url.split(str(media.port), 1)[1]) == video
+    assert media.url_for(tmp_path.parent / "other.mp4") is None
+
+    tampered = url.replace("video.mp4", "../../etc/passwd")
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(tampered)
+    assert e.value.code == 404
+
+
+def test_range_request(media, tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"0123456789")
+
+    request = urllib.request.Request(media.url_for(video), headers={"Range": "bytes=2-5"})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 206
+        assert response.headers["Content-Range"] == "bytes 2-5/10"
+        assert response.read() == b"2345"
+
+    request = urllib.request.Request(media.url_for(video), headers={"Range": "bytes=20-"})
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(request)
+    assert e.value.code == 416
+
+
+def test_download_url_sets_attachment(media, tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"0123456789")
+
+    with urllib.request.urlopen(media.url_for(video, download=True)) as response:
+        assert response.status == 200
+        assert 'attachment; filename="video.mp4"' == response.headers["Content-Disposition"]
+        assert response.read() == b"0123456789"
+
+
+@pytest.mark.parametrize("port, public_url, expected", [
+    ("", "", None),  # default: spento, st.video dal path
+    ("off", "https://example.com/video", None),
+    ("", "https://example.com/video", 8765),
+    ("0", "", 0),
+    (" 9000 ", "", 9000),
+])
+def test_media_server_is_off_unless_configured(port, public_url, expected):
+    assert media_server_port(port, public_url) == expected
+
+
+def test_ephemeral_port_is_assigned_at_start(tmp_path):
+    server = MediaServer({"out": tmp_path}, port=0, bind="127.0.0.1").start()
+    try:
+        assert server.port > 0 and server.public_url == f"http://localhost:{server.port}"
+    finally:
+        server.shutdown()
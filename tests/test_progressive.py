@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from photo_video.render import CANONICAL_PROFILE, ProgressiveOutput, _stream_signature
+
+
+@pytest.fixture
+def progressive(tmp_path, monkeypatch):
+    """ProgressiveOutput in tmp con probe e remux finti (niente FFmpeg)."""
+    monkeypatch.setattr("photo_video.render.OUTPUT_FOLDER", tmp_path)
+    monkeypatch.setattr("photo_video.render.probe_clip", lambda clip: dict(CANONICAL_PROFILE, duration=1.0))
+    remuxed = []
+
+    def fake_remux(self, clip, info):
+        remuxed.append(clip)
+        self.segments.append((self.folder / f"seg_{len(self.segments):03d}.ts", info["duration"]))
+        self.clips.append(clip)
+
+    monkeypatch.setattr(ProgressiveOutput, "_remux_segment", fake_remux)
+    output = ProgressiveOutput("test")
+    output.remuxed = remuxed
+    return output
+
+
+def make_clip(tmp_path, name):
+    clip = tmp_path / f"{name}.mp4"
+    clip.write_bytes(b"clip")
+    return clip
+
+
+def test_scenes_are_published_in_order(tmp_path, progressive, monkeypatch):
+    monkeypatch.setattr(ProgressiveOutput, "_remux_final", lambda self: None)
+    clips = [make_clip(tmp_path, f"c{i}") for i in range(3)]
+
+    progressive.add(2, clips[2])
+    progressive.add(0, clips[0])
+    progressive.add(1, None)  # scena fallita: saltata
+    progressive.add(3, clips[1])
+    progressive.finalize()
+
+    assert progressive.remuxed == [clips[0], clips[2], clips[1]]
+    assert "#EXTINF" in progressive.playlist.read_text()
+
+
+def test_add_does_not_wait_for_a_running_remux(tmp_path, progressive, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    remux = ProgressiveOutput._remux_segment
+
+    def slow_remux(self, clip, info):
+        started.set()
+        release.wait(5)
+        remux(self, clip, info)
+
+    monkeypatch.setattr(ProgressiveOutput, "_remux_segment", slow_remux)
+    monkeypatch.setattr(ProgressiveOutput, "_remux_final", lambda self: None)
+
+    progressive.add(0, make_clip(tmp_path, "c0"))
+    assert started.wait(5)
+
+    t0 = time.perf_counter()
+    progressive.add(1, None)  # future già completato: callback inline in add()
+    assert time.perf_counter() - t0 < 1.0
+
+    release.set()
+    progressive.finalize()
+    assert len(progressive.clips) == 1
+
+
+def test_prepare_normalizes_clips_the_merge_would_normalize(tmp_path, progressive, monkeypatch):
+    other_timebase = dict(CANONICAL_PROFILE, time_base="1/90000", duration=1.0)
+    probes = iter([other_timebase, dict(CANONICAL_PROFILE, duration=1.0)])
+    monkeypatch.setattr("photo_video.render.probe_clip", lambda clip: next(probes))
+    monkeypatch.setattr("photo_video.render.normalize_clip", lambda clip, profile, threads: tmp_path / "norm.mp4")
+
+    clip, info = progressive._prepare(make_clip(tmp_path, "c0"))
+
+    assert _stream_signature(other_timebase) != _stream_signature(CANONICAL_PROFILE)
+    assert clip == tmp_path / "norm.mp4" and progressive.reencoded == 1
+    assert _stream_signature(info) == _stream_signature(CANONICAL_PROFILE)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from photo_video.config import VEO_INPUT_LONG_SIDE
+from photo_video.photos import _aspect_size, encode_jpeg_within_budget, render_veo_reference
+from conftest import make_photo
+
+
+@pytest.mark.parametrize("size, aspect, expected", [
+    ((4000, 3000), "16:9", (VEO_INPUT_LONG_SIDE, round(VEO_INPUT_LONG_SIDE * 9 / 16))),
+    ((3000, 4000), "9:16", (round(VEO_INPUT_LONG_SIDE * 9 / 16), VEO_INPUT_LONG_SIDE)),
+])
+def test_reference_is_cropped_to_the_veo_aspect(size, aspect, expected):
+    ref = render_veo_reference(make_photo(1, size), aspect, "crop")
+    assert ref.size == expected
+
+
+def test_reference_is_never_upscaled():
+    ref = render_veo_reference(make_photo(1, (320, 240)), "16:9", "crop")
+    assert ref.size == (320, 180)
+
+
+def test_letterbox_keeps_the_whole_photo():
+    ref = render_veo_reference(make_photo(1, (2000, 2000)), "16:9", "letterbox")
+    pixels = np.asarray(ref)
+
+    assert ref.size == _aspect_size("16:9", VEO_INPUT_LONG_SIDE)
+    assert pixels[:, 0].max() == 0  # bande nere ai lati
+
+
+def test_jpeg_fits_the_budget():
+    img = make_photo(2, (1920, 1080))
+    data = encode_jpeg_within_budget(img, 20_000)
+    assert len(data) <= 20_000
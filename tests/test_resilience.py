@@ -0,0 +1,132 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from photo_video.backends import (
+    CircuitBreaker, CircuitOpenError, ServiceGuard, TokenBucket, VeoClipError, VeoOperationError, classify_error,
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_classify_error_uses_codes_not_message_text():
+    assert classify_error(HTTPError(429)) == "quota"
+    assert classify_error(VeoOperationError("RESOURCE_EXHAUSTED", 8)) == "quota"
+    assert classify_error(VeoOperationError("INTERNAL", 13)) == "retryable"
+    # Un "429" nel testo (id, byte, ...) non è una quota
+    assert classify_error(RuntimeError("request 4291 failed")) == "fatal"
+    assert classify_error(ConnectionError("reset")) == "retryable"
+    assert classify_error(VeoClipError("truncated")) == "retryable"
+
+
+def test_breaker_opens_after_threshold_but_not_on_fatal():
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_seconds=60)
+
+    for _ in range(5):
+        breaker.record_failure("fatal")
+    assert breaker.state == "closed"
+
+    breaker.record_failure("quota")
+    assert breaker.state == "closed"
+    breaker.record_failure("retryable")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_single_probe():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=0)
+    breaker.record_failure("retryable")
+
+    assert breaker.allow()  # prova in half_open
+    assert not breaker.allow()  # una sola prova alla volta
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_guard_retries_transient_errors(fast_retries):
+    guard = ServiceGuard("t", requests_per_minute=6000, max_attempts=3)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert guard.call(flaky) == "ok"
+    assert guard.metrics()["retries"] == 2
+    assert guard.breaker.state == "closed"
+
+
+def test_guard_does_not_retry_fatal_errors(fast_retries):
+    guard = ServiceGuard("t", requests_per_minute=6000, max_attempts=3)
+    calls = []
+
+    def invalid():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        guard.call(invalid)
+    assert len(calls) == 1
+    assert guard.breaker.state == "closed"
+
+
+def test_guard_rejects_calls_when_open(fast_retries):
+    guard = ServiceGuard("t", requests_per_minute=6000, max_attempts=1)
+    guard.breaker.failure_threshold = 1
+
+    with pytest.raises(ConnectionError):
+        guard.call(lambda: (_ for _ in ()).throw(ConnectionError("down")))
+    with pytest.raises(CircuitOpenError):
+        guard.call(lambda: "never")
+
+
+def test_guard_limits_calls_in_flight():
+    guard = ServiceGuard("t", requests_per_minute=6000, max_in_flight=2)
+    assert guard.metrics()["max_in_flight"] == 2
+    assert guard._slots._value == 2
+
+
+def test_token_bucket_throttles_after_burst():
+    bucket = TokenBucket(rate_per_minute=600, burst=2)
+    waits = [bucket.acquire() for _ in range(3)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert 0 < waits[2] <= 0.2
+    assert bucket.throttled == 1
+
+
+def test_call_async_waits_and_backs_off_without_the_default_executor(fast_retries):
+    guard = ServiceGuard("t", requests_per_minute=600, max_attempts=3)
+    guard.limiter = TokenBucket(rate_per_minute=600, burst=1)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ConnectionError("reset")
+        return "ok"
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        release = threading.Event()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        busy = loop.run_in_executor(None, release.wait, 5)  # default executor occupato
+        with ThreadPoolExecutor(max_workers=1) as http:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(guard.call_async(flaky, executor=http) for _ in range(2))), 2
+            )
+        release.set()
+        await busy
+        return results
+
+    assert asyncio.run(main()) == ["ok", "ok"]
+    assert guard.metrics()["retries"] == 1
+    assert guard.limiter.throttled >= 1
@@ -0,0 +1,134 @@
+import threading
+import time
+from pathlib import Path
+
+from photo_video.telemetry import PipelineEvents, current_events, events_scope
+from photo_video.storage import save_uploaded_file
+from photo_video.story import resolve_scene_photo, resolve_scene_photo_index
+from photo_video.pipeline import generate_scenes_concurrently
+
+
+def stub_generate(delays, log=None):
+    """generate_fn stub: latenza per photo_index, conta le chiamate in volo."""
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def generate(photo_path, scene, style):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(delays.get(scene["photo_index"], 0.01))
+        with lock:
+            state["in_flight"] -= 1
+        if log is not None:
+            log.append(scene["photo_index"])
+        return Path(f"clip_{scene['photo_index']}.mp4")
+
+    return generate, state
+
+
+def test_results_in_scene_order_and_concurrency_bounded():
+    photos = [Path(f"p{i}.jpg") for i in range(6)]
+    scenes = [{"photo_index": i} for i in range(6)]
+    generate, state = stub_generate({0: 0.2, 1: 0.05})
+    done = []
+
+    clips = generate_scenes_concurrently(
+        photos, scenes, "x", max_concurrency=2, generate_fn=generate,
+        on_scene_done=lambda i, scene, clip: done.append(i),
+    )
+
+    assert clips == [Path(f"clip_{i}.mp4") for i in range(6)]
+    assert state["peak"] <= 2
+    assert sorted(done) == list(range(6))
+    assert done[0] != 0  # callback in ordine di completamento, non di scena
+
+
+def test_failed_scene_is_none():
+    def generate(photo_path, scene, style):
+        if scene["photo_index"] == 1:
+            raise RuntimeError("boom")
+        return Path("ok.mp4")
+
+    clips = generate_scenes_concurrently(
+        [Path("a"), Path("b"), Path("c")], [{"photo_index": i} for i in range(3)], "x", generate_fn=generate
+    )
+    assert clips == [Path("ok.mp4"), None, Path("ok.mp4")]
+
+
+def test_resolve_scene_photo_cycles_out_of_range():
+    photos = [Path("a"), Path("b"), Path("c")]
+    assert resolve_scene_photo(photos, {"photo_index": 2}, 0) == Path("c")
+    assert resolve_scene_photo(photos, {"photo_index": 7}, 4) == Path("b")
+    assert resolve_scene_photo(photos, {}, 5) == Path("c")
+
+
+def test_resolve_scene_photo_index_cycles_out_of_range():
+    assert resolve_scene_photo_index(3, {"photo_index": 2}, 0) == 2
+    assert resolve_scene_photo_index(3, {"photo_index": 7}, 4) == 1
+    assert resolve_scene_photo_index(3, {}, 5) == 2
+
+
+def test_streamed_scenes_start_before_the_iterator_ends():
+    started = {}
+    t0 = time.perf_counter()
+
+    def scenes():
+        for i in range(3):
+            time.sleep(0.1)
+            yield {"photo_index": i}
+
+    def generate(photo_path, scene, style):
+        started[scene["photo_index"]] = time.perf_counter() - t0
+        return Path("c.mp4")
+
+    clips = generate_scenes_concurrently([Path("p")] * 3, scenes(), "x", generate_fn=generate)
+
+    assert len(clips) == 3
+    assert started[0] < 0.25  # la prima scena parte prima che arrivino le altre
+
+
+class Recorder(PipelineEvents):
+    def __init__(self):
+        self.messages = []
+
+    def message(self, level, text):
+        self.messages.append((level, text))
+
+
+def test_worker_events_reach_the_caller_sink():
+    def generate(photo_path, scene, style):
+        current_events().info(f"scena {scene['photo_index']}")
+        return Path("c.mp4")
+
+    with events_scope(Recorder()) as events:
+        generate_scenes_concurrently([Path("p")] * 3, [{"photo_index": i} for i in range(3)], "x",
+                                         generate_fn=generate)
+
+    assert sorted(events.messages) == [("info", f"scena {i}") for i in range(3)]
+
+
+def test_save_uploaded_file_reports_errors_to_the_sink(tmp_path):
+    class Upload:
+        def getbuffer(self):
+            raise OSError("disco pieno")
+
+    with events_scope(Recorder()) as events:
+        assert not save_uploaded_file(Upload(), tmp_path / "photo.jpg")
+
+    assert events.messages == [("error", "❌ Error: disco pieno")]
+
+
+def test_cancel_event_stops_submissions():
+    cancel = threading.Event()
+    generate, _ = stub_generate({i: 0.3 for i in range(10)})
+    threading.Timer(0.1, cancel.set).start()
+
+    t0 = time.perf_counter()
+    clips = generate_scenes_concurrently(
+        [Path("p")] * 10, [{"photo_index": i} for i in range(10)], "x",
+        max_concurrency=2, generate_fn=generate, cancel_event=cancel,
+    )
+
+    assert time.perf_counter() - t0 < 2
+    assert clips.count(None) >= 6  # le scene in coda non partono
@@ -0,0 +1,64 @@
+import os
+import time
+
+from photo_video.telemetry import current_run_id
+from photo_video.storage import STORAGE, StorageManager, run_folder, run_scope
+
+
+def make_entry(folder, name, size, age):
+    """Cartella di run con un file di `size` byte, vecchia di `age` secondi."""
+    run = folder / name
+    run.mkdir(parents=True)
+    path = run / "file.bin"
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    os.utime(run, (mtime, mtime))
+    return run
+
+
+def test_sweep_removes_expired_then_over_quota(tmp_path):
+    folder = tmp_path / "out"
+    expired = make_entry(folder, "expired", 10, age=1000)
+    oldest = make_entry(folder, "oldest", 100, age=30)
+    newest = make_entry(folder, "newest", 100, age=10)
+    storage = StorageManager({"output": (folder, 150, 500)})
+
+    usage = storage.sweep()["output"]
+
+    assert not expired.exists() and not oldest.exists() and newest.exists()
+    assert usage["removed"] == {"ttl": 1, "quota": 1}
+    assert usage["bytes"] == 100
+
+
+def test_sweep_never_touches_pinned_runs(tmp_path):
+    folder = tmp_path / "out"
+    active = make_entry(folder, "active", 100, age=1000)
+    job = make_entry(folder, "job", 100, age=1000)
+    storage = StorageManager({"output": (folder, 0, 1)})
+    storage.pin("active")
+    storage.pin_sources.append(lambda: ["job"])
+
+    storage.sweep()
+
+    assert active.exists() and job.exists()
+
+
+def test_sweep_skips_round_if_pin_source_fails(tmp_path):
+    folder = tmp_path / "out"
+    entry = make_entry(folder, "run", 10, age=1000)
+    storage = StorageManager({"output": (folder, 0, 1)})
+    storage.pin_sources.append(lambda: 1 / 0)
+
+    storage.sweep()
+
+    assert entry.exists()
+
+
+def test_run_scope_isolates_and_pins(tmp_path):
+    with run_scope() as run_id:
+        folder = run_folder(tmp_path)
+        assert folder == tmp_path / run_id
+        assert run_id in STORAGE.pinned()
+    assert run_id not in STORAGE.pinned()
+    assert current_run_id() is None
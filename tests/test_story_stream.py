@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from photo_video.backends import CLIENTS, ServiceGuard
+from photo_video.story import StoryStream, StoryStreamParser, request_story
+
+STORY = {
+    "title": "Viaggio \"estivo\"",
+    "story_summary": "Una {storia} con [parentesi]",
+    "scenes": [
+        {"photo_index": 0, "scene_title": "Partenza", "description": "a, b: c"},
+        {"photo_index": 1, "scene_title": "Arrivo", "nested": {"x": [1, 2]}},
+    ],
+    "final_message": "Fine",
+}
+
+
+def feed_in_chunks(parser, text, size):
+    scenes = []
+    for i in range(0, len(text), size):
+        scenes += parser.feed(text[i:i + size])
+    return scenes
+
+
+@pytest.mark.parametrize("size", [1, 7, 1000])
+def test_scenes_emitted_as_they_close(size):
+    text = "```json\n" + json.dumps(STORY, ensure_ascii=False) + "\n```"
+    parser = StoryStreamParser()
+
+    scenes = feed_in_chunks(parser, text, size)
+
+    assert scenes == STORY["scenes"]
+    assert parser.fields["title"] == STORY["title"]
+    assert parser.fields["story_summary"] == STORY["story_summary"]
+    assert parser.complete
+    assert parser.finish() == STORY
+
+
+def test_first_scene_available_before_stream_ends():
+    text = json.dumps(STORY)
+    cut = text.index('"Arrivo"')
+    parser = StoryStreamParser()
+
+    assert [s["scene_title"] for s in parser.feed(text[:cut])] == ["Partenza"]
+    assert not parser.complete
+
+
+def test_truncated_stream_raises_on_finish():
+    text = json.dumps(STORY)
+    parser = StoryStreamParser()
+    parser.feed(text[: len(text) // 2])
+
+    with pytest.raises(json.JSONDecodeError):
+        parser.finish()
+
+
+def test_no_json_object():
+    parser = StoryStreamParser()
+    assert parser.feed("Mi dispiace, non posso.") == []
+    with pytest.raises(json.JSONDecodeError):
+        parser.finish()
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def stream_of(text, size=16):
+    return lambda paths, style, stream=False: (Chunk(text[i:i + size]) for i in range(0, len(text), size))
+
+
+def test_story_stream_yields_scenes_and_caches_the_story(photo_paths, monkeypatch, story_cache):
+    monkeypatch.setattr("photo_video.story.request_story", stream_of(json.dumps(STORY)))
+    story_stream = StoryStream(photo_paths[:2], "x")
+
+    assert list(story_stream.scenes()) == STORY["scenes"]
+    assert story_stream.story == STORY and not story_stream.degraded
+
+    monkeypatch.setattr("photo_video.story.request_story", lambda *a, **kw: pytest.fail("Gemini richiamato"))
+    cached = StoryStream(photo_paths[:2], "x")
+    assert list(cached.scenes()) == STORY["scenes"]
+
+
+def test_broken_stream_keeps_emitted_scenes_and_falls_back(photo_paths, monkeypatch, story_cache):
+    text = json.dumps(STORY)
+    monkeypatch.setattr("photo_video.story.request_story", stream_of(text[:text.index('"Arrivo"')]))
+    story_stream = StoryStream(photo_paths, "x")
+
+    scenes = list(story_stream.scenes())
+
+    assert story_stream.degraded
+    assert scenes[0] == STORY["scenes"][0]
+    assert sorted(s["photo_index"] for s in scenes) == [0, 1, 2, 3]  # ogni foto ha la sua scena
+    assert story_stream.story["title"] == STORY["title"]
+    assert list(story_cache.folder.glob("*.json")) == []  # i fallback non vanno in cache
+
+
+class FakeModel:
+    def __init__(self, responses):
+        self.responses = iter(responses)
+
+    def generate_content(self, contents, stream=False):
+        return next(self.responses)()
+
+
+def gemini_stream(monkeypatch, *responses):
+    guard = ServiceGuard("gemini-test", requests_per_minute=6000, max_attempts=3)
+    monkeypatch.setattr("photo_video.story.GEMINI_GUARD", guard)
+    model = FakeModel(responses)
+    monkeypatch.setattr(CLIENTS, "gemini_model", lambda name=None: model)
+    return guard
+
+
+def test_gemini_error_mid_stream_counts_for_the_guard(photo_paths, monkeypatch, fast_retries):
+    def broken():
+        yield Chunk('{"title": ')
+        raise ConnectionError("stream reset")
+
+    guard = gemini_stream(monkeypatch, broken)
+    chunks = request_story(photo_paths[:2], "x", stream=True)
+
+    assert next(chunks).text == '{"title": '
+    with pytest.raises(ConnectionError):
+        list(chunks)
+    assert guard.metrics()["errors"]["retryable"] == 1 and guard.metrics()["retries"] == 0
+
+
+def test_gemini_stream_failing_before_any_chunk_is_retried(photo_paths, monkeypatch, fast_retries):
+    def down():
+        raise ConnectionError("reset")
+        yield  # generatore
+
+    guard = gemini_stream(monkeypatch, down, lambda: iter([Chunk("a"), Chunk("b")]))
+
+    assert [c.text for c in request_story(photo_paths[:2], "x", stream=True)] == ["a", "b"]
+    assert guard.metrics()["retries"] == 1
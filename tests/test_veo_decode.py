@@ -0,0 +1,77 @@
+import base64
+import io
+
+import pytest
+
+from photo_video.backends import VeoClipError
+from photo_video.storage import ClipCache
+from photo_video.veo import decode_base64_to_file, probe_mp4_fast, save_veo_video
+from benchmarks.fake_veo_server import canned_mp4
+
+
+@pytest.fixture
+def clip_cache(tmp_path, monkeypatch):
+    cache = ClipCache(tmp_path / "clips", 1 << 20)
+    monkeypatch.setattr("photo_video.veo.CLIP_CACHE", cache)
+    return cache
+
+
+@pytest.mark.parametrize("chunk_chars", [4, 10, 1 << 20])
+def test_decode_base64_in_chunks(chunk_chars):
+    data = bytes(range(256)) * 5
+    out = io.BytesIO()
+
+    written = decode_base64_to_file(base64.b64encode(data).decode(), out, chunk_chars)
+
+    assert written == len(data) and out.getvalue() == data
+
+
+def test_decode_rejects_invalid_base64():
+    with pytest.raises(VeoClipError):
+        decode_base64_to_file("AAAA!!!!", io.BytesIO(), 4)
+
+
+def test_probe_accepts_complete_mp4(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(canned_mp4(duration=5.0))
+
+    info = probe_mp4_fast(path)
+
+    assert info["duration"] == pytest.approx(5.0)
+    assert info["boxes"] == ["ftyp", "moov", "mdat"]
+
+
+@pytest.mark.parametrize("data", [
+    canned_mp4()[:-100],               # troncato a metà mdat
+    canned_mp4(duration=0.2),          # troppo corto
+    canned_mp4()[24:],                 # senza ftyp
+    b"not an mp4 at all",
+])
+def test_probe_rejects_broken_clips(tmp_path, data):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(data)
+    with pytest.raises(VeoClipError):
+        probe_mp4_fast(path)
+
+
+def test_save_veo_video_validates_and_caches(tmp_path, clip_cache):
+    video = canned_mp4()
+    video_b64 = base64.b64encode(video).decode()
+    output = tmp_path / "scene.mp4"
+
+    info = save_veo_video(video_b64, output, "key", response_bytes=1000)
+
+    assert output.read_bytes() == video and info["bytes"] == len(video)
+    assert info["estimated_peak_bytes"] >= 1000 + len(video_b64)
+    assert clip_cache.fetch("key", tmp_path / "cached.mp4")
+
+
+def test_save_veo_video_removes_truncated_clip(tmp_path, clip_cache):
+    video_b64 = base64.b64encode(canned_mp4()[:-100]).decode()
+    output = tmp_path / "scene.mp4"
+
+    with pytest.raises(VeoClipError):
+        save_veo_video(video_b64, output, "key")
+
+    assert not output.exists()
+    assert not clip_cache.fetch("key", tmp_path / "cached.mp4")